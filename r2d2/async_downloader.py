@@ -0,0 +1,128 @@
+# r2d2/async_downloader.py
+from __future__ import annotations
+from typing import Callable, List, Optional, Tuple
+import asyncio
+import random
+
+import ccxt
+import ccxt.async_support as ccxt_async
+import numpy as np
+
+from r2d2.bars import BarSeries, OHLCV_COLUMNS
+from r2d2.utils.logger import get_logger
+from r2d2.utils.rate_limit import AsyncTokenBucket
+
+log = get_logger("downloader")
+
+PAGE_LIMIT = 1000
+
+
+def make_windows(since: int, until: int, tf_ms: int, limit: int = PAGE_LIMIT) -> List[Tuple[int, int]]:
+    """Divide [since, until) em janelas de `limit` candles (uma requisição cada)."""
+    step = int(limit) * int(tf_ms)
+    return [(a, min(a + step, until)) for a in range(int(since), int(until), step)]
+
+
+def merge_parts(parts: List[BarSeries]) -> BarSeries:
+    """Junta as janelas na ordem e remove duplicatas de ts (bordas sobrepostas)."""
+    bars = BarSeries.concat(parts)
+    if not len(bars):
+        return bars
+    ts = bars.ts
+    if np.all(ts[1:] > ts[:-1]):
+        return bars
+    _, idx = np.unique(ts, return_index=True)
+    return BarSeries({c: bars.col(c)[idx] for c in OHLCV_COLUMNS})
+
+
+class AsyncDownloader:
+    """
+    Download concorrente de OHLCV com ccxt.async_support.
+
+    [since, until) vira N janelas independentes de PAGE_LIMIT candles; até
+    `concurrency` janelas ficam em voo ao mesmo tempo, todas passando pelo
+    mesmo token bucket (o rate limit interno do CCXT fica desligado, quem
+    controla é o bucket). Janelas que falham por erro de rede/429 são
+    refeitas com backoff exponencial + jitter.
+
+    Uso:
+        async with AsyncDownloader() as dl:
+            bars = await dl.fetch("BTC/USDT", "1m", since, until)
+    """
+
+    def __init__(self, exchange=None, limiter: Optional[AsyncTokenBucket] = None,
+                 concurrency: int = 8, retries: int = 5, backoff: float = 0.5):
+        self.exchange = exchange
+        self._own_exchange = exchange is None
+        self.limiter = limiter or AsyncTokenBucket()
+        self.concurrency = max(1, int(concurrency))
+        self.retries = int(retries)
+        self.backoff = float(backoff)
+        self._sem = None
+
+    async def __aenter__(self):
+        if self.exchange is None:
+            self.exchange = ccxt_async.bybit({"enableRateLimit": False, "options": {"defaultType": "linear"}})
+        self._sem = asyncio.Semaphore(self.concurrency)
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.close()
+
+    async def close(self):
+        if self._own_exchange and self.exchange is not None:
+            await self.exchange.close()
+            self.exchange = None
+
+    async def _fetch_window(self, symbol: str, timeframe: str, a: int, b: int, limit: int) -> BarSeries:
+        attempt = 0
+        while True:
+            async with self._sem:
+                await self.limiter.acquire()
+                try:
+                    rows = await self.exchange.fetch_ohlcv(symbol, timeframe, since=a, limit=limit)
+                    return BarSeries.from_ohlcv(rows).between(a, b)
+                except ccxt.NetworkError as e:  # inclui RateLimitExceeded / timeout / 5xx
+                    attempt += 1
+                    if attempt > self.retries:
+                        raise
+                    wait = self.backoff * (2 ** (attempt - 1)) * (1 + random.random())
+                    if isinstance(e, ccxt.RateLimitExceeded):
+                        self.limiter.penalize(wait)
+                    log.warning(f"{symbol} janela {a}: {type(e).__name__} — tentativa {attempt}/{self.retries} em {wait:.1f}s")
+            await asyncio.sleep(wait)
+
+    async def fetch(self, symbol: str, timeframe: str, since: int, until: int,
+                    progress: Optional[Callable[[int, int], None]] = None,
+                    limit: int = PAGE_LIMIT) -> BarSeries:
+        """Baixa [since, until) e devolve a série ordenada e sem duplicatas."""
+        tf_ms = self.exchange.parse_timeframe(timeframe) * 1000
+        windows = make_windows(since, until, tf_ms, limit)
+        done = 0
+
+        async def one(a, b):
+            nonlocal done
+            part = await self._fetch_window(symbol, timeframe, a, b, limit)
+            done += 1
+            if progress:
+                progress(done, len(windows))
+            return part
+
+        tasks = [asyncio.ensure_future(one(a, b)) for a, b in windows]
+        try:
+            parts = await asyncio.gather(*tasks)
+        except BaseException:
+            for t in tasks:
+                t.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            raise
+        return merge_parts(list(parts))
+
+
+def download_ohlcv(symbol: str, timeframe: str, since: int, until: int,
+                   concurrency: int = 8, progress: Optional[Callable[[int, int], None]] = None) -> BarSeries:
+    """Atalho síncrono (roda um event loop próprio)."""
+    async def _run():
+        async with AsyncDownloader(concurrency=concurrency) as dl:
+            return await dl.fetch(symbol, timeframe, since, until, progress=progress)
+    return asyncio.run(_run())
@@ -0,0 +1,203 @@
+# r2d2/async_live_trader.py
+import asyncio
+import time
+from typing import Any, Dict, Iterable, Optional
+
+from r2d2.config import CONFIG, AppConfig
+from r2d2.kline_stream import KlineStream
+from r2d2.live_trader import LiveTrader, _TRADE_GRACE_MS
+from r2d2.trade_bars import TradeBarAggregator, TradeRecorder, bybit_trade_stream, is_trade_spec
+from r2d2.utils.logger import get_logger
+
+log = get_logger("live_async")
+
+_STOP = object()
+
+
+# ---------- workers (order_worker: um por trader; control_worker: compartilhado no MultiLiveTrader) ----------
+async def order_worker(q: asyncio.Queue):
+    """Itens (trader, intent): envia numa thread e aplica a confirmação no loop."""
+    while True:
+        item = await q.get()
+        if item is _STOP:
+            break
+        trader, intent = item
+        try:
+            order = await asyncio.to_thread(trader._place, intent)
+            trader._on_order_ack(intent, order)
+            trader.stats["orders"] += 1
+        except Exception as e:
+            trader._on_error(e)
+        finally:
+            trader._pending_orders -= 1
+
+
+async def control_worker(q: asyncio.Queue):
+    """
+    Itens (trader, i, estado): só a sugestão da IA roda numa thread, sobre a
+    cópia do estado tirada no candle (ControlLoop.capture). Os overrides
+    voltam e são aplicados aqui, no loop, entre dois candles: a estratégia
+    nunca vê params mudando no meio de on_bar.
+    """
+    while True:
+        item = await q.get()
+        if item is _STOP:
+            break
+        trader, i, state = item
+        try:
+            suggestion = await asyncio.to_thread(trader.ctrl.suggest, state)
+            upd = trader.ctrl.apply(i, suggestion)
+            if upd.get("applied"):
+                log.info(f"{trader.cfg.symbol}: overrides aplicados: {upd['applied']}")
+        except Exception as e:
+            log.warning(f"control loop de {trader.cfg.symbol} falhou: {e}")
+        finally:
+            trader._ctrl_queued = False
+
+
+class AsyncLiveTrader(LiveTrader):
+    """
+    LiveTrader em asyncio: cada etapa é uma task ligada às outras por filas
+    limitadas, e nada lento fica no caminho candle -> decisão.
+
+      mercado   stream de klines (ou trades agregados) -> fila de barras
+      decisão   stops, estratégia, risco, break-even (rápido, no loop)
+      ordens    place_order numa thread; a confirmação atualiza a posição
+      gravação  JournalWriter (diário local + envio em lotes) ou SupabaseWriter
+      controle  ControlLoop (IA) numa thread
+
+    Regras das filas:
+      - barras: `bar_queue` itens; cheia, o stream espera (não se perde candle);
+      - ordens: enquanto houver ordem sem confirmação a decisão não manda
+        outra (o sinal do candle é calculado, mas não executado);
+      - gravação: a decisão só anexa ao diário local (ou enfileira no
+        SupabaseWriter); um Supabase lento nunca a segura;
+      - controle: no máximo um pedido por trader em andamento, só quando o
+        ControlLoop está no prazo; a thread recebe uma cópia do estado e os
+        overrides são aplicados de volta no loop.
+    """
+
+    def __init__(self, cfg: AppConfig = CONFIG, poll_interval: int | None = None,
+                 record_trades: Optional[str] = None, feed: str = "ws",
+                 bar_queue: int = 100, **kwargs):
+        self.bar_queue = int(bar_queue)
+        self.stats: Dict[str, Any] = {"bars": 0, "orders": 0, "decision_ms_max": 0.0}
+        self._ctrl_q: Optional[asyncio.Queue] = None
+        self._order_q: Optional[asyncio.Queue] = None
+        self._ctrl_queued = False
+        super().__init__(cfg, poll_interval=poll_interval, record_trades=record_trades, feed=feed, **kwargs)
+
+    # ---------- pontos de extensão do LiveTrader ----------
+    def _submit_order(self, intent: Dict[str, Any]):
+        self._pending_orders += 1
+        self._order_q.put_nowait((self, intent))
+
+    def _control(self, i: int):
+        if self._ctrl_queued or not self.ctrl.due(i):
+            return
+        self._ctrl_queued = True
+        self._ctrl_q.put_nowait((self, i, self.ctrl.capture()))
+
+    def bind(self, order_q: asyncio.Queue, ctrl_q: asyncio.Queue):
+        """Liga os pontos de extensão às filas (próprias ou de um MultiLiveTrader)."""
+        self._order_q, self._ctrl_q = order_q, ctrl_q
+
+    def on_bar(self, bar: Dict[str, Any]):
+        """Um candle fechado pela task de decisão (erros viram log, não derrubam o loop)."""
+        t0 = time.perf_counter()
+        try:
+            self._on_bar(bar, self.stats["bars"])
+            self.stats["bars"] += 1
+        except Exception as e:
+            self._on_error(e)
+        self.stats["decision_ms_max"] = max(self.stats["decision_ms_max"], (time.perf_counter() - t0) * 1000)
+
+    # ---------- tasks ----------
+    async def _market(self, source, bars_q: asyncio.Queue):
+        try:
+            async for bar in source:
+                await bars_q.put(bar)
+        finally:
+            await bars_q.put(_STOP)
+
+    async def _decide(self, bars_q: asyncio.Queue):
+        while True:
+            bar = await bars_q.get()
+            if bar is _STOP:
+                break
+            self.on_bar(bar)
+        await self._order_q.put(_STOP)
+
+    async def _trade_bars(self, trade_source: Optional[Iterable] = None):
+        """Barras de trades (1s, tick:N...) como iterador assíncrono, com o relógio fechando barras de tempo."""
+        agg = TradeBarAggregator(self.cfg.timeframe)
+        if trade_source is not None:
+            for batch in trade_source:
+                for bar in agg.update_many(*batch):
+                    yield bar
+                await asyncio.sleep(0)
+            for bar in agg.flush(force=True):
+                yield bar
+            return
+
+        recorder = TradeRecorder(self.record_trades) if self.record_trades else None
+        trades_q: asyncio.Queue = asyncio.Queue(maxsize=10_000)
+
+        async def _pump():
+            async for trades in bybit_trade_stream(self.cfg.symbol, testnet=self.cfg.bybit_testnet):
+                if recorder:
+                    recorder.write(trades)
+                await trades_q.put(trades)
+
+        pump = asyncio.create_task(_pump())
+        try:
+            while True:
+                try:
+                    trades = await asyncio.wait_for(trades_q.get(), 0.25)
+                    closed = agg.update_many([t["ts"] for t in trades], [t["price"] for t in trades],
+                                             [t["size"] for t in trades])
+                except asyncio.TimeoutError:
+                    closed = []
+                closed += agg.flush(now_ms=int(time.time() * 1000) - _TRADE_GRACE_MS)
+                for bar in closed:
+                    yield bar
+        finally:
+            pump.cancel()
+
+    # ---------- execução ----------
+    async def run_async(self, trade_source: Optional[Iterable] = None, kline_stream: Optional[KlineStream] = None):
+        if trade_source is not None or is_trade_spec(self.cfg.timeframe):
+            source = self._trade_bars(trade_source)
+            feed = "trades"
+        else:
+            stream = kline_stream or self._kline_stream()
+            source = stream.bars()
+            feed = type(stream).__name__
+        log.info(
+            f"Iniciando R2D2 Live (async) | symbol={self.cfg.symbol} tf={self.cfg.timeframe} "
+            f"exchange={self.cfg.exchange} testnet={self.cfg.bybit_testnet} feed={feed}"
+        )
+        bars_q: asyncio.Queue = asyncio.Queue(maxsize=self.bar_queue)
+        self.bind(asyncio.Queue(), asyncio.Queue(maxsize=1))
+
+        background = [asyncio.create_task(control_worker(self._ctrl_q), name="control")]
+        pipeline = [asyncio.create_task(self._market(source, bars_q), name="market"),
+                    asyncio.create_task(self._decide(bars_q), name="decision"),
+                    asyncio.create_task(order_worker(self._order_q), name="orders")]
+        try:
+            await asyncio.gather(*pipeline)
+            # fim do stream (replay): esvazia controle e gravação antes de sair
+            await self._ctrl_q.put(_STOP)
+            await asyncio.gather(*background)
+            if self.sb.writer is not None:
+                await asyncio.to_thread(self.sb.writer.flush)
+        finally:
+            for t in pipeline + background:
+                t.cancel()
+            self.bind(None, None)
+
+    def run(self, trade_source: Optional[Iterable] = None, kline_stream: Optional[KlineStream] = None):
+        try:
+            asyncio.run(self.run_async(trade_source, kline_stream))
+        except KeyboardInterrupt:
+            self._shutdown()
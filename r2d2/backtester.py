@@ -1,5 +1,6 @@
 # r2d2/backtester.py
 from typing import List, Dict, Any, Optional
+import os
 from datetime import datetime
 from r2d2.utils.logger import get_logger
 from r2d2.strategy.base_strategy import Signal
@@ -7,11 +8,13 @@ from r2d2.position_manager import PositionManager
 from r2d2.risk_manager import RiskManager
 from r2d2.config import AppConfig
 from r2d2.supabase_store import SupabaseStore
+from r2d2.bar_file import open_bar_file
+from r2d2.bars import BarSeries
 
 log = get_logger("backtest")
 
 class Backtester:
-    def __init__(self, cfg: AppConfig, strategy, exchange):
+    def __init__(self, cfg: AppConfig, strategy, exchange, persist: bool = True):
         self.cfg = cfg
         self.strategy = strategy
         self.exchange = exchange
@@ -19,10 +22,11 @@ class Backtester:
         self.rm = RiskManager(cfg.risk)
         self.equity = cfg.initial_balance
         self.point_value = exchange.point_value(cfg.symbol)
-        self.results = {"trades": 0, "wins": 0, "losses": 0, "pnl": 0.0}
+        self.results = {"trades": 0, "wins": 0, "losses": 0, "pnl": 0.0, "funding": 0.0}
 
-        # integração com supabase
-        self.sb = SupabaseStore()
+        # integração com supabase (persist=False p/ sweeps: não grava cada combinação)
+        self.persist = persist
+        self.sb = SupabaseStore() if persist else None
         self.trades_log: List[Dict[str, Any]] = []
 
         # snapshot da posição aberta (dados fiéis da ENTRADA)
@@ -91,12 +95,16 @@ class Backtester:
         return True
 
     def run(self, bars: List[Dict[str, Any]]) -> Dict[str, Any]:
+        if isinstance(bars, (str, os.PathLike)):
+            bars = open_bar_file(os.fspath(bars))  # arquivo de barras: memmap, sem cópia
         if not bars:
             log.warning("Nenhum dado para backtest.")
             return {}
 
         current_day = None
         ctx = {"position": 0}
+        # funding por barra já alinhado (funding.attach_derivs): leitura direta do array
+        funding = bars.col("funding") if isinstance(bars, BarSeries) and "funding" in bars.columns else None
 
         for i, bar in enumerate(bars):
             ts = bar.get("ts")
@@ -104,6 +112,10 @@ class Backtester:
             bar_day = bar_dt.date() if bar_dt else None
             price = bar["close"]
 
+            # --- 0) FUNDING: liquidação dentro da barra cobra/paga a posição aberta
+            if funding is not None and funding[i] != 0.0 and not self.pm.flat():
+                self._apply_funding(float(funding[i]), bar)
+
             # --- ROLLOVER DIÁRIO (UTC) ---
             if bar_day is not None:
                 if current_day is None:
@@ -134,6 +146,9 @@ class Backtester:
                 self._open_snapshot = None
                 ctx["position"] = 0
                 self.debug["stop_closes"] += 1
+                # a estratégia vê a barra mesmo assim (indicadores e contadores iguais
+                # aos do LiveTrader e do VectorBacktester); só não se opera nela
+                self.strategy.on_bar(bar, ctx)
                 continue
 
             # --- 2) Sinal da estratégia
@@ -243,9 +258,11 @@ class Backtester:
 
         # inclui debug no resultado retornado
         self.results["debug"] = self.debug
+        # manifesto dos candles usados (origem, intervalo, linhas, hash): reprodutibilidade
+        self.results["dataset"] = BarSeries.from_records(bars).manifest()
 
         # grava no supabase
-        if self.sb.enabled:
+        if self.sb is not None and self.sb.enabled:
             backtest_id = self.sb.insert_backtest({
                 "strategy": self.cfg.strategy,
                 "symbol": self.cfg.symbol,
@@ -257,6 +274,7 @@ class Backtester:
                 "wins": self.results["wins"],
                 "losses": self.results["losses"],
                 "params": self.cfg.strat_params.__dict__,
+                "dataset": self.results["dataset"],
             })
             if backtest_id:
                 for t in self.trades_log:
@@ -265,6 +283,20 @@ class Backtester:
 
         return self.results
 
+    def _apply_funding(self, rate: float, bar: Dict[str, Any]):
+        """
+        Funding de perp linear: notional (qty x preço na liquidação) x taxa;
+        taxa positiva = comprado paga, vendido recebe. Entra no equity e no
+        PnL na hora, e no trade (campo funding) quando ele fechar.
+        """
+        sign = 1.0 if self.pm.pos.side == "LONG" else -1.0
+        cost = sign * float(self.pm.pos.qty) * float(bar["open"]) * rate * self.point_value
+        self.equity -= cost
+        self.results["pnl"] -= cost
+        self.results["funding"] -= cost
+        if self._open_snapshot is not None:
+            self._open_snapshot["funding"] = self._open_snapshot.get("funding", 0.0) - cost
+
     def _apply_pnl(self, pnl: float, bar: Dict[str, Any], exit_price: float,
                    pos: Dict[str, Any], close_reason: str):
         """Fecha trade, calcula taxa de forma REALISTA e registra motivo/TP/SL."""
@@ -314,6 +346,7 @@ class Backtester:
             "qty": float(pos["qty"]),
             "pnl": float(net),
             "fee": float(fee),
+            "funding": float(pos.get("funding", 0.0)),
             "equity": float(self.equity),
             "close_reason": close_reason,
             "stop_kind": stop_kind
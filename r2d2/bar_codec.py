@@ -0,0 +1,226 @@
+# r2d2/bar_codec.py
+from __future__ import annotations
+from typing import Dict, Any, List, Optional, Tuple
+import json
+import os
+import struct
+
+import numpy as np
+import pyarrow as pa
+
+from r2d2.bars import BarSeries
+
+MAGIC = b"R2D2BC01"
+VERSION = 1
+BLOCK_ROWS = 65536          # ~45 dias de 1m por bloco: unidade mínima de leitura
+MAX_DECIMALS = 10           # casas decimais testadas para achar o tick de preço/volume
+_LEVEL = 9                  # zstd: arquivo é de arquivo morto, leitura importa mais que escrita
+
+
+def _codec() -> pa.Codec:
+    return pa.Codec("zstd", compression_level=_LEVEL)
+
+
+def _decimals(x: np.ndarray) -> Optional[int]:
+    """
+    Menor nº de casas k tal que x == round(x * 10^k) / 10^k exatamente (o
+    mesmo float que a exchange mandou em texto). None se nenhum k <= 10 serve.
+    """
+    if not len(x) or not np.all(np.isfinite(x)):
+        return None if len(x) else 0
+    for k in range(MAX_DECIMALS + 1):
+        scale = 10.0 ** k
+        q = np.round(x * scale)
+        if np.abs(q).max() >= 2 ** 53:
+            return None
+        if np.array_equal(q / scale, x):
+            return k
+    return None
+
+
+def _pack_int(a: np.ndarray) -> Tuple[str, bytes]:
+    """Inteiros no menor dtype que cabe (int8..int64), comprimidos."""
+    a = np.asarray(a, dtype=np.int64)
+    lo, hi = (int(a.min()), int(a.max())) if len(a) else (0, 0)
+    for dt in (np.int8, np.int16, np.int32, np.int64):
+        info = np.iinfo(dt)
+        if info.min <= lo and hi <= info.max:
+            break
+    raw = np.ascontiguousarray(a.astype(np.dtype(dt).newbyteorder("<")))
+    return raw.dtype.str, _codec().compress(raw).to_pybytes()
+
+
+def _unpack_int(dtype: str, blob: bytes, n: int) -> np.ndarray:
+    dt = np.dtype(dtype)
+    buf = _codec().decompress(blob, decompressed_size=n * dt.itemsize)
+    return np.frombuffer(buf, dtype=dt, count=n).astype(np.int64)
+
+
+def _pack_float(a: np.ndarray) -> bytes:
+    """float64 cru com byte-shuffle (expoentes juntos comprimem bem melhor)."""
+    raw = np.ascontiguousarray(a, dtype="<f8").view(np.uint8).reshape(-1, 8).T.copy()
+    return _codec().compress(raw).to_pybytes()
+
+
+def _unpack_float(blob: bytes, n: int) -> np.ndarray:
+    buf = _codec().decompress(blob, decompressed_size=n * 8)
+    return np.frombuffer(buf, dtype=np.uint8).reshape(8, n).T.copy().view("<f8").reshape(n)
+
+
+def _encode_block(b: BarSeries) -> Tuple[Dict[str, Any], List[bytes]]:
+    n = len(b)
+    ts = b.ts.astype(np.int64)
+    o, h, l, c, v = (np.asarray(b.col(k), dtype=np.float64) for k in ("open", "high", "low", "close", "volume"))
+    head: Dict[str, Any] = {"n": n, "ts0": int(ts[0]), "ts1": int(ts[-1]), "streams": []}
+    blobs: List[bytes] = []
+
+    def add(name, kind, data, **extra):
+        head["streams"].append({"name": name, "kind": kind, "len": len(data), **extra})
+        blobs.append(data)
+
+    # ts: delta-of-delta (1m sem buracos => tudo zero)
+    d = np.diff(ts)
+    head["d0"] = int(d[0]) if n > 1 else 0
+    dt_, blob = _pack_int(np.diff(d) if n > 2 else np.empty(0, np.int64))
+    add("ts", "dod", blob, dtype=dt_)
+
+    # preços em ticks (inteiros), relativos ao close anterior
+    k = _decimals(np.concatenate([o, h, l, c]))
+    if k is not None:
+        scale = 10 ** k
+        O, H, L, C = (np.round(x * scale).astype(np.int64) for x in (o, h, l, c))
+        prev_c = np.r_[O[0], C[:-1]]
+        hi_oc, lo_oc = np.maximum(O, C), np.minimum(O, C)
+        head["price_decimals"] = k
+        head["c_base"] = int(O[0])
+        for name, arr in (("open", O - prev_c), ("close", C - O), ("high", H - hi_oc), ("low", lo_oc - L)):
+            dt_, blob = _pack_int(arr)
+            add(name, "tick", blob, dtype=dt_)
+    else:
+        for name, arr in (("open", o), ("high", h), ("low", l), ("close", c)):
+            add(name, "raw", _pack_float(arr))
+
+    # volume: inteiro em lotes quando a precisão permite, senão float com shuffle
+    kv = _decimals(v)
+    if kv is not None:
+        dt_, blob = _pack_int(np.round(v * 10 ** kv).astype(np.int64))
+        add("volume", "lots", blob, dtype=dt_, decimals=kv)
+    else:
+        add("volume", "raw", _pack_float(v))
+    return head, blobs
+
+
+def _decode_block(head: Dict[str, Any], data: memoryview) -> Dict[str, np.ndarray]:
+    n = head["n"]
+    streams, pos = {}, 0
+    for s in head["streams"]:
+        streams[s["name"]] = (s, bytes(data[pos:pos + s["len"]]))
+        pos += s["len"]
+
+    s, blob = streams["ts"]
+    ts = np.empty(n, dtype=np.int64)
+    ts[0] = head["ts0"]
+    if n > 1:
+        d = np.empty(n - 1, dtype=np.int64)
+        d[0] = head["d0"]
+        if n > 2:
+            d[1:] = head["d0"] + np.cumsum(_unpack_int(s["dtype"], blob, n - 2))
+        ts[1:] = head["ts0"] + np.cumsum(d)
+    out = {"ts": ts}
+
+    if streams["open"][0]["kind"] == "tick":
+        dO, dC, dH, dL = (_unpack_int(streams[k][0]["dtype"], streams[k][1], n) for k in ("open", "close", "high", "low"))
+        # close_i = close_{i-1} + (open_i - close_{i-1}) + (close_i - open_i): uma cumsum
+        C = head["c_base"] + np.cumsum(dO + dC)
+        O = C - dC
+        scale = float(10 ** head["price_decimals"])
+        out["open"] = O / scale
+        out["high"] = (np.maximum(O, C) + dH) / scale
+        out["low"] = (np.minimum(O, C) - dL) / scale
+        out["close"] = C / scale
+    else:
+        for k in ("open", "high", "low", "close"):
+            out[k] = _unpack_float(streams[k][1], n)
+
+    s, blob = streams["volume"]
+    out["volume"] = (_unpack_int(s["dtype"], blob, n) / float(10 ** s["decimals"])) if s["kind"] == "lots" \
+        else _unpack_float(blob, n)
+    return out
+
+
+def encode_bars(path: str, bars, meta: Optional[Dict[str, Any]] = None, block_rows: int = BLOCK_ROWS) -> Dict[str, Any]:
+    """
+    Grava candles no formato de arquivo morto:
+
+        [MAGIC 8B][u64 tamanho do header JSON][header][bloco 0][bloco 1]...
+
+    Cada bloco (até `block_rows` candles) tem:
+      - ts em delta-of-delta (candles regulares viram uma fila de zeros);
+      - preços inteiros em ticks: open relativo ao close anterior, close
+        relativo ao open, high/low como distância acima/abaixo do corpo;
+      - volume inteiro em lotes (ou float com byte-shuffle se não couber);
+      - cada fluxo no menor int que cabe, comprimido com zstd.
+    O tick é a menor potência de 10 que reproduz os floats bit a bit (sem
+    perda); se não existir, o bloco guarda o float cru. O header indexa os
+    blocos por ts para decodificar só o trecho pedido. Troca atômica.
+    """
+    bars = BarSeries.from_records(bars)
+    blocks, payload, offset = [], [], 0
+    for i0 in range(0, len(bars), int(block_rows)):
+        head, blobs = _encode_block(bars[i0:i0 + int(block_rows)])
+        size = sum(len(x) for x in blobs)
+        head.update(row0=i0, offset=offset, size=size)
+        blocks.append(head)
+        payload.extend(blobs)
+        offset += size
+    meta = dict(meta or bars.meta)
+    for k in ("bar_file", "manifest"):
+        meta.pop(k, None)
+    header = {"version": VERSION, "n_rows": len(bars), "blocks": blocks, "meta": meta}
+    blob = json.dumps(header, default=str).encode("utf-8")
+
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "wb") as f:
+        f.write(MAGIC + struct.pack("<Q", len(blob)) + blob)
+        for x in payload:
+            f.write(x)
+    os.replace(tmp, path)
+    return {"rows": len(bars), "blocks": len(blocks), "bytes": os.path.getsize(path)}
+
+
+def read_codec_header(path: str) -> Tuple[Dict[str, Any], int]:
+    with open(path, "rb") as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            raise ValueError(f"{path}: não é um arquivo de barras comprimido (magic inválido)")
+        (hlen,) = struct.unpack("<Q", f.read(8))
+        header = json.loads(f.read(hlen).decode("utf-8"))
+    return header, len(MAGIC) + 8 + hlen
+
+
+def decode_bars(path: str, start_ms: Optional[int] = None, end_ms: Optional[int] = None) -> BarSeries:
+    """
+    Candles [start_ms, end_ms) do arquivo: só os blocos que cruzam o
+    intervalo são lidos do disco e decodificados (cumsum vetorizado).
+    """
+    header, data_start = read_codec_header(path)
+    blocks = header["blocks"]
+    sel = [b for b in blocks
+           if (start_ms is None or b["ts1"] >= start_ms) and (end_ms is None or b["ts0"] < end_ms)]
+    meta = dict(header.get("meta") or {})
+    meta["source_file"] = os.path.abspath(path)
+    if not sel:
+        out = BarSeries.empty()
+        out.meta.update(meta)
+        return out
+    parts = []
+    with open(path, "rb") as f:
+        # blocos vizinhos: uma leitura contígua só
+        f.seek(data_start + sel[0]["offset"])
+        raw = memoryview(f.read(sel[-1]["offset"] + sel[-1]["size"] - sel[0]["offset"]))
+    base = sel[0]["offset"]
+    for b in sel:
+        parts.append(BarSeries(_decode_block(b, raw[b["offset"] - base:b["offset"] - base + b["size"]])))
+    bars = BarSeries.concat(parts) if len(parts) > 1 else parts[0]
+    bars = BarSeries(bars.columns, meta=meta)
+    return bars.between(start_ms, end_ms) if (start_ms is not None or end_ms is not None) else bars
@@ -0,0 +1,236 @@
+# r2d2/bar_file.py
+from __future__ import annotations
+from typing import Dict, Any, NamedTuple, Optional, Sequence, Tuple
+import json
+import mmap
+import os
+import re
+import struct
+import weakref
+
+import numpy as np
+
+from r2d2.bars import BarSeries
+from r2d2.utils.logger import get_logger
+
+log = get_logger("bar_file")
+
+MAGIC = b"R2D2BAR1"
+VERSION = 1
+_ALIGN = 64          # alinhamento de cada coluna (linha de cache)
+_HEADER_ALIGN = 4096  # colunas começam numa página
+
+
+class MappedColumn(NamedTuple):
+    """
+    Referência (arquivo, offset, dtype, n) para reabrir uma coluna mapeada em
+    outro processo, com a identidade (dev, inode, mtime_ns, tamanho) do
+    arquivo que estava mapeado: se o caminho passou a apontar para outro
+    arquivo (regerado no lugar), a referência não vale mais.
+    """
+    path: str
+    offset: int
+    dtype: str
+    n: int
+    ident: Tuple[int, int, int, int]
+
+
+class StaleBarFile(ValueError):
+    """A referência aponta para um arquivo de barras que sumiu ou foi regerado."""
+
+
+# identidade do arquivo de cada mmap aberto por open_bar_file (chave: id do mmap)
+_IDENTS: Dict[int, Tuple[int, int, int, int]] = {}
+
+
+def _ident(st: os.stat_result) -> Tuple[int, int, int, int]:
+    return (int(st.st_dev), int(st.st_ino), int(st.st_mtime_ns), int(st.st_size))
+
+
+def _register(arr: np.memmap, ident: Tuple[int, int, int, int]) -> np.memmap:
+    key = id(arr._mmap)
+    _IDENTS[key] = ident
+    weakref.finalize(arr._mmap, _IDENTS.pop, key, None)
+    return arr
+
+
+def _round_up(x: int, a: int) -> int:
+    return (x + a - 1) // a * a
+
+
+def write_bar_file(path: str, bars, meta: Optional[Dict[str, Any]] = None) -> str:
+    """
+    Grava a série num arquivo binário de layout fixo:
+
+        [MAGIC 8B][u64 tamanho do header JSON][header JSON ... padding até 4096]
+        [coluna 0 contígua][padding 64B][coluna 1]...
+
+    O header descreve n_rows e (name, dtype little-endian, offset) de cada
+    coluna. A troca do arquivo é atômica (tmp + os.replace), então leitores
+    com o arquivo antigo mapeado não são afetados.
+    """
+    bars = BarSeries.from_records(bars)
+    n = len(bars)
+    cols = []
+    for name, arr in bars.columns.items():
+        dt = np.dtype(arr.dtype).newbyteorder("<")
+        cols.append((name, np.ascontiguousarray(arr, dtype=dt)))
+
+    # o header depende dos offsets, que dependem do tamanho do header: estima por cima
+    header: Dict[str, Any] = {"version": VERSION, "n_rows": n, "columns": [], "meta": dict(meta or bars.meta)}
+    header["meta"].pop("bar_file", None)
+    probe = json.dumps({**header, "columns": [{"name": c, "dtype": a.dtype.str, "offset": 2 ** 62}
+                                              for c, a in cols]}, default=str).encode("utf-8")
+    data_start = _round_up(len(MAGIC) + 8 + len(probe), _HEADER_ALIGN)
+    off = data_start
+    for name, arr in cols:
+        header["columns"].append({"name": name, "dtype": arr.dtype.str, "offset": off})
+        off = _round_up(off + arr.nbytes, _ALIGN)
+    blob = json.dumps(header, default=str).encode("utf-8")
+
+    d = os.path.dirname(path) or "."
+    os.makedirs(d, exist_ok=True)
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "wb") as f:
+        f.write(MAGIC)
+        f.write(struct.pack("<Q", len(blob)))
+        f.write(blob)
+        for spec, (_, arr) in zip(header["columns"], cols):
+            f.seek(spec["offset"])
+            f.write(arr.tobytes())
+        f.truncate(max(off, data_start))
+    os.replace(tmp, path)
+    return path
+
+
+def read_header(path: str, f=None) -> Dict[str, Any]:
+    if f is None:
+        with open(path, "rb") as f:
+            return read_header(path, f)
+    f.seek(0)
+    if f.read(len(MAGIC)) != MAGIC:
+        raise ValueError(f"{path} não é um arquivo de barras R2D2")
+    (size,) = struct.unpack("<Q", f.read(8))
+    header = json.loads(f.read(size).decode("utf-8"))
+    if header.get("version") != VERSION:
+        raise ValueError(f"versão de arquivo de barras não suportada: {header.get('version')}")
+    return header
+
+
+def open_bar_file(path: str, columns: Optional[Sequence[str]] = None) -> BarSeries:
+    """
+    Abre o arquivo como BarSeries cujas colunas são np.memmap somente-leitura:
+    nada é decodificado nem copiado; processos diferentes compartilham as
+    mesmas páginas do page cache.
+    """
+    cols = {}
+    # header, identidade e mapas saem do mesmo descritor: uma troca do
+    # arquivo no meio da abertura não mistura versões
+    with open(path, "rb") as f:
+        header = read_header(path, f)
+        ident = _ident(os.fstat(f.fileno()))
+        n = int(header["n_rows"])
+        for spec in header["columns"]:
+            if columns is not None and spec["name"] not in columns and spec["name"] != "ts":
+                continue
+            if n == 0:
+                cols[spec["name"]] = np.empty(0, dtype=spec["dtype"])
+                continue
+            arr = np.memmap(f, dtype=spec["dtype"], mode="r", offset=spec["offset"], shape=(n,))
+            cols[spec["name"]] = _register(arr, ident)
+    meta = dict(header.get("meta") or {})
+    meta["bar_file"] = os.path.abspath(path)
+    return BarSeries(cols, meta=meta)
+
+
+def as_bars(obj) -> BarSeries:
+    """Aceita caminho de arquivo de barras, BarSeries ou lista de dicts."""
+    if isinstance(obj, (str, os.PathLike)):
+        return open_bar_file(os.fspath(obj))
+    return BarSeries.from_records(obj)
+
+
+# ---------- pickling sem cópia (ProcessPool) ----------
+def column_ref(arr: np.ndarray) -> Optional[MappedColumn]:
+    """
+    Se arr é uma view contígua de um np.memmap aberto por open_bar_file e o
+    caminho ainda aponta para o mesmo arquivo, devolve a referência (arquivo,
+    offset em bytes, dtype, n, identidade) para o outro processo remapear o
+    mesmo trecho em vez de receber uma cópia serializada. Arquivo trocado
+    desde a abertura: None (a coluna vai por valor).
+    """
+    mm = getattr(arr, "_mmap", None)
+    if not isinstance(arr, np.memmap) or mm is None or not arr.filename or not arr.flags.c_contiguous:
+        return None
+    ident = _IDENTS.get(id(mm))
+    try:
+        if ident is None or _ident(os.stat(arr.filename)) != ident:
+            return None
+    except OSError:
+        return None
+    base = np.frombuffer(mm, dtype=np.uint8)
+    map_start = arr.offset - arr.offset % mmap.ALLOCATIONGRANULARITY
+    file_offset = map_start + (arr.ctypes.data - base.ctypes.data)
+    return MappedColumn(arr.filename, int(file_offset), arr.dtype.str, int(arr.shape[0]), ident)
+
+
+def resolve_column(obj) -> np.ndarray:
+    if isinstance(obj, MappedColumn):
+        if obj.n == 0:
+            return np.empty(0, dtype=obj.dtype)
+        try:
+            f = open(obj.path, "rb")
+        except FileNotFoundError:
+            raise StaleBarFile(f"{obj.path} não existe mais: referência a colunas obsoleta") from None
+        with f:
+            if _ident(os.fstat(f.fileno())) != tuple(obj.ident):
+                raise StaleBarFile(f"{obj.path} foi regerado depois de serializado: referência a colunas obsoleta")
+            arr = np.memmap(f, dtype=obj.dtype, mode="r", offset=obj.offset, shape=(obj.n,))
+        return _register(arr, tuple(obj.ident))
+    return obj
+
+
+_VERSIONED = re.compile(r"^(.*)-(\d+)\.bars$")
+
+
+def current_version(path: str) -> Optional[str]:
+    """
+    Versão mais nova de um arquivo versionado <nome>-<n>.bars (como os
+    series-<mtime_ns>.bars do OHLCVStore) no mesmo diretório; None se o nome
+    não é versionado ou não sobrou nenhuma versão.
+    """
+    d, name = os.path.split(path)
+    m = _VERSIONED.match(name)
+    if not m:
+        return None
+    versions = []
+    for other in os.listdir(d or "."):
+        o = _VERSIONED.match(other)
+        if o and o.group(1) == m.group(1):
+            versions.append((int(o.group(2)), other))
+    return os.path.join(d, max(versions)[1]) if versions else None
+
+
+def resolve_columns(columns: Dict[str, Any], meta: Dict[str, Any],
+                    span: Optional[Tuple[int, int]]) -> Tuple[Dict[str, np.ndarray], Dict[str, Any]]:
+    """
+    Reabre as colunas de um BarSeries serializado. Se a versão referenciada
+    já foi podada (ou regerada), cai para a versão atual do mesmo arquivo,
+    recortada no mesmo intervalo de ts (`span`): o cache do Streamlit, que
+    guarda referências sem ttl, volta com os dados atuais em vez de quebrar.
+    Sem versão atual, ou com colunas por valor de outro tamanho: StaleBarFile.
+    """
+    try:
+        return {k: resolve_column(v) for k, v in columns.items()}, meta
+    except StaleBarFile as e:
+        ref = next(v for v in columns.values() if isinstance(v, MappedColumn))
+        cur = current_version(ref.path)
+        if cur is None or span is None:
+            raise
+        names = [k for k, v in columns.items() if isinstance(v, MappedColumn)]
+        fresh = open_bar_file(cur, columns=names).between(span[0], span[1] + 1)
+        cols = {k: (fresh.columns[k] if isinstance(v, MappedColumn) else v) for k, v in columns.items()}
+        if any(len(v) != len(fresh) for v in cols.values()):
+            raise StaleBarFile(f"{e}; a versão atual ({cur}) não tem as mesmas linhas") from None
+        log.warning(f"{e}; usando a versão atual {cur}")
+        return cols, {**meta, "bar_file": os.path.abspath(cur)}
@@ -0,0 +1,167 @@
+# r2d2/bars.py
+from __future__ import annotations
+from typing import Dict, Any, List, Iterable, Iterator, Optional, Sequence
+import hashlib
+
+import numpy as np
+
+OHLCV_COLUMNS = ("ts", "open", "high", "low", "close", "volume")
+
+
+class BarSeries(Sequence):
+    """
+    Série de candles em formato colunar (um array NumPy por coluna).
+
+    Se comporta como a lista de dicts usada no resto do projeto
+    (len, índice, iteração, bars[-1]["close"]...), então Backtester/estratégias
+    funcionam sem mudança; mas fatias e colunas extras (indicadores) são views,
+    sem criar objetos Python por linha.
+    """
+
+    def __init__(self, columns: Dict[str, np.ndarray], meta: Optional[Dict[str, Any]] = None):
+        if "ts" not in columns:
+            raise ValueError("BarSeries precisa da coluna 'ts'")
+        n = len(columns["ts"])
+        for k, v in columns.items():
+            if len(v) != n:
+                raise ValueError(f"coluna '{k}' com tamanho {len(v)} != {n}")
+        self.columns: Dict[str, np.ndarray] = dict(columns)
+        self.meta: Dict[str, Any] = dict(meta or {})
+
+    # ---------- construtores ----------
+    @classmethod
+    def empty(cls) -> "BarSeries":
+        cols = {c: np.empty(0, dtype=np.int64 if c == "ts" else np.float64) for c in OHLCV_COLUMNS}
+        return cls(cols)
+
+    @classmethod
+    def from_records(cls, records: Iterable[Dict[str, Any]]) -> "BarSeries":
+        """Converte lista de dicts {"ts","open",...} (formato do load_historical)."""
+        if isinstance(records, BarSeries):
+            return records
+        records = list(records)
+        if not records:
+            return cls.empty()
+        cols = {}
+        for c in OHLCV_COLUMNS:
+            dtype = np.int64 if c == "ts" else np.float64
+            cols[c] = np.fromiter((r.get(c, 0) or 0 for r in records), dtype=dtype, count=len(records))
+        return cls(cols)
+
+    @classmethod
+    def from_ohlcv(cls, rows: Sequence[Sequence[float]]) -> "BarSeries":
+        """Converte a saída crua do CCXT ([[ts, o, h, l, c, v], ...])."""
+        if not len(rows):
+            return cls.empty()
+        arr = np.asarray(rows, dtype=np.float64)
+        cols = {"ts": arr[:, 0].astype(np.int64)}
+        for j, c in enumerate(OHLCV_COLUMNS[1:], start=1):
+            cols[c] = np.ascontiguousarray(arr[:, j])
+        return cls(cols)
+
+    @classmethod
+    def concat(cls, parts: Iterable["BarSeries"]) -> "BarSeries":
+        parts = [p for p in parts if len(p)]
+        if not parts:
+            return cls.empty()
+        names = [c for c in parts[0].columns if all(c in p.columns for p in parts)]
+        return cls({c: np.concatenate([p.columns[c] for p in parts]) for c in names}, meta=parts[0].meta)
+
+    # ---------- protocolo de sequência ----------
+    def __len__(self) -> int:
+        return len(self.columns["ts"])
+
+    def __getitem__(self, idx):
+        if isinstance(idx, slice):
+            return BarSeries({k: v[idx] for k, v in self.columns.items()}, meta=self.meta)
+        return {k: v[idx].item() for k, v in self.columns.items()}
+
+    def __iter__(self) -> Iterator[Dict[str, Any]]:
+        names = list(self.columns)
+        lists = [self.columns[k].tolist() for k in names]
+        for row in zip(*lists):
+            yield dict(zip(names, row))
+
+    def __getstate__(self):
+        # colunas mapeadas de arquivo (bar_file) viajam como referência, não como cópia
+        # (+ o intervalo de ts, para reabrir da versão atual se aquela sumir)
+        from r2d2.bar_file import MappedColumn, column_ref
+        cols = {k: (column_ref(v) or v) for k, v in self.columns.items()}
+        state = {"columns": cols, "meta": self.meta}
+        if len(self) and any(isinstance(v, MappedColumn) for v in cols.values()):
+            state["span"] = (int(self.ts[0]), int(self.ts[-1]))
+        return state
+
+    def __setstate__(self, state):
+        from r2d2.bar_file import resolve_columns
+        self.columns, self.meta = resolve_columns(state["columns"], state["meta"], state.get("span"))
+
+    def __repr__(self) -> str:
+        return f"BarSeries(n={len(self)}, columns={list(self.columns)})"
+
+    # ---------- helpers ----------
+    @property
+    def ts(self) -> np.ndarray:
+        return self.columns["ts"]
+
+    def col(self, name: str) -> np.ndarray:
+        return self.columns[name]
+
+    def with_columns(self, **extra: np.ndarray) -> "BarSeries":
+        """Nova série com colunas adicionais (arrays são compartilhados, não copiados)."""
+        cols = dict(self.columns)
+        cols.update(extra)
+        return BarSeries(cols, meta=self.meta)
+
+    def between(self, start_ms: Optional[int] = None, end_ms: Optional[int] = None) -> "BarSeries":
+        """Recorte [start_ms, end_ms) por timestamp, via busca binária (view)."""
+        ts = self.ts
+        i0 = 0 if start_ms is None else int(np.searchsorted(ts, start_ms, side="left"))
+        i1 = len(ts) if end_ms is None else int(np.searchsorted(ts, end_ms, side="left"))
+        return self[i0:i1]
+
+    def to_records(self) -> List[Dict[str, Any]]:
+        return list(self)
+
+    # ---------- manifesto do dataset ----------
+    def content_hash(self, columns: Sequence[str] = OHLCV_COLUMNS) -> str:
+        """
+        blake2b (128 bits) direto sobre os buffers das colunas — sem converter
+        linha a linha; ~1 GB/s, então milhões de candles custam milissegundos.
+        Nome, dtype e tamanho de cada coluna entram no hash.
+        """
+        h = hashlib.blake2b(digest_size=16)
+        for c in columns:
+            if c not in self.columns:
+                continue
+            a = np.ascontiguousarray(self.columns[c])
+            h.update(f"{c}:{a.dtype.str}:{len(a)};".encode("ascii"))
+            h.update(a)
+        return h.hexdigest()
+
+    def manifest(self) -> Dict[str, Any]:
+        """
+        Identidade do dataset: origem, símbolo, timeframe, intervalo, nº de
+        linhas, lacunas conhecidas e hash do conteúdo. Calculado uma vez e
+        guardado em meta["manifest"]; recortes (que herdam o meta) são
+        detectados por linhas/intervalo e recalculam o próprio.
+        """
+        n = len(self)
+        start = int(self.ts[0]) if n else None
+        end = int(self.ts[-1]) if n else None
+        m = self.meta.get("manifest")
+        if m and m.get("rows") == n and m.get("start") == start and m.get("end") == end:
+            return m
+        meta = self.meta
+        m = {
+            "source": meta.get("source") or meta.get("exchange") or meta.get("source_file") or "memória",
+            "symbol": meta.get("symbol"),
+            "timeframe": meta.get("timeframe"),
+            "start": start,
+            "end": end,
+            "rows": n,
+            "gaps": len(meta.get("gaps") or []),
+            "hash": self.content_hash(),
+        }
+        self.meta["manifest"] = m
+        return m
@@ -1,46 +1,51 @@
 import os
 import time
-import requests
-from datetime import datetime
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional
 from dotenv import load_dotenv
 from supabase import create_client
 
+from r2d2.supabase_store import OHLCV_TABLE as TABLE, OHLCV_EXCHANGE as EXCHANGE
+from r2d2.supabase_store import ohlcv_ts_to_iso as _to_iso, ohlcv_iso_to_ts as _from_iso
+from r2d2.bybit_rest import BybitRest, get_rest
+from r2d2.utils.rate_limit import TokenBucket
+
 # -------------------------------
 # 1. Conexão Supabase
 # -------------------------------
 load_dotenv()
 SUPABASE_URL = os.getenv("SUPABASE_URL")
 SUPABASE_KEY = os.getenv("SUPABASE_SERVICE_KEY")
-supabase = create_client(SUPABASE_URL, SUPABASE_KEY)
+
+PAGE_LIMIT = 1000          # máximo do /v5/market/kline
+MINUTE_MS = 60 * 1000
+
+
+def get_client():
+    """Cliente Supabase (um por thread de escrita)."""
+    return create_client(SUPABASE_URL, SUPABASE_KEY)
+
 
 # -------------------------------
 # 2. Funções auxiliares
 # -------------------------------
-def get_launch_time(symbol: str, category="linear"):
-    url = "https://api.bybit.com/v5/market/instruments-info"
-    params = {"category": category, "symbol": symbol}
-    r = requests.get(url, params=params).json()
-    info = r["result"]["list"][0]
+def get_launch_time(symbol: str, category="linear", rest: Optional[BybitRest] = None):
+    info = (rest or get_rest()).instruments(category, symbol=symbol)[0]
     return int(info["launchTime"])  # em ms
 
-def fetch_ohlcv_batch(symbol: str, start: int, end: int, category="linear"):
-    url = "https://api.bybit.com/v5/market/kline"
-    params = {
-        "category": category,
-        "symbol": symbol,
-        "interval": "1",  # sempre 1m
-        "start": start,
-        "end": end,
-        "limit": 200
-    }
-    r = requests.get(url, params=params).json()
-    result = r.get("result", {}).get("list", [])
+
+def fetch_ohlcv_batch(symbol: str, start: int, end: int, category="linear",
+                      rest: Optional[BybitRest] = None, limit: int = PAGE_LIMIT):
+    """Candles 1m em [start, end] (end inclusivo, como na API), em ordem crescente."""
+    result = (rest or get_rest()).kline(symbol, start, end, interval="1", category=category, limit=limit)
     data = []
     for item in result:
         data.append({
             "symbol": symbol,
-            "exchange": "Bybit",
-            "timestamp": datetime.fromtimestamp(int(item[0]) / 1000).isoformat(),
+            "exchange": EXCHANGE,
+            "timestamp": _to_iso(int(item[0])),
             "open": float(item[1]),
             "high": float(item[2]),
             "low": float(item[3]),
@@ -49,50 +54,185 @@ def fetch_ohlcv_batch(symbol: str, start: int, end: int, category="linear"):
         })
     return data
 
-def save_ohlcv_to_db(rows):
+
+def save_ohlcv_to_db(rows, client=None):
     if rows:
-        supabase.table("ohlcv") \
+        (client or get_client()).table(TABLE) \
             .upsert(rows, on_conflict="symbol,exchange,timestamp") \
             .execute()
 
 
+def last_stored_ms(symbol: str, client=None) -> Optional[int]:
+    """Timestamp (ms) do último candle já gravado para o símbolo, ou None."""
+    res = (client or get_client()).table(TABLE) \
+        .select("timestamp") \
+        .eq("symbol", symbol).eq("exchange", EXCHANGE) \
+        .order("timestamp", desc=True).limit(1) \
+        .execute()
+    return _from_iso(res.data[0]["timestamp"]) if res.data else None
+
+
 # -------------------------------
-# 3. Processo de bootstrap
+# 3. Pipeline de bootstrap
 # -------------------------------
-def bootstrap_history(symbol: str, category="linear"):
-    launch_time = get_launch_time(symbol, category)
-    now = int(datetime.now().timestamp() * 1000)
+class HistoryBootstrapper:
+    """
+    Backfill de candles 1m da Bybit para a tabela ohlcv do Supabase.
+
+    Por símbolo, um produtor (HTTP) e um consumidor (upsert) ligados por uma
+    fila limitada: o download da próxima página acontece enquanto o lote
+    anterior é gravado. O consumidor acumula `batch_rows` linhas por upsert.
+    Vários símbolos rodam em paralelo (`max_symbols`), todos sobre o mesmo
+    BybitRest (pool keep-alive, rate limit e retry compartilhados).
+
+    Retomada: o ponto de partida de cada símbolo é o último timestamp já
+    gravado (+1 minuto). Como cada símbolo tem um único consumidor que grava
+    em ordem, esse máximo nunca "pula" um lote que falhou.
+    """
+
+    def __init__(self, symbols: List[str], category: str = "linear",
+                 start_ms: Optional[int] = None, end_ms: Optional[int] = None,
+                 batch_rows: int = 5000, max_symbols: int = 4, queue_pages: int = 20,
+                 limiter: Optional[TokenBucket] = None, client_factory: Callable = get_client,
+                 resume: bool = True, retries: int = 5, rest: Optional[BybitRest] = None):
+        self.symbols = list(symbols)
+        self.category = category
+        self.start_ms = start_ms
+        self.end_ms = end_ms
+        self.batch_rows = int(batch_rows)
+        self.max_symbols = max(1, int(max_symbols))
+        self.queue_pages = int(queue_pages)
+        # limiter próprio => cliente próprio; senão o compartilhado do processo
+        self.rest = rest or (BybitRest(limiter=limiter, retries=retries) if limiter else get_rest())
+        self.client_factory = client_factory
+        self.resume = resume
+        self.retries = int(retries)
+        self.status: Dict[str, Dict] = {s: {"status": "na fila", "rows": 0, "pct": 0.0, "last": None, "error": None}
+                                        for s in self.symbols}
+        self._lock = threading.Lock()
+
+    def _set(self, symbol: str, **kw):
+        with self._lock:
+            self.status[symbol].update(kw)
+
+    def _produce(self, symbol: str, start: int, end: int, q: "queue.Queue", stop: threading.Event, errors: list):
+        try:
+            step = PAGE_LIMIT * MINUTE_MS
+            current = start
+            while current < end and not stop.is_set():
+                page_end = min(current + step, end) - 1
+                rows = fetch_ohlcv_batch(symbol, current, page_end, self.category, self.rest)
+                if rows:
+                    q.put(rows)
+                # janela vazia (ativo pausado) não encerra: segue para a próxima
+                current = page_end + 1
+        except Exception as e:
+            errors.append(e)
+        finally:
+            q.put(None)
+
+    def _consume(self, symbol: str, start: int, end: int, q: "queue.Queue", stop: threading.Event):
+        client = self.client_factory()
+        buf: List[dict] = []
+        total = 0
+
+        def flush():
+            nonlocal buf, total
+            if not buf:
+                return
+            for attempt in range(self.retries + 1):
+                try:
+                    save_ohlcv_to_db(buf, client)
+                    break
+                except Exception:
+                    if attempt >= self.retries:
+                        raise
+                    time.sleep(0.5 * (2 ** attempt))
+            total += len(buf)
+            last = _from_iso(buf[-1]["timestamp"])
+            self._set(symbol, rows=total, last=buf[-1]["timestamp"],
+                      pct=min(100.0, (last - start) / max(1, end - start) * 100.0))
+            buf = []
 
-    print(f"Carregando histórico completo de {symbol} desde {datetime.fromtimestamp(launch_time/1000)}")
+        try:
+            while True:
+                rows = q.get()
+                if rows is None:
+                    break
+                buf.extend(rows)
+                if len(buf) >= self.batch_rows:
+                    flush()
+            flush()
+        except BaseException:
+            stop.set()
+            # esvazia a fila para o produtor não ficar bloqueado no put()
+            while q.get() is not None:
+                pass
+            raise
 
-    current = launch_time
-    batch_size = 200 * 60 * 1000  # 200 candles de 1m em ms
+    def _run_symbol(self, symbol: str):
+        try:
+            end = self.end_ms or int(time.time() * 1000) // MINUTE_MS * MINUTE_MS
+            start = self.start_ms or get_launch_time(symbol, self.category, self.rest)
+            if self.resume:
+                last = last_stored_ms(symbol, self.client_factory())
+                if last is not None and last + MINUTE_MS > start:
+                    start = last + MINUTE_MS
+            if start >= end:
+                self._set(symbol, status="em dia", pct=100.0)
+                return
+            self._set(symbol, status="baixando", start=_to_iso(start))
 
-    total_inserted = 0
+            q: "queue.Queue" = queue.Queue(maxsize=self.queue_pages)
+            stop = threading.Event()
+            errors: list = []
+            producer = threading.Thread(target=self._produce, args=(symbol, start, end, q, stop, errors), daemon=True)
+            producer.start()
+            self._consume(symbol, start, end, q, stop)
+            producer.join()
+            if errors:
+                raise errors[0]
+            self._set(symbol, status="ok", pct=100.0)
+        except Exception as e:
+            self._set(symbol, status="erro", error=f"{type(e).__name__}: {e}")
 
-    while current < now:
-        end = min(current + batch_size, now)
-        data = fetch_ohlcv_batch(symbol, current, end, category)
-        if not data:
-            print("⚠️ Nenhum dado retornado, parando...")
-            break
+    def run(self, progress: Optional[Callable[[Dict[str, Dict]], None]] = None, poll: float = 1.0) -> Dict[str, Dict]:
+        """
+        Roda o backfill de todos os símbolos. `progress(status)` é chamado na
+        thread que chamou run() (seguro para Streamlit) a cada `poll` segundos.
+        """
+        with ThreadPoolExecutor(max_workers=self.max_symbols) as ex:
+            futures = [ex.submit(self._run_symbol, s) for s in self.symbols]
+            while not all(f.done() for f in futures):
+                if progress:
+                    with self._lock:
+                        progress({k: dict(v) for k, v in self.status.items()})
+                time.sleep(poll)
+        if progress:
+            progress({k: dict(v) for k, v in self.status.items()})
+        return self.status
 
-        save_ohlcv_to_db(data)
-        total_inserted += len(data)
-        print(f"✅ Inseridos {len(data)} registros até {data[-1]['timestamp']} (total: {total_inserted})")
 
-        # avançar 1ms depois do último candle, para não repetir
-        last_ts = int(datetime.fromisoformat(data[-1]["timestamp"]).timestamp() * 1000)
-        current = last_ts + 1
+def bootstrap_history(symbol: str, category="linear", **kwargs):
+    symbols = [s.strip().upper() for s in symbol.split(",") if s.strip()]
+    print(f"Carregando histórico de {', '.join(symbols)} ({category})")
 
-        time.sleep(0.2)  # respeitar rate limit
+    def _print(status):
+        for s, st in status.items():
+            print(f"  {s}: {st['status']} | {st['rows']} candles | {st['pct']:.1f}% | último={st['last']}")
 
-    print(f"🎉 Finalizado! Total de {total_inserted} candles gravados.")
+    status = HistoryBootstrapper(symbols, category=category, **kwargs).run(progress=_print, poll=10.0)
+    total = sum(st["rows"] for st in status.values())
+    for s, st in status.items():
+        if st["error"]:
+            print(f"⚠️ {s}: {st['error']}")
+    print(f"🎉 Finalizado! Total de {total} candles gravados.")
+    return status
 
 # -------------------------------
 # 4. Execução
 # -------------------------------
 if __name__ == "__main__":
-    symbol = input("Digite o símbolo (ex: BTCUSDT): ").strip().upper()
+    symbol = input("Digite o(s) símbolo(s) separados por vírgula (ex: BTCUSDT,ETHUSDT): ").strip().upper()
     category = input("Digite a categoria (spot, linear ou inverse): ").strip().lower()
     bootstrap_history(symbol, category=category)
@@ -1,161 +1,57 @@
-import os
-import requests
 import pandas as pd
 import streamlit as st
 from datetime import datetime, timedelta
-from dotenv import load_dotenv
-from supabase import create_client
-import time
+# conexão Supabase (SUPABASE_URL / SUPABASE_SERVICE_KEY do .env) fica no pipeline
+from r2d2.bootstrap_history import HistoryBootstrapper
+from r2d2.bybit_rest import get_rest
 
 # -------------------------------
-# 1. Conexão Supabase
-# -------------------------------
-load_dotenv()
-SUPABASE_URL = os.getenv("SUPABASE_URL")
-SUPABASE_KEY = os.getenv("SUPABASE_SERVICE_KEY")  # use sempre a SERVICE_KEY
-supabase = create_client(SUPABASE_URL, SUPABASE_KEY)
-
-# -------------------------------
-# 2. Helpers Bybit API
+# 1. Helpers Bybit API
 # -------------------------------
 def get_symbols_info(category="linear"):
-    """Busca instrumentos de uma categoria, com paginação"""
-    url = "https://api.bybit.com/v5/market/instruments-info"
-    params = {"category": category}
-    all_data = []
-    cursor = None
-    while True:
-        if cursor:
-            params["cursor"] = cursor
-        r = requests.get(url, params=params).json()
-        data = r.get("result", {}).get("list", [])
-        all_data.extend(data)
-        cursor = r.get("result", {}).get("nextPageCursor")
-        if not cursor:
-            break
+    """Busca instrumentos de uma categoria, com paginação (cliente REST compartilhado)"""
+    all_data = get_rest().instruments(category)
     for item in all_data:
         item["category"] = category
     return all_data
 
 def get_symbols_tickers(category="linear"):
     """Busca tickers de uma categoria (24h volume, lastPrice etc)"""
-    url = "https://api.bybit.com/v5/market/tickers"
-    params = {"category": category}
-    all_data = []
-    cursor = None
-    while True:
-        if cursor:
-            params["cursor"] = cursor
-        r = requests.get(url, params=params).json()
-        data = r.get("result", {}).get("list", [])
-        all_data.extend(data)
-        cursor = r.get("result", {}).get("nextPageCursor")
-        if not cursor:
-            break
+    all_data = get_rest().tickers(category)
     for item in all_data:
         item["category"] = category
     return all_data
 
-def get_first_candle_time(symbol: str, category="linear"):
-    """Busca o timestamp do primeiro candle disponível na Bybit"""
-    url = "https://api.bybit.com/v5/market/kline"
-    params = {
-        "category": category,
-        "symbol": symbol,
-        "interval": "1",
-        "limit": 1,
-        "start": 1420070400000  # 2015-01-01 em ms
-    }
-    r = requests.get(url, params=params).json()
-    result = r.get("result", {}).get("list", [])
-    if not result:
-        return None
-    return int(result[0][0])  # timestamp em ms do primeiro candle
-
-def fetch_ohlcv_batch(symbol: str, start: int=None, end: int=None, category="linear"):
-    """Busca candles OHLCV (sempre 1m)"""
-    url = "https://api.bybit.com/v5/market/kline"
-    params = {
-        "category": category,
-        "symbol": symbol,
-        "interval": "1",
-        "limit": 200
-    }
-    if start is not None:
-        params["start"] = start
-    if end is not None:
-        params["end"] = end
-
-    r = requests.get(url, params=params).json()
-    result = r.get("result", {}).get("list", [])
-    data = []
-    for item in result:
-        data.append({
-            "symbol": symbol,
-            "exchange": "Bybit",
-            "timestamp": datetime.fromtimestamp(int(item[0]) / 1000).isoformat(),
-            "open": float(item[1]),
-            "high": float(item[2]),
-            "low": float(item[3]),
-            "close": float(item[4]),
-            "volume": float(item[5]),
-        })
-    return data
-
-def save_ohlcv_to_db(rows):
-    if rows:
-        supabase.table("ohlcv").upsert(
-            rows,
-            on_conflict="symbol,exchange,timestamp"
-        ).execute()
-
-def bootstrap_history(symbol: str, category="linear", start_ms=None, end_ms=None):
-    """Baixa histórico completo ou parcial do ativo, a partir do primeiro candle real"""
-    # Descobre o primeiro candle real
-    first_candle = get_first_candle_time(symbol, category)
-    if not first_candle:
-        st.error(f"⚠️ Nenhum candle encontrado para {symbol} ({category})")
-        return
-
-    start_ms = start_ms or first_candle
-    end_ms = end_ms or int(datetime.now().timestamp() * 1000)
-
-    st.write(f"📥 Baixando {symbol} ({category}) de {datetime.fromtimestamp(start_ms/1000)} até {datetime.fromtimestamp(end_ms/1000)}")
-
-    current = start_ms
-    batch_size = 200 * 60 * 1000
-    total_inserted = 0
-    progress = st.progress(0)
-
-    while current < end_ms:
-        end = min(current + batch_size, end_ms)
-        data = fetch_ohlcv_batch(symbol, current, end, category)
-        if not data:
-            st.warning("⚠️ Nenhum dado retornado, parando…")
-            break
-
-        save_ohlcv_to_db(data)
-        total_inserted += len(data)
-
-        st.write(f"✅ Inseridos {len(data)} registros até {data[-1]['timestamp']} (total: {total_inserted})")
-
-        last_ts = int(datetime.fromisoformat(data[-1]["timestamp"]).timestamp() * 1000)
-        current = last_ts + 1
-
-        pct = min(int((current-start_ms)/(end_ms-start_ms)*100), 100)
-        progress.progress(pct)
-        time.sleep(0.2)
-
-    st.success(f"🎉 Finalizado! Total de {total_inserted} candles gravados.")
+def bootstrap_history(symbols, category="linear", start_ms=None, end_ms=None):
+    """Backfill (pipeline do r2d2.bootstrap_history) com progresso por símbolo."""
+    symbols = [symbols] if isinstance(symbols, str) else list(symbols)
+    st.write(f"📥 Baixando {', '.join(symbols)} ({category})"
+             + (f" de {datetime.fromtimestamp(start_ms/1000)}" if start_ms else " desde a listagem / último candle gravado")
+             + (f" até {datetime.fromtimestamp(end_ms/1000)}" if end_ms else ""))
+
+    progress = st.progress(0.0)
+    table = st.empty()
+
+    def _show(status):
+        df = pd.DataFrame.from_dict(status, orient="index")
+        progress.progress(min(1.0, float(df["pct"].mean()) / 100.0))
+        table.dataframe(df[["status", "rows", "pct", "last", "error"]])
+
+    status = HistoryBootstrapper(symbols, category=category, start_ms=start_ms, end_ms=end_ms).run(progress=_show)
+    total = sum(v["rows"] for v in status.values())
+    errors = {k: v["error"] for k, v in status.items() if v["error"]}
+    if errors:
+        st.warning("⚠️ Falhas: " + "; ".join(f"{k}: {e}" for k, e in errors.items()))
+    st.success(f"🎉 Finalizado! Total de {total} candles gravados.")
 
 # -------------------------------
-# 3. Interface Streamlit
+# 2. Interface Streamlit
 # -------------------------------
 st.title("📥 Bootstrap Histórico - Bybit")
 
 category = st.selectbox("Categoria", ["spot", "linear", "inverse"])
-symbols_info = get_symbols_info(category)
-tickers_info = get_symbols_tickers(category)
+# instrumentos e tickers em paralelo, no mesmo pool de conexões
+symbols_info, tickers_info = get_rest().map(lambda fn: fn(category), [get_symbols_info, get_symbols_tickers])
 
 if not symbols_info:
     st.error("Nenhum símbolo encontrado nessa categoria.")
@@ -197,9 +93,9 @@ else:
 
     st.dataframe(df[["display","status","category","launchTime","lastPrice","volume24h"]])
 
-    symbol_display = st.selectbox("Escolha o símbolo disponível", df["display"].tolist())
-    match = df[df["display"] == symbol_display].iloc[0]
-    real_cat = match["category"]
+    symbols_display = st.multiselect("Escolha os símbolos disponíveis", df["display"].tolist(),
+                                     default=df["display"].tolist()[:1])
+    match = df[df["display"].isin(symbols_display)]
 
     modo = st.radio("Modo de download:", ["Histórico completo", "Intervalo customizado"])
 
@@ -211,5 +107,5 @@ else:
         start_ms = int(datetime.combine(start_date, datetime.min.time()).timestamp() * 1000)
         end_ms = int(datetime.combine(end_date, datetime.min.time()).timestamp() * 1000)
 
-    if st.button("Baixar dados"):
-        bootstrap_history(match["symbol"], real_cat, start_ms=start_ms, end_ms=end_ms)
+    if st.button("Baixar dados") and not match.empty:
+        bootstrap_history(match["symbol"].tolist(), category, start_ms=start_ms, end_ms=end_ms)
@@ -2,12 +2,18 @@ import os
 import ccxt
 from typing import List, Dict, Any, Optional
 from r2d2.exchange_api import ExchangeAPI
+from r2d2.market_cache import market_cache
 from r2d2.utils.logger import get_logger
 
 log = get_logger("bybit")
 
 class BybitCCXT(ExchangeAPI):
-    def __init__(self, api_key: str = "", api_secret: str = "", testnet: bool = True):
+    def __init__(self, api_key: str = "", api_secret: str = "", testnet: bool = True,
+                 offline: Optional[bool] = None):
+        """
+        offline=True (backtests) não acessa a rede: usa os mercados do cache em
+        disco se existirem, senão segue sem eles (precisão vira no-op).
+        """
         self.testnet = testnet
         self.client = ccxt.bybit({
             "apiKey": api_key or os.getenv("BYBIT_API_KEY", ""),
@@ -22,7 +28,10 @@ class BybitCCXT(ExchangeAPI):
 
         # Futuros perpétuos USDT
         self.client.options["defaultType"] = "linear"
-        self.client.load_markets()
+        # mercados do cache (memória/disco, atualizado em segundo plano) em vez
+        # de um load_markets() a cada instância
+        if not market_cache.apply(self.client, "bybit", self.testnet, offline=offline):
+            log.warning("BybitCCXT sem metadados de mercado (offline e sem cache em disco)")
 
     def ensure_symbol_config(self, symbol: str, leverage: int = 5, margin_mode: str = "isolated"):
         try:
@@ -58,6 +67,20 @@ class BybitCCXT(ExchangeAPI):
             out.append({"ts": ts, "open": float(o), "high": float(h), "low": float(l), "close": float(c), "volume": float(v)})
         return out
 
+    def kline_stream(self, symbol: str, timeframe: str, poll_interval: float = 20.0):
+        """WebSocket de klines da Bybit (candle entregue no fechamento); polling se o timeframe não tiver tópico."""
+        from r2d2.kline_stream import BYBIT_INTERVALS, BybitKlineStream
+        if timeframe not in BYBIT_INTERVALS:
+            return super().kline_stream(symbol, timeframe, poll_interval)
+        return BybitKlineStream(symbol, timeframe, testnet=self.testnet)
+
+    def kline_mux(self, symbols: List[str], timeframe: str, poll_interval: float = 20.0):
+        """Todos os símbolos num WebSocket só (BybitKlineMux)."""
+        from r2d2.kline_stream import BYBIT_INTERVALS, BybitKlineMux
+        if timeframe not in BYBIT_INTERVALS:
+            return super().kline_mux(symbols, timeframe, poll_interval)
+        return BybitKlineMux(symbols, timeframe, testnet=self.testnet).events()
+
     def place_order(
         self,
         symbol: str,
@@ -0,0 +1,177 @@
+# r2d2/bybit_rest.py
+from __future__ import annotations
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional
+import random
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from r2d2.utils.logger import get_logger
+from r2d2.utils.rate_limit import TokenBucket
+
+log = get_logger("bybit_rest")
+
+BASE_URL = "https://api.bybit.com"
+# retCode da Bybit que valem nova tentativa: 10006 = excesso de requisições,
+# 10016 = erro interno, 10002 = timestamp/recv_window (relógio), 10000 = erro do servidor
+RETRY_CODES = {10000, 10002, 10006, 10016}
+RETRY_STATUS = {403, 429, 500, 502, 503, 504}  # 403 = limite por IP ("access too frequent")
+
+
+class BybitRestError(RuntimeError):
+    """Resposta com retCode != 0 (ou HTTP de erro) após esgotar as tentativas."""
+
+    def __init__(self, msg: str, ret_code: Optional[int] = None, status: Optional[int] = None):
+        super().__init__(msg)
+        self.ret_code = ret_code
+        self.status = status
+
+
+class BybitRest:
+    """
+    Cliente REST público da Bybit (v5) compartilhado pelas ferramentas de dados.
+
+    - uma requests.Session com pool keep-alive (`pool_size` conexões): sem
+      handshake TCP/TLS a cada página;
+    - respostas gzip (Accept-Encoding) — o JSON de klines/tickers cai ~5x;
+    - rate limit: token bucket local + cabeçalhos X-Bapi-Limit-Status /
+      X-Bapi-Limit-Reset-Timestamp (quando o saldo acaba, espera o reset);
+      403/429/retCode 10006 esvaziam o bucket por alguns segundos;
+    - retry com backoff exponencial e jitter ("full jitter");
+    - `map()` para paralelizar chamadas independentes sobre o mesmo pool.
+
+    É seguro usar a mesma instância em várias threads.
+    """
+
+    def __init__(self, base_url: str = BASE_URL, limiter: Optional[TokenBucket] = None,
+                 pool_size: int = 16, timeout: float = 10.0, retries: int = 5,
+                 backoff: float = 0.5, max_backoff: float = 20.0):
+        self.base_url = base_url.rstrip("/")
+        self.limiter = limiter or TokenBucket()
+        self.timeout = float(timeout)
+        self.retries = int(retries)
+        self.backoff = float(backoff)
+        self.max_backoff = float(max_backoff)
+        self.pool_size = int(pool_size)
+        self.session = requests.Session()
+        # max_retries=0: o retry é nosso (com rate limit e jitter), não do urllib3
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=self.pool_size, max_retries=0)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self.session.headers.update({"Accept-Encoding": "gzip, deflate", "Accept": "application/json",
+                                     "Connection": "keep-alive", "User-Agent": "r2d2-bot"})
+
+    # ---------- rate limit ----------
+    def _sleep_backoff(self, attempt: int):
+        time.sleep(random.uniform(0, min(self.max_backoff, self.backoff * (2 ** attempt))))
+
+    def _observe_limits(self, resp: requests.Response):
+        """Se a Bybit avisar que o saldo da janela acabou, segura o bucket até o reset."""
+        remaining = resp.headers.get("X-Bapi-Limit-Status")
+        reset = resp.headers.get("X-Bapi-Limit-Reset-Timestamp")
+        if remaining is None:
+            return
+        try:
+            if int(remaining) <= 1 and reset:
+                wait = int(reset) / 1000.0 - time.time()
+                if wait > 0:
+                    self.limiter.penalize(min(wait, self.max_backoff))
+        except ValueError:
+            pass
+
+    # ---------- requisições ----------
+    def get(self, path: str, params: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """GET em `path` (ex.: "/v5/market/kline") e devolve o campo "result"."""
+        url = path if path.startswith("http") else self.base_url + path
+        for attempt in range(self.retries + 1):
+            self.limiter.acquire()
+            try:
+                resp = self.session.get(url, params=params, timeout=self.timeout)
+            except requests.RequestException as e:
+                if attempt >= self.retries:
+                    raise
+                log.warning(f"{path}: {type(e).__name__} (tentativa {attempt + 1}), repetindo")
+                self._sleep_backoff(attempt)
+                continue
+
+            self._observe_limits(resp)
+            if resp.status_code in RETRY_STATUS:
+                if resp.status_code in (403, 429):
+                    self.limiter.penalize(self.backoff * (2 ** attempt))
+                if attempt >= self.retries:
+                    raise BybitRestError(f"HTTP {resp.status_code} em {path}", status=resp.status_code)
+                self._sleep_backoff(attempt)
+                continue
+            resp.raise_for_status()
+
+            body = resp.json()
+            code = body.get("retCode", 0)
+            if code == 0:
+                return body.get("result") or {}
+            if code in RETRY_CODES and attempt < self.retries:
+                if code == 10006:
+                    self.limiter.penalize(self.backoff * (2 ** attempt))
+                self._sleep_backoff(attempt)
+                continue
+            raise BybitRestError(f"Bybit retCode={code}: {body.get('retMsg')}", ret_code=code)
+        raise BybitRestError(f"sem resposta de {path}")
+
+    def paginate(self, path: str, params: Optional[Dict[str, Any]] = None) -> Iterator[dict]:
+        """Itera os itens de "result.list" seguindo nextPageCursor."""
+        params = dict(params or {})
+        while True:
+            result = self.get(path, params)
+            yield from result.get("list", [])
+            cursor = result.get("nextPageCursor")
+            if not cursor:
+                return
+            params["cursor"] = cursor
+
+    def map(self, fn: Callable, items: Iterable, max_workers: Optional[int] = None) -> List:
+        """fn(item) em paralelo sobre o mesmo pool de conexões, na ordem de `items`."""
+        items = list(items)
+        workers = max(1, min(int(max_workers or self.pool_size), self.pool_size, len(items) or 1))
+        if workers == 1:
+            return [fn(x) for x in items]
+        with ThreadPoolExecutor(max_workers=workers) as ex:
+            return list(ex.map(fn, items))
+
+    def close(self):
+        self.session.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    # ---------- endpoints de mercado ----------
+    def instruments(self, category: str = "linear", **params) -> List[dict]:
+        """/v5/market/instruments-info com paginação (limit=1000 por página)."""
+        return list(self.paginate("/v5/market/instruments-info", {"category": category, "limit": 1000, **params}))
+
+    def tickers(self, category: str = "linear", **params) -> List[dict]:
+        return list(self.paginate("/v5/market/tickers", {"category": category, **params}))
+
+    def kline(self, symbol: str, start: int, end: int, interval: str = "1",
+              category: str = "linear", limit: int = 1000) -> List[list]:
+        """Klines crus [ts, o, h, l, c, vol, turnover] em ordem crescente (a API devolve decrescente)."""
+        result = self.get("/v5/market/kline", {"category": category, "symbol": symbol, "interval": interval,
+                                               "start": int(start), "end": int(end), "limit": int(limit)})
+        return list(reversed(result.get("list", [])))
+
+
+_shared: Optional[BybitRest] = None
+_shared_lock = threading.Lock()
+
+
+def get_rest() -> BybitRest:
+    """Instância compartilhada no processo (um pool e um rate limit para todos)."""
+    global _shared
+    with _shared_lock:
+        if _shared is None:
+            _shared = BybitRest()
+        return _shared
@@ -1,5 +1,6 @@
 from dotenv import load_dotenv
 load_dotenv()
+import os
 from dataclasses import dataclass, field
 
 @dataclass
@@ -51,5 +52,21 @@ class AppConfig:
     sessions: SessionConfig = field(default_factory=SessionConfig)
     data_csv: str = ""
     bybit_testnet: bool = True
+    # diretório local para caches/checkpoints (sweeps, candles...)
+    data_dir: str = field(default_factory=lambda: os.getenv("R2D2_DATA_DIR", ".r2d2_data"))
+    # metadados de mercado (precisão/limites) em cache: validade e modo sem rede
+    markets_ttl_s: float = 6 * 3600
+    offline: bool = field(default_factory=lambda: os.getenv("R2D2_OFFLINE", "").lower() in ("1", "true", "yes"))
+    # telemetria do live no Supabase (SupabaseWriter): lote, intervalo de flush,
+    # tamanho da fila e política quando ela enche (drop_old, drop_new, block)
+    sb_batch_size: int = 200
+    sb_flush_s: float = 1.0
+    sb_queue: int = 10_000
+    sb_policy: str = "drop_old"
+    # diário local (write-ahead) na frente do Supabase: nada se perde com ele
+    # fora do ar; segmentos de journal_segment_mb, fsync em grupo a cada journal_fsync_s
+    sb_journal: bool = True
+    journal_segment_mb: int = 64
+    journal_fsync_s: float = 0.2
 
 CONFIG = AppConfig()
@@ -25,16 +25,33 @@ class ControlLoop:
         self.ai = ai_client or AIClient(dry_run=True)
         self._last_applied_at = 0
 
-    def maybe_update(self, i_bar_index: int) -> Dict[str, Any]:
-        if i_bar_index - self._last_applied_at + 1 < self.interval_bars:
-            return {}
-        bars = self.get_bars()
-        equity = self.get_equity()
-        stats = self.get_stats()
-        snap = build_snapshot(bars, equity, stats, self.strat_name, self.params_ref, lookback=self.interval_bars)
-        overrides = self.ai.suggest_overrides(snap)
-        applied = self.apply_overrides(overrides)
+    def due(self, i_bar_index: int) -> bool:
+        return i_bar_index - self._last_applied_at + 1 >= self.interval_bars
+
+    def capture(self) -> Dict[str, Any]:
+        """Cópia do estado que o snapshot usa (últimos candles, equity, stats, params)."""
+        return {
+            "bars": list(self.get_bars()[-self.interval_bars:]),
+            "equity": self.get_equity(),
+            "stats": dict(self.get_stats()),
+            "params": dict(self.params_ref),
+        }
+
+    def suggest(self, state: Dict[str, Any]) -> Dict[str, Any]:
+        """Snapshot + sugestão da IA sobre uma cópia (capture): pode rodar em outra thread."""
+        snap = build_snapshot(state["bars"], state["equity"], state["stats"], self.strat_name,
+                              state["params"], lookback=self.interval_bars)
+        return {"overrides": self.ai.suggest_overrides(snap), "snapshot": snap}
+
+    def apply(self, i_bar_index: int, suggestion: Dict[str, Any]) -> Dict[str, Any]:
+        """Aplica a sugestão na estratégia (na thread que roda a estratégia)."""
+        applied = self.apply_overrides(suggestion["overrides"])
         self._last_applied_at = i_bar_index
         if applied:
-            return {"applied": applied, "snapshot": snap}
-        return {}
\ No newline at end of file
+            return {"applied": applied, "snapshot": suggestion["snapshot"]}
+        return {}
+
+    def maybe_update(self, i_bar_index: int) -> Dict[str, Any]:
+        if not self.due(i_bar_index):
+            return {}
+        return self.apply(i_bar_index, self.suggest(self.capture()))
@@ -0,0 +1,424 @@
+# r2d2/data_store.py
+from __future__ import annotations
+from typing import Dict, Any, List, Optional, Tuple
+import json
+import os
+import re
+import time
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from r2d2.bars import BarSeries, OHLCV_COLUMNS
+from r2d2.bar_codec import decode_bars, encode_bars, read_codec_header
+from r2d2.bar_file import open_bar_file, write_bar_file
+from r2d2.resample import BASE_TIMEFRAME, BASE_MS, bucket_start, bucket_end, resample
+from r2d2.config import CONFIG
+from r2d2.utils.logger import get_logger
+
+log = get_logger("data_store")
+
+_SETTLE_MS = 10 * 60 * 1000
+_BAR_FILE_VERSIONS = 3       # versões do arquivo de barras mantidas (referências antigas seguem válidas)
+
+_SCHEMA = pa.schema([("ts", pa.int64())] + [(c, pa.float64()) for c in OHLCV_COLUMNS[1:]])
+
+
+def _safe(name: str) -> str:
+    return re.sub(r"[^A-Za-z0-9._-]", "_", name)
+
+
+def month_key(ts_ms) -> np.ndarray:
+    """'YYYY-MM' (UTC) de cada timestamp em ms."""
+    return np.asarray(ts_ms, dtype="datetime64[ms]").astype("datetime64[M]").astype(str)
+
+
+def _months_between(start_ms: int, end_ms: int) -> List[str]:
+    m0 = np.datetime64(int(start_ms), "ms").astype("datetime64[M]")
+    m1 = np.datetime64(int(max(start_ms, end_ms - 1)), "ms").astype("datetime64[M]")
+    return np.arange(m0, m1 + 1).astype(str).tolist()
+
+
+class OHLCVStore:
+    """
+    Armazenamento local de candles em Parquet, particionado por
+    exchange/símbolo/timeframe/mês:
+
+        <root>/bybit/BTC_USDT_USDT/1m/2025-09.parquet
+
+    Cada arquivo mensal é ordenado por ts e sem duplicatas; gravações fazem
+    merge com o que já existe e trocam o arquivo de forma atômica.
+    Um _meta.json por série guarda os trechos que a exchange confirmou não
+    ter (antes da listagem, manutenções), para não pedi-los de novo.
+    """
+
+    def __init__(self, root: Optional[str] = None):
+        self.root = root or os.path.join(CONFIG.data_dir, "ohlcv")
+
+    # ---------- caminhos ----------
+    def series_dir(self, exchange: str, symbol: str, timeframe: str) -> str:
+        return os.path.join(self.root, _safe(exchange.lower()), _safe(symbol), _safe(timeframe))
+
+    def _month_path(self, exchange: str, symbol: str, timeframe: str, ym: str) -> str:
+        return os.path.join(self.series_dir(exchange, symbol, timeframe), f"{ym}.parquet")
+
+    def months(self, exchange: str, symbol: str, timeframe: str) -> List[str]:
+        d = self.series_dir(exchange, symbol, timeframe)
+        if not os.path.isdir(d):
+            return []
+        return sorted(f[:-8] for f in os.listdir(d) if f.endswith(".parquet"))
+
+    # ---------- meta ----------
+    def read_meta(self, exchange: str, symbol: str, timeframe: str) -> Dict[str, Any]:
+        p = os.path.join(self.series_dir(exchange, symbol, timeframe), "_meta.json")
+        try:
+            with open(p, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def write_meta(self, exchange: str, symbol: str, timeframe: str, meta: Dict[str, Any]):
+        d = self.series_dir(exchange, symbol, timeframe)
+        os.makedirs(d, exist_ok=True)
+        tmp = os.path.join(d, "_meta.json.tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(meta, f)
+        os.replace(tmp, os.path.join(d, "_meta.json"))
+
+    # ---------- leitura ----------
+    @staticmethod
+    def _read_file(path: str) -> BarSeries:
+        t = pq.read_table(path, columns=list(OHLCV_COLUMNS))
+        return BarSeries({c: t.column(c).to_numpy() for c in OHLCV_COLUMNS})
+
+    def read(self, exchange: str, symbol: str, timeframe: str,
+             start_ms: Optional[int] = None, end_ms: Optional[int] = None) -> BarSeries:
+        """
+        Candles em [start_ms, end_ms), lendo só os meses que intersectam o
+        intervalo; com um series.r2c em dia (archive() depois da última
+        gravação), só os blocos do intervalo saem dele.
+        """
+        have = self.months(exchange, symbol, timeframe)
+        if not have:
+            return BarSeries.empty()
+        archived = self._current_archive(exchange, symbol, timeframe, have)
+        if archived is not None:
+            return decode_bars(archived, start_ms, end_ms)
+        if start_ms is not None and end_ms is not None:
+            wanted = set(_months_between(start_ms, end_ms))
+            have = [m for m in have if m in wanted]
+        parts = [self._read_file(self._month_path(exchange, symbol, timeframe, m)) for m in have]
+        return BarSeries.concat(parts).between(start_ms, end_ms)
+
+    def coverage(self, exchange: str, symbol: str, timeframe: str) -> Optional[Tuple[int, int]]:
+        """(primeiro ts, último ts) armazenados, lendo só o primeiro e o último mês."""
+        have = self.months(exchange, symbol, timeframe)
+        if not have:
+            return None
+        first = self._read_file(self._month_path(exchange, symbol, timeframe, have[0]))
+        last = first if len(have) == 1 else self._read_file(self._month_path(exchange, symbol, timeframe, have[-1]))
+        if not len(first) or not len(last):
+            return None
+        return int(first.ts[0]), int(last.ts[-1])
+
+    # ---------- escrita ----------
+    def write(self, exchange: str, symbol: str, timeframe: str, bars) -> int:
+        """Faz merge dos candles (dedup por ts, o novo vence) nos arquivos mensais."""
+        bars = BarSeries.from_records(bars)
+        if not len(bars):
+            return 0
+        d = self.series_dir(exchange, symbol, timeframe)
+        os.makedirs(d, exist_ok=True)
+        keys = month_key(bars.ts)
+        months = np.unique(keys)
+        for ym in months:
+            new = bars if len(months) == 1 else BarSeries({c: bars.col(c)[keys == ym] for c in OHLCV_COLUMNS})
+            path = self._month_path(exchange, symbol, timeframe, ym)
+            merged = BarSeries.concat([self._read_file(path), new]) if os.path.exists(path) else new
+            ts = merged.ts
+            order = np.argsort(ts, kind="stable")
+            ts_sorted = ts[order]
+            keep = order[np.r_[ts_sorted[1:] != ts_sorted[:-1], True]]  # última ocorrência = dado novo
+            table = pa.Table.from_arrays([pa.array(merged.col(c)[keep]) for c in OHLCV_COLUMNS], schema=_SCHEMA)
+            tmp = path + ".tmp"
+            pq.write_table(table, tmp, compression="zstd")
+            os.replace(tmp, path)
+        if timeframe == BASE_TIMEFRAME:
+            self.invalidate_derived(exchange, symbol, ranges_from_ts(np.sort(bars.ts), BASE_TIMEFRAME))
+        return len(bars)
+
+    # ---------- arquivo mapeado (memmap) ----------
+    def bar_file_path(self, exchange: str, symbol: str, timeframe: str, version: int) -> str:
+        return os.path.join(self.series_dir(exchange, symbol, timeframe), f"series-{int(version)}.bars")
+
+    def mapped(self, exchange: str, symbol: str, timeframe: str,
+               start_ms: Optional[int] = None, end_ms: Optional[int] = None) -> BarSeries:
+        """
+        Como read(), mas servindo de um arquivo de barras (bar_file) com a série
+        inteira, aberto via np.memmap. Os arquivos são versionados pelo mtime
+        do Parquet mensal mais novo (series-<mtime_ns>.bars) e nunca regravados
+        no lugar: uma série mapeada (e referências a ela serializadas pelo
+        cache do Streamlit ou para workers) continua válida depois de novas
+        gravações. Só as _BAR_FILE_VERSIONS versões mais recentes ficam em disco;
+        uma referência a versão já podada reabre da atual, no mesmo intervalo
+        (bar_file.resolve_columns).
+        """
+        have = self.months(exchange, symbol, timeframe)
+        if not have:
+            return BarSeries.empty()
+        newest = self._newest_month_mtime(exchange, symbol, timeframe, have)
+        path = self.bar_file_path(exchange, symbol, timeframe, newest)
+        if not os.path.exists(path):
+            full = self.read(exchange, symbol, timeframe)
+            write_bar_file(path, full, meta={"exchange": exchange, "symbol": symbol, "timeframe": timeframe})
+            log.info(f"arquivo de barras regerado: {path} ({len(full)} candles)")
+            self._prune_bar_files(exchange, symbol, timeframe)
+        return open_bar_file(path).between(start_ms, end_ms)
+
+    def _prune_bar_files(self, exchange: str, symbol: str, timeframe: str):
+        d = self.series_dir(exchange, symbol, timeframe)
+        versions = sorted((int(n[7:-5]) for n in os.listdir(d)
+                           if n.startswith("series-") and n.endswith(".bars") and n[7:-5].isdigit()), reverse=True)
+        old = [self.bar_file_path(exchange, symbol, timeframe, v) for v in versions[_BAR_FILE_VERSIONS:]]
+        old.append(os.path.join(d, "series.bars"))  # formato antigo, regravado no lugar
+        for p in old:
+            try:
+                os.remove(p)
+            except OSError:
+                pass
+
+    # ---------- arquivo morto comprimido ----------
+    def archive_path(self, exchange: str, symbol: str, timeframe: str) -> str:
+        return os.path.join(self.series_dir(exchange, symbol, timeframe), "series.r2c")
+
+    def _newest_month_mtime(self, exchange: str, symbol: str, timeframe: str, have: List[str]) -> int:
+        return max(os.stat(self._month_path(exchange, symbol, timeframe, m)).st_mtime_ns for m in have)
+
+    def _current_archive(self, exchange: str, symbol: str, timeframe: str, have: List[str]) -> Optional[str]:
+        """series.r2c se ele foi gerado dos Parquet atuais (mesmo mtime do mês mais novo); senão None."""
+        path = self.archive_path(exchange, symbol, timeframe)
+        try:
+            meta = read_codec_header(path)[0].get("meta") or {}
+            return path if meta.get("source_mtime_ns") == self._newest_month_mtime(exchange, symbol, timeframe, have) \
+                else None
+        except (OSError, ValueError):
+            return None
+
+    def archive(self, exchange: str, symbol: str, timeframe: str, path: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Exporta a série inteira para um .r2c (bar_codec): ~4-5x menor que o
+        Parquet mensal em preços com tick fixo. No caminho padrão
+        (series.r2c) vira a leitura fria do read() até a próxima gravação;
+        em outro caminho é backup/transferência (load_bars_file() lê).
+        """
+        path = path or self.archive_path(exchange, symbol, timeframe)
+        have = self.months(exchange, symbol, timeframe)
+        if not have:
+            return {"rows": 0, "blocks": 0, "bytes": 0, "path": None}
+        # versão dos Parquet lida antes da leitura: gravação no meio deixa o .r2c velho, nunca adiantado
+        version = self._newest_month_mtime(exchange, symbol, timeframe, have)
+        bars = BarSeries.concat([self._read_file(self._month_path(exchange, symbol, timeframe, m)) for m in have])
+        info = encode_bars(path, bars, meta={"exchange": exchange, "symbol": symbol, "timeframe": timeframe,
+                                             "source_mtime_ns": version})
+        log.info(f"{symbol} {timeframe}: {info['rows']} candles em {path} ({info['bytes']} bytes)")
+        return {**info, "path": path}
+
+    # ---------- timeframes derivados do 1m ----------
+    def derive(self, exchange: str, symbol: str, timeframe: str) -> int:
+        """
+        Atualiza o timeframe `timeframe` a partir do 1m armazenado.
+        Incremental: o meta da série derivada guarda os trechos do 1m já
+        incorporados ("derived", lista de [a, b)); write() no 1m tira deles o
+        trecho gravado (invalidate_derived). Só os baldes que cruzam o que
+        falta são reagregados, então 1m gravado dentro de um trecho já
+        derivado (reparo de lacunas, mês anterior, importação tardia) chega ao
+        timeframe maior. Devolve quantos candles foram (re)gravados.
+        """
+        if timeframe == BASE_TIMEFRAME:
+            return 0
+        cov = self.coverage(exchange, symbol, BASE_TIMEFRAME)
+        if cov is None:
+            return 0
+        meta = self.read_meta(exchange, symbol, timeframe)
+        # formato antigo (derived_to/derived_from, uma marca só) não é confiável: reagrega tudo
+        derived = [tuple(r) for r in meta.get("derived", [])]
+        base_end = cov[1] + BASE_MS
+        todo = subtract_ranges([(cov[0], base_end)], derived)
+        if not todo:
+            return 0
+        written = 0
+        for a, b in todo:
+            start = int(bucket_start(np.array([a]), timeframe)[0])
+            end = int(bucket_end(bucket_start(np.array([b - 1]), timeframe), timeframe)[0])
+            out = resample(self.read(exchange, symbol, BASE_TIMEFRAME, start, min(end, base_end)),
+                           timeframe, complete_only=True)
+            if len(out):
+                self.write(exchange, symbol, timeframe, out)
+                written += len(out)
+        meta = self.read_meta(exchange, symbol, timeframe)
+        for k in ("derived_to", "derived_from"):
+            meta.pop(k, None)
+        meta["derived"] = [list(r) for r in merge_ranges(derived + todo)]
+        meta["symbol"] = symbol
+        self.write_meta(exchange, symbol, timeframe, meta)
+        return written
+
+    def derived_timeframes(self, exchange: str, symbol: str) -> List[str]:
+        """Timeframes dessa série que são derivados do 1m (têm "derived" no meta)."""
+        d = os.path.dirname(self.series_dir(exchange, symbol, BASE_TIMEFRAME))
+        if not os.path.isdir(d):
+            return []
+        out = []
+        for tf in sorted(os.listdir(d)):
+            if tf == BASE_TIMEFRAME or not os.path.isdir(os.path.join(d, tf)):
+                continue
+            meta = self.read_meta(exchange, symbol, tf)
+            if "derived" in meta or "derived_to" in meta:
+                out.append(tf)
+        return out
+
+    def invalidate_derived(self, exchange: str, symbol: str, ranges: List[Tuple[int, int]]):
+        """Trechos do 1m regravados: os baldes que os cruzam voltam a ser derivados no próximo derive()."""
+        ranges = merge_ranges(ranges)
+        if not ranges:
+            return
+        for tf in self.derived_timeframes(exchange, symbol):
+            meta = self.read_meta(exchange, symbol, tf)
+            if "derived" not in meta:
+                continue
+            derived = [tuple(r) for r in meta["derived"]]
+            left = subtract_ranges(derived, ranges)
+            if left != merge_ranges(derived):
+                meta["derived"] = [list(r) for r in left]
+                self.write_meta(exchange, symbol, tf, meta)
+
+    def rederive(self, exchange: str, symbol: str) -> Dict[str, int]:
+        """derive() de todos os timeframes derivados do símbolo (depois de preencher o 1m)."""
+        return {tf: self.derive(exchange, symbol, tf) for tf in self.derived_timeframes(exchange, symbol)}
+
+    # ---------- índice de lacunas ----------
+    def read_ts(self, exchange: str, symbol: str, timeframe: str,
+                start_ms: Optional[int] = None, end_ms: Optional[int] = None) -> np.ndarray:
+        """Só a coluna ts (leitura barata para o índice de lacunas)."""
+        have = self.months(exchange, symbol, timeframe)
+        if start_ms is not None and end_ms is not None:
+            wanted = set(_months_between(start_ms, end_ms))
+            have = [m for m in have if m in wanted]
+        if not have:
+            return np.empty(0, dtype=np.int64)
+        ts = np.concatenate([pq.read_table(self._month_path(exchange, symbol, timeframe, m), columns=["ts"])
+                             .column("ts").to_numpy() for m in have])
+        i0 = 0 if start_ms is None else int(np.searchsorted(ts, start_ms, side="left"))
+        i1 = len(ts) if end_ms is None else int(np.searchsorted(ts, end_ms, side="left"))
+        return ts[i0:i1]
+
+    def gap_index(self, exchange: str, symbol: str, timeframe: str,
+                  start_ms: Optional[int] = None, end_ms: Optional[int] = None) -> Dict[str, List[Tuple[int, int]]]:
+        """
+        Índice da série em [start_ms, end_ms) (default: do primeiro ao último candle):
+          present — trechos contínuos armazenados (via diff vetorizado dos ts)
+          empty   — trechos que a exchange confirmou não ter candles
+          missing — o resto: o que um download ainda precisa buscar
+        """
+        ts = self.read_ts(exchange, symbol, timeframe, start_ms, end_ms)
+        present = ranges_from_ts(ts, timeframe)
+        if start_ms is None or end_ms is None:
+            if not present:
+                return {"present": [], "empty": [], "missing": []}
+            start_ms = present[0][0] if start_ms is None else start_ms
+            end_ms = present[-1][1] if end_ms is None else end_ms
+        window = [(int(start_ms), int(end_ms))]
+        empty = intersect_ranges(self.read_meta(exchange, symbol, timeframe).get("empty", []), window)
+        missing = subtract_ranges(window, merge_ranges(present + empty))
+        return {"present": present, "empty": empty, "missing": missing}
+
+    def missing_ranges(self, exchange: str, symbol: str, timeframe: str,
+                       start_ms: int, end_ms: int) -> List[Tuple[int, int]]:
+        """Intervalos [a, b) de [start_ms, end_ms) nem armazenados nem confirmados vazios."""
+        if end_ms <= start_ms:
+            return []
+        return self.gap_index(exchange, symbol, timeframe, start_ms, end_ms)["missing"]
+
+    def mark_fetched(self, exchange: str, symbol: str, timeframe: str, start_ms: int, end_ms: int, ts_received):
+        """
+        Depois de baixar [start_ms, end_ms) com sucesso: o que a exchange não
+        devolveu nesse intervalo vira "confirmado vazio" e não é pedido de novo.
+        """
+        got = ranges_from_ts(np.asarray(ts_received, dtype=np.int64), timeframe)
+        # candles recém-fechados podem demorar a aparecer na API: não marca o fim recente como vazio
+        now = int(time.time() * 1000)
+        tf_len = int(bucket_end(np.array([now]), timeframe)[0] - bucket_start(np.array([now]), timeframe)[0])
+        settle_from = now - max(_SETTLE_MS, 2 * tf_len)
+        holes = subtract_ranges([(int(start_ms), min(int(end_ms), settle_from))], got)
+        meta = self.read_meta(exchange, symbol, timeframe)
+        meta["symbol"] = symbol
+        meta["empty"] = [list(r) for r in merge_ranges([tuple(r) for r in meta.get("empty", [])] + holes)]
+        self.write_meta(exchange, symbol, timeframe, meta)
+
+    def list_series(self, exchange: str, timeframe: str) -> List[str]:
+        """Símbolos (nome original, via _meta.json) com série armazenada nesse timeframe."""
+        d = os.path.join(self.root, _safe(exchange.lower()))
+        out = []
+        if not os.path.isdir(d):
+            return out
+        for sdir in sorted(os.listdir(d)):
+            meta_path = os.path.join(d, sdir, _safe(timeframe), "_meta.json")
+            try:
+                with open(meta_path, "r", encoding="utf-8") as f:
+                    sym = json.load(f).get("symbol")
+            except (OSError, ValueError):
+                continue
+            if sym:
+                out.append(sym)
+        return out
+
+
+# ---------- aritmética de intervalos [a, b) ----------
+def ranges_from_ts(ts: np.ndarray, timeframe: str) -> List[Tuple[int, int]]:
+    """Trechos contínuos [a, b) de uma coluna ts ordenada (quebra onde ts[i+1] > fim do candle i)."""
+    if not len(ts):
+        return []
+    ends = bucket_end(ts, timeframe)
+    brk = np.flatnonzero(ts[1:] > ends[:-1])
+    first = np.r_[0, brk + 1]
+    last = np.r_[brk, len(ts) - 1]
+    return list(zip(ts[first].tolist(), ends[last].tolist()))
+
+
+def merge_ranges(ranges) -> List[Tuple[int, int]]:
+    out: List[Tuple[int, int]] = []
+    for a, b in sorted((int(a), int(b)) for a, b in ranges if b > a):
+        if out and a <= out[-1][1]:
+            out[-1] = (out[-1][0], max(out[-1][1], b))
+        else:
+            out.append((a, b))
+    return out
+
+
+def subtract_ranges(base, remove) -> List[Tuple[int, int]]:
+    remove = merge_ranges(remove)
+    out = []
+    for a, b in merge_ranges(base):
+        cur = a
+        for r0, r1 in remove:
+            if r1 <= cur or r0 >= b:
+                continue
+            if r0 > cur:
+                out.append((cur, r0))
+            cur = max(cur, r1)
+            if cur >= b:
+                break
+        if cur < b:
+            out.append((cur, b))
+    return out
+
+
+def intersect_ranges(ranges, window) -> List[Tuple[int, int]]:
+    out = []
+    for a, b in merge_ranges(ranges):
+        for w0, w1 in window:
+            lo, hi = max(a, w0), min(b, w1)
+            if hi > lo:
+                out.append((lo, hi))
+    return merge_ranges(out)
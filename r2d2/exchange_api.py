@@ -17,3 +17,25 @@ class ExchangeAPI:
     def point_value(self, symbol: str) -> float:
         # exemplo: mini dólar = 10, mas em cripto geralmente 1
         return 1.0
+
+    def kline_stream(self, symbol: str, timeframe: str, poll_interval: float = 20.0):
+        """Candles fechados para o modo live (kline_stream.KlineStream); padrão: polling REST."""
+        from r2d2.kline_stream import PollingKlineStream
+        return PollingKlineStream(self, symbol, timeframe, interval=poll_interval)
+
+    def kline_mux(self, symbols: List[str], timeframe: str, poll_interval: float = 20.0):
+        """Iterador assíncrono de (symbol, candle fechado) de vários símbolos; padrão: um stream por símbolo."""
+        from r2d2.kline_stream import merge_streams
+        return merge_streams({s: self.kline_stream(s, timeframe, poll_interval) for s in symbols})
+
+
+class OfflineExchange(ExchangeAPI):
+    """
+    Exchange "de mentira" para backtests que não precisam de rede
+    (walk-forward, sweeps em processos paralelos...). Só expõe point_value.
+    """
+    def __init__(self, point_value: float = 1.0):
+        self._point_value = float(point_value)
+
+    def point_value(self, symbol: str) -> float:
+        return self._point_value
@@ -0,0 +1,178 @@
+# r2d2/file_loader.py
+from __future__ import annotations
+from typing import Dict, List, Optional
+import hashlib
+import os
+
+import ccxt
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.csv as pacsv
+import pyarrow.parquet as pq
+
+from r2d2.bars import BarSeries, OHLCV_COLUMNS
+from r2d2.bar_codec import decode_bars
+from r2d2.bar_file import open_bar_file, write_bar_file
+from r2d2.config import CONFIG
+from r2d2.resample import resample
+from r2d2.utils.logger import get_logger
+
+log = get_logger("file_loader")
+
+# nomes aceitos para cada coluna (comparação sem maiúsculas/minúsculas)
+ALIASES: Dict[str, List[str]] = {
+    "ts": ["ts", "timestamp", "time", "datetime", "date", "open_time", "opentime", "t"],
+    "open": ["open", "o"],
+    "high": ["high", "h"],
+    "low": ["low", "l"],
+    "close": ["close", "c", "last"],
+    "volume": ["volume", "vol", "v", "base_volume"],
+}
+
+_BLOCK_SIZE = 64 << 20  # 64MB por bloco do leitor CSV (cada bloco vai para uma thread)
+
+
+def _resolve(names: List[str]) -> Dict[str, str]:
+    lower = {n.strip().lower(): n for n in names}
+    out = {}
+    for col, options in ALIASES.items():
+        for o in options:
+            if o in lower:
+                out[col] = lower[o]
+                break
+    missing = [c for c in OHLCV_COLUMNS if c not in out and c != "volume"]
+    if missing:
+        raise ValueError(f"colunas não encontradas: {missing} (disponíveis: {names})")
+    return out
+
+
+def _sniff_csv(path: str):
+    """(delimitador, tem_cabeçalho, n_colunas) a partir da primeira linha."""
+    with open(path, "r", encoding="utf-8", errors="replace") as f:
+        first = f.readline()
+    delim = max([",", ";", "\t", "|"], key=first.count)
+    cells = [c.strip().strip('"') for c in first.strip().split(delim)]
+
+    def _num(x):
+        try:
+            float(x)
+            return True
+        except ValueError:
+            return False
+    has_header = not all(_num(c) for c in cells[:6])
+    return delim, has_header, len(cells)
+
+
+def _read_table(path: str) -> pa.Table:
+    if path.lower().endswith((".parquet", ".pq")):
+        names = pq.read_schema(path).names
+        cols = _resolve(names)
+        t = pq.read_table(path, columns=list(cols.values()), use_threads=True)
+        return t.rename_columns([{v: k for k, v in cols.items()}[n] for n in t.column_names])
+
+    delim, has_header, ncols = _sniff_csv(path)
+    if has_header:
+        read_opts = pacsv.ReadOptions(use_threads=True, block_size=_BLOCK_SIZE)
+        with open(path, "r", encoding="utf-8", errors="replace") as f:
+            names = [c.strip().strip('"') for c in f.readline().strip().split(delim)]
+    else:
+        # sem cabeçalho: assume ts, open, high, low, close, volume, ... (padrão de dumps de exchange)
+        names = list(OHLCV_COLUMNS[:ncols]) + [f"extra_{i}" for i in range(max(0, ncols - 6))]
+        read_opts = pacsv.ReadOptions(use_threads=True, block_size=_BLOCK_SIZE, column_names=names)
+    cols = _resolve(names)
+    t = pacsv.read_csv(path, read_options=read_opts,
+                       parse_options=pacsv.ParseOptions(delimiter=delim),
+                       convert_options=pacsv.ConvertOptions(include_columns=list(cols.values())))
+    return t.rename_columns([{v: k for k, v in cols.items()}[n] for n in t.column_names])
+
+
+def _ts_to_ms(col: pa.ChunkedArray) -> np.ndarray:
+    """Timestamp em ms (int64) com detecção da unidade: s / ms / µs / ns, ou datas em texto."""
+    if pa.types.is_timestamp(col.type):
+        return pc.cast(col, pa.timestamp("ms", tz=col.type.tz)).cast(pa.int64()).to_numpy()
+    if pa.types.is_date(col.type):
+        return pc.cast(pc.cast(col, pa.timestamp("ms")), pa.int64()).to_numpy()
+    if pa.types.is_string(col.type) or pa.types.is_large_string(col.type):
+        try:
+            return pc.cast(col, pa.timestamp("ms")).cast(pa.int64()).to_numpy()
+        except pa.ArrowInvalid:
+            # formatos fora do ISO puro (fuso, "Z"...): pandas resolve, em UTC
+            return pd.to_datetime(col.to_pandas(), utc=True).astype("int64").to_numpy() // 1_000_000
+    raw = pc.cast(col, pa.float64()).to_numpy()
+    mx = float(np.nanmax(np.abs(raw))) if len(raw) else 0.0
+    if mx < 1e11:
+        scale = 1000.0        # segundos
+    elif mx < 1e14:
+        scale = 1.0           # milissegundos
+    elif mx < 1e17:
+        scale = 1e-3          # microssegundos
+    else:
+        scale = 1e-6          # nanossegundos
+    if pa.types.is_integer(col.type):
+        ints = pc.cast(col, pa.int64()).to_numpy()
+        return ints * int(scale) if scale >= 1 else ints // int(round(1 / scale))
+    return np.round(raw * scale).astype(np.int64)
+
+
+def table_to_bars(t: pa.Table) -> BarSeries:
+    """Tabela Arrow -> BarSeries ordenada e sem ts duplicado, sem objetos por linha."""
+    ts = _ts_to_ms(t.column("ts"))
+    cols = {"ts": ts}
+    for c in OHLCV_COLUMNS[1:]:
+        if c in t.column_names:
+            col = pc.fill_null(pc.cast(t.column(c), pa.float64()), 0.0 if c == "volume" else np.nan)
+            cols[c] = col.to_numpy()
+        else:
+            cols[c] = np.zeros(len(ts), dtype=np.float64)
+    ok = ~np.isnan(cols["close"])
+    if not ok.all():
+        cols = {k: v[ok] for k, v in cols.items()}
+    ts = cols["ts"]
+    if len(ts) > 1 and not np.all(ts[1:] > ts[:-1]):
+        _, idx = np.unique(ts, return_index=True)  # ordena e remove duplicados (mantém o primeiro)
+        cols = {k: v[idx] for k, v in cols.items()}
+    return BarSeries({k: np.ascontiguousarray(v) for k, v in cols.items()})
+
+
+def _cache_path(path: str) -> str:
+    st = os.stat(path)
+    key = f"{os.path.abspath(path)}|{st.st_size}|{int(st.st_mtime)}"
+    return os.path.join(CONFIG.data_dir, "imports", hashlib.sha1(key.encode("utf-8")).hexdigest() + ".bars")
+
+
+def load_bars_file(path: str, start_ms: Optional[int] = None, end_ms: Optional[int] = None,
+                   timeframe: Optional[str] = None, cache: bool = True) -> BarSeries:
+    """
+    Carrega candles de CSV, Parquet ou arquivo comprimido .r2c (AppConfig.data_csv).
+
+    - CSV lido pelo leitor multithread do pyarrow (blocos de 64MB em paralelo),
+      só com as colunas OHLCV; Parquet lido direto em colunas;
+    - nomes de coluna por alias (timestamp/time/open_time, o/h/l/c/v...) e CSV
+      sem cabeçalho assumido como ts,open,high,low,close,volume;
+    - unidade do timestamp detectada pela magnitude (s, ms, µs, ns) ou texto ISO;
+    - com cache=True a primeira carga vira um arquivo de barras (bar_file) em
+      {data_dir}/imports, e as seguintes só mapeiam esse arquivo;
+    - .r2c (bar_codec) decodifica só os blocos do intervalo, sem cache;
+    - se `timeframe` for maior que o do arquivo, agrega (resample).
+    """
+    target = _cache_path(path) if cache and not path.lower().endswith(".r2c") else None
+    if path.lower().endswith(".r2c"):
+        bars = decode_bars(path, start_ms, end_ms)
+    elif target and os.path.exists(target):
+        bars = open_bar_file(target)
+    else:
+        bars = table_to_bars(_read_table(path))
+        log.info(f"{path}: {len(bars)} candles importados")
+        if target:
+            write_bar_file(target, bars, meta={"source_file": os.path.abspath(path)})
+            bars = open_bar_file(target)
+    bars = bars.between(start_ms, end_ms)
+    bars.meta["source"] = f"arquivo:{os.path.abspath(path)}"
+
+    if timeframe and len(bars) > 1:
+        step = int(np.median(np.diff(bars.ts[: min(len(bars), 10_000)])))
+        if ccxt.Exchange.parse_timeframe(timeframe) * 1000 > step:
+            bars = resample(bars, timeframe, base_ms=step)
+    return bars
@@ -0,0 +1,207 @@
+# r2d2/funding.py
+from __future__ import annotations
+from typing import Dict, Any, List, Optional, Tuple
+import json
+import os
+import time
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from r2d2.bars import BarSeries
+from r2d2.bybit_rest import BybitRest, get_rest
+from r2d2.config import CONFIG
+from r2d2.data_store import _safe, merge_ranges, subtract_ranges
+from r2d2.supabase_store import ohlcv_symbol
+from r2d2.utils.logger import get_logger
+
+log = get_logger("funding")
+
+FUNDING = "funding"
+OPEN_INTEREST = "open_interest"
+OI_INTERVAL = "1h"            # 5min, 15min, 30min, 1h, 4h, 1d
+_PAGE = 200                   # máximo dos dois endpoints
+_SCHEMA = pa.schema([("ts", pa.int64()), ("value", pa.float64())])
+
+
+class DerivStore:
+    """
+    Séries de derivativos por símbolo (funding rate e open interest) em
+    Parquet: <root>/bybit/BTC_USDT_USDT/funding.parquet, com ts (ms) e value.
+    São séries pequenas (funding: 3 pontos/dia), então cada uma é um arquivo
+    só, reescrito com merge. Um <kind>.json guarda os intervalos já
+    consultados para não pedir de novo trechos que a exchange não tem.
+    """
+
+    def __init__(self, root: Optional[str] = None, exchange: str = "bybit"):
+        self.root = root or os.path.join(CONFIG.data_dir, "derivs")
+        self.exchange = exchange
+
+    def _path(self, symbol: str, kind: str, ext: str = "parquet") -> str:
+        return os.path.join(self.root, _safe(self.exchange), _safe(symbol), f"{kind}.{ext}")
+
+    def read(self, symbol: str, kind: str) -> Tuple[np.ndarray, np.ndarray]:
+        p = self._path(symbol, kind)
+        if not os.path.exists(p):
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float64)
+        t = pq.read_table(p)
+        return t.column("ts").to_numpy(), t.column("value").to_numpy()
+
+    def write(self, symbol: str, kind: str, ts: np.ndarray, values: np.ndarray):
+        old_ts, old_v = self.read(symbol, kind)
+        ts = np.concatenate([old_ts, np.asarray(ts, dtype=np.int64)])
+        values = np.concatenate([old_v, np.asarray(values, dtype=np.float64)])
+        # novos ganham em ts repetido (último na concatenação)
+        rev_ts = ts[::-1]
+        _, idx = np.unique(rev_ts, return_index=True)
+        keep = len(ts) - 1 - idx
+        p = self._path(symbol, kind)
+        os.makedirs(os.path.dirname(p), exist_ok=True)
+        tmp = f"{p}.{os.getpid()}.tmp"
+        pq.write_table(pa.table({"ts": ts[keep], "value": values[keep]}, schema=_SCHEMA), tmp, compression="zstd")
+        os.replace(tmp, p)
+
+    def covered(self, symbol: str, kind: str) -> List[Tuple[int, int]]:
+        """
+        Intervalos [from, to) já consultados. O formato antigo ({"from", "to"},
+        um intervalo só) podia cobrir buracos nunca baixados: é ignorado e o
+        trecho é consultado de novo (write faz merge, sem duplicar).
+        """
+        try:
+            with open(self._path(symbol, kind, "json"), "r", encoding="utf-8") as f:
+                m = json.load(f)
+            return merge_ranges(tuple(r) for r in m["ranges"])
+        except (OSError, ValueError, KeyError, TypeError):
+            return []
+
+    def mark_covered(self, symbol: str, kind: str, start_ms: int, end_ms: int):
+        ranges = merge_ranges(self.covered(symbol, kind) + [(int(start_ms), int(end_ms))])
+        p = self._path(symbol, kind, "json")
+        os.makedirs(os.path.dirname(p), exist_ok=True)
+        with open(p, "w", encoding="utf-8") as f:
+            json.dump({"ranges": [list(r) for r in ranges]}, f)
+
+    def missing(self, symbol: str, kind: str, start_ms: int, end_ms: int) -> List[Tuple[int, int]]:
+        if start_ms >= end_ms:
+            return []
+        return subtract_ranges([(int(start_ms), int(end_ms))], self.covered(symbol, kind))
+
+
+# ---------- download ----------
+def fetch_funding_history(symbol: str, start_ms: int, end_ms: int,
+                          rest: Optional[BybitRest] = None) -> Tuple[np.ndarray, np.ndarray]:
+    """/v5/market/funding/history em [start, end). A API pagina só por endTime, do mais novo para trás."""
+    rest = rest or get_rest()
+    ts_all: List[int] = []
+    val_all: List[float] = []
+    end = int(end_ms) - 1
+    while end >= start_ms:
+        rows = rest.get("/v5/market/funding/history", {"category": "linear", "symbol": ohlcv_symbol(symbol),
+                                                       "startTime": int(start_ms), "endTime": end,
+                                                       "limit": _PAGE}).get("list", [])
+        if not rows:
+            break
+        for r in rows:
+            ts_all.append(int(r["fundingRateTimestamp"]))
+            val_all.append(float(r["fundingRate"]))
+        oldest = min(int(r["fundingRateTimestamp"]) for r in rows)
+        if len(rows) < _PAGE or oldest <= start_ms:
+            break
+        end = oldest - 1
+    order = np.argsort(ts_all)
+    return np.asarray(ts_all, dtype=np.int64)[order], np.asarray(val_all, dtype=np.float64)[order]
+
+
+def fetch_open_interest(symbol: str, start_ms: int, end_ms: int, interval: str = OI_INTERVAL,
+                        rest: Optional[BybitRest] = None) -> Tuple[np.ndarray, np.ndarray]:
+    """/v5/market/open-interest em [start, end) (paginação por cursor)."""
+    api_interval = {"5m": "5min", "15m": "15min", "30m": "30min"}.get(interval, interval)
+    rows = list((rest or get_rest()).paginate("/v5/market/open-interest", {
+        "category": "linear", "symbol": ohlcv_symbol(symbol), "intervalTime": api_interval,
+        "startTime": int(start_ms), "endTime": int(end_ms) - 1, "limit": _PAGE}))
+    ts = np.asarray([int(r["timestamp"]) for r in rows], dtype=np.int64)
+    val = np.asarray([float(r["openInterest"]) for r in rows], dtype=np.float64)
+    order = np.argsort(ts)
+    return ts[order], val[order]
+
+
+def update_derivs(symbol: str, start_ms: int, end_ms: int, store: Optional[DerivStore] = None,
+                  open_interest: bool = True, rest: Optional[BybitRest] = None) -> DerivStore:
+    """Baixa só os trechos de funding/OI que o store ainda não consultou."""
+    store = store or DerivStore()
+    end_ms = min(int(end_ms), int(time.time() * 1000))
+    jobs = [(FUNDING, lambda a, b: fetch_funding_history(symbol, a, b, rest))]
+    if open_interest:
+        jobs.append((OPEN_INTEREST, lambda a, b: fetch_open_interest(symbol, a, b, rest=rest)))
+    for kind, fetch in jobs:
+        for a, b in store.missing(symbol, kind, int(start_ms), end_ms):
+            ts, val = fetch(a, b)
+            if len(ts):
+                store.write(symbol, kind, ts, val)
+            store.mark_covered(symbol, kind, a, b)
+            log.info(f"{symbol} {kind}: {len(ts)} pontos em [{a}, {b})")
+    return store
+
+
+# ---------- alinhamento com as barras ----------
+def asof(bar_ts: np.ndarray, ts: np.ndarray, values: np.ndarray, fill: float = np.nan) -> np.ndarray:
+    """
+    Junção as-of vetorizada: para cada barra, o último valor com ts <= ts da
+    barra (searchsorted, sem laço). Antes do primeiro ponto: `fill`.
+    """
+    bar_ts = np.asarray(bar_ts, dtype=np.int64)
+    if not len(ts):
+        return np.full(len(bar_ts), fill, dtype=np.float64)
+    idx = np.searchsorted(ts, bar_ts, side="right") - 1
+    out = np.asarray(values, dtype=np.float64)[np.maximum(idx, 0)]
+    out[idx < 0] = fill
+    return out
+
+
+def funding_events(bar_ts: np.ndarray, ts: np.ndarray, rates: np.ndarray) -> np.ndarray:
+    """
+    Taxa a cobrar em cada barra: o funding liquidado em F vai para a primeira
+    barra com ts >= F (quem está posicionado na abertura dela atravessou F).
+    Zero nas demais; várias liquidações na mesma barra se somam.
+    """
+    bar_ts = np.asarray(bar_ts, dtype=np.int64)
+    out = np.zeros(len(bar_ts), dtype=np.float64)
+    if not len(ts) or not len(bar_ts):
+        return out
+    sel = (ts > bar_ts[0]) & (ts <= bar_ts[-1])
+    idx = np.searchsorted(bar_ts, ts[sel], side="left")
+    np.add.at(out, idx, rates[sel])
+    return out
+
+
+def attach_derivs(bars, symbol: str, download: bool = True, open_interest: bool = True,
+                  store: Optional[DerivStore] = None) -> BarSeries:
+    """
+    Anexa à série (sem copiar OHLCV) as colunas:
+      funding_rate  — última taxa liquidada as-of a barra (visível à estratégia)
+      funding       — taxa liquidada DENTRO da barra (0 nas outras), que o
+                      Backtester cobra da posição aberta
+      open_interest — último open interest as-of a barra (se open_interest)
+    """
+    bars = BarSeries.from_records(bars)
+    if not len(bars):
+        return bars
+    store = store or DerivStore()
+    bar_ts = bars.ts
+    if download and not CONFIG.offline:
+        try:
+            update_derivs(symbol, int(bar_ts[0]), int(bar_ts[-1]) + 1, store, open_interest=open_interest)
+        except Exception as e:
+            log.warning(f"{symbol}: funding/OI não atualizados ({e}); usando o que há localmente")
+    f_ts, f_val = store.read(symbol, FUNDING)
+    cols: Dict[str, Any] = {
+        "funding_rate": asof(bar_ts, f_ts, f_val, fill=0.0),
+        "funding": funding_events(bar_ts, f_ts, f_val),
+    }
+    if open_interest:
+        oi_ts, oi_val = store.read(symbol, OPEN_INTEREST)
+        cols["open_interest"] = asof(bar_ts, oi_ts, oi_val)
+    out = bars.with_columns(**cols)
+    out.meta["funding_points"] = int(len(f_ts))
+    return out
@@ -0,0 +1,72 @@
+# r2d2/indicator_cache.py
+from __future__ import annotations
+from collections import OrderedDict
+from typing import Dict, Any, Tuple
+import threading
+
+import numpy as np
+
+from r2d2.bars import BarSeries
+from r2d2.utils.indicators import keltner_channels_np
+
+# colunas que a TrendFollowingStrategy lê direto do candle quando presentes
+KELTNER_COLUMNS = ("kc_upper", "kc_lower", "kc_mid", "kc_slope", "atr")
+
+
+class IndicatorCache:
+    """
+    Calcula os indicadores UMA vez sobre a série completa e reaproveita em
+    qualquer recorte (folds do walk-forward, combinações do grid, janelas).
+
+    A chave é (ema_period, atr_period, keltner_mult): parâmetros que só mudam
+    limiares (SL/TP/min_atr...) compartilham o mesmo cálculo.
+
+    for_bars() reaproveita a instância entre chamadas (reruns do Streamlit,
+    sweeps seguidos) quando o dataset é o mesmo, pelo hash do manifesto.
+    """
+
+    _shared: "OrderedDict[str, IndicatorCache]" = OrderedDict()
+    _shared_max = 4
+    _shared_lock = threading.Lock()
+
+    def __init__(self, bars):
+        self.bars = BarSeries.from_records(bars)
+        self._keltner: Dict[Tuple[int, int, float], Dict[str, np.ndarray]] = {}
+
+    @property
+    def dataset(self) -> str:
+        return self.bars.manifest()["hash"]
+
+    @classmethod
+    def for_bars(cls, bars) -> "IndicatorCache":
+        """Instância compartilhada por dataset (LRU com as últimas `_shared_max`)."""
+        bars = BarSeries.from_records(bars)
+        key = bars.manifest()["hash"]
+        with cls._shared_lock:
+            cache = cls._shared.get(key)
+            if cache is None:
+                cache = cls._shared[key] = cls(bars)
+                while len(cls._shared) > cls._shared_max:
+                    cls._shared.popitem(last=False)
+            cls._shared.move_to_end(key)
+            return cache
+
+    @staticmethod
+    def key(params: Dict[str, Any]) -> Tuple[int, int, float]:
+        return (int(params["ema_period"]), int(params["atr_period"]), float(params["keltner_mult"]))
+
+    def keltner(self, params: Dict[str, Any]) -> Dict[str, np.ndarray]:
+        k = self.key(params)
+        cols = self._keltner.get(k)
+        if cols is None:
+            b = self.bars
+            upper, lower, mid, a = keltner_channels_np(b.col("close"), b.col("high"), b.col("low"), *k)
+            slope = np.zeros_like(mid)
+            slope[1:] = np.diff(mid)
+            cols = {"kc_upper": upper, "kc_lower": lower, "kc_mid": mid, "kc_slope": slope, "atr": a}
+            self._keltner[k] = cols
+        return cols
+
+    def annotate(self, params: Dict[str, Any]) -> BarSeries:
+        """Série com as colunas de Keltner anexadas (sem copiar OHLCV)."""
+        return self.bars.with_columns(**self.keltner(params))
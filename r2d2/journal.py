@@ -0,0 +1,427 @@
+# r2d2/journal.py
+from __future__ import annotations
+from typing import Any, Dict, List, Optional, Tuple
+import atexit
+import json
+import os
+import threading
+import time
+import uuid
+
+try:
+    import fcntl
+except ImportError:  # Windows: sem trava entre processos
+    fcntl = None
+
+from r2d2.config import CONFIG
+from r2d2.utils.logger import get_logger
+
+log = get_logger("journal")
+
+_EXT = ".log"
+_DEAD = "dead-letter.jsonl"
+# classes SQLSTATE que não passam com nova tentativa: dado inválido (22),
+# restrição (23), sintaxe/coluna/tabela inexistente (42)
+_PERMANENT_SQLSTATE = ("22", "23", "42")
+
+
+def is_permanent_error(e: Exception) -> bool:
+    """
+    Rejeição que reenviar não resolve (a linha é o problema): erro de
+    serialização local, HTTP 4xx (menos 401/403/408/429), SQLSTATE de dado/
+    restrição/schema e erros de requisição/schema do PostgREST (PGRST1xx/
+    2xx). Rede, 5xx, timeouts, conexão, credencial (401/403) e JWT
+    (PGRST3xx) são transitórios: chave errada não é culpa da linha.
+    """
+    if isinstance(e, (ValueError, TypeError)) and not hasattr(e, "code"):
+        return True
+    code = str(getattr(e, "code", "") or "")
+    if code.isdigit() and len(code) == 3:
+        return code.startswith("4") and code not in ("401", "403", "408", "429")
+    if code.startswith("PGRST"):
+        return code[5:6] in ("1", "2")
+    return len(code) == 5 and code[:2] in _PERMANENT_SQLSTATE
+
+
+class Journal:
+    """
+    Diário local append-only (write-ahead) da telemetria do live: cada
+    registro é uma linha JSON {"s": seq, "t": tabela, "r": linha} em
+    segmentos <root>/<primeiro seq>.log.
+
+    - append() só escreve no buffer do arquivo (microssegundos); uma thread
+      faz flush + fsync a cada `fsync_interval` s (group commit): uma queda
+      perde no máximo esse intervalo, nunca corrompe o que já foi gravado;
+    - segmento novo ao passar de `segment_bytes`; os já enviados são
+      apagados pelo JournalUploader;
+    - só o trecho já sincronizado (durable_size) é entregue a quem lê: o
+      seq de um registro enviado nunca é reaproveitado depois de uma queda;
+    - ao abrir, uma última linha incompleta (queda no meio da escrita) é
+      descartada e a numeração continua de onde parou.
+    O `id` (journal.json) distingue diários de máquinas diferentes; um
+    diário é de um processo só (trava em journal.lock): dois bots na mesma
+    máquina usam R2D2_DATA_DIR diferentes.
+    """
+
+    def __init__(self, root: Optional[str] = None, segment_bytes: Optional[int] = None,
+                 fsync_interval: Optional[float] = None):
+        self.root = root or os.path.join(CONFIG.data_dir, "journal", "supabase")
+        self.segment_bytes = int(segment_bytes or CONFIG.journal_segment_mb << 20)
+        self.fsync_interval = float(fsync_interval if fsync_interval is not None else CONFIG.journal_fsync_s)
+        os.makedirs(self.root, exist_ok=True)
+        self._lockf = self._acquire()
+        self.id = self._load_id()
+        self._lock = threading.Lock()
+        self._durable: Dict[str, int] = {}
+        self._seq, self._path = self._recover()
+        self._f = open(self._path, "ab")
+        self._size = self._f.tell()
+        self._durable[self._path] = self._size
+        self._dirty = False
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, daemon=True, name="journal-fsync")
+        self._thread.start()
+        atexit.register(self.close)
+
+    # ---------- abertura ----------
+    def _acquire(self):
+        f = open(os.path.join(self.root, "journal.lock"), "a")
+        if fcntl is not None:
+            try:
+                fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                f.close()
+                raise RuntimeError(f"diário {self.root} em uso por outro processo (use outro R2D2_DATA_DIR)")
+        return f
+
+    def _load_id(self) -> str:
+        p = os.path.join(self.root, "journal.json")
+        try:
+            with open(p, "r", encoding="utf-8") as f:
+                return json.load(f)["id"]
+        except (OSError, ValueError, KeyError):
+            jid = uuid.uuid4().hex[:12]
+            with open(p, "w", encoding="utf-8") as f:
+                json.dump({"id": jid}, f)
+            return jid
+
+    def _seg_path(self, first_seq: int) -> str:
+        return os.path.join(self.root, f"{first_seq:016d}{_EXT}")
+
+    def segments(self) -> List[str]:
+        return sorted(os.path.join(self.root, n) for n in os.listdir(self.root) if n.endswith(_EXT))
+
+    def _recover(self) -> Tuple[int, str]:
+        segs = self.segments()
+        for p in segs[:-1]:
+            self._durable[p] = os.path.getsize(p)
+        if not segs:
+            return 0, self._seg_path(0)
+        last = segs[-1]
+        with open(last, "rb") as f:
+            data = f.read()
+        good = data.rfind(b"\n") + 1
+        # seqs contíguos dentro do segmento: primeiro seq (nome) + linhas completas
+        next_seq = int(os.path.basename(last)[:-len(_EXT)]) + data.count(b"\n", 0, good)
+        if good < len(data):
+            log.warning(f"{last}: {len(data) - good} bytes de registro incompleto descartados")
+            with open(last, "r+b") as f:
+                f.truncate(good)
+        return next_seq, last
+
+    # ---------- escrita ----------
+    def append(self, table: str, row: Dict[str, Any]) -> int:
+        """Registra a linha e devolve o seq; durável em até fsync_interval s."""
+        # serializa fora do lock; o seq entra na frente já com o lock
+        body = json.dumps({"t": table, "r": row}, default=str, separators=(",", ":"))
+        with self._lock:
+            seq = self._seq
+            data = f'{{"s":{seq},{body[1:]}\n'.encode("utf-8")
+            self._seq += 1
+            self._f.write(data)
+            self._size += len(data)
+            self._dirty = True
+            if self._size >= self.segment_bytes:
+                self._rotate()
+        return seq
+
+    def _sync_locked(self):
+        if self._dirty:
+            self._f.flush()
+            os.fsync(self._f.fileno())
+            self._dirty = False
+        self._durable[self._path] = self._size
+
+    def _rotate(self):
+        self._sync_locked()
+        self._f.close()
+        self._path = self._seg_path(self._seq)
+        self._f = open(self._path, "ab")
+        self._size = 0
+        self._durable[self._path] = 0
+
+    def sync(self):
+        """flush + fsync agora (o group commit faz isso sozinho a cada fsync_interval)."""
+        with self._lock:
+            if not self._closed:
+                self._sync_locked()
+
+    def _run(self):
+        while not self._closed:
+            time.sleep(self.fsync_interval)
+            try:
+                self.sync()
+            except Exception as e:
+                log.error(f"fsync do diário falhou: {e}")
+
+    def close(self):
+        with self._lock:
+            if self._closed:
+                return
+            self._sync_locked()
+            self._f.close()
+            self._lockf.close()
+            self._closed = True
+
+    # ---------- leitura ----------
+    @property
+    def current(self) -> str:
+        return self._path
+
+    def durable_size(self, path: str) -> int:
+        with self._lock:
+            return self._durable.get(path, 0)
+
+    def read(self, path: str, offset: int, max_records: int = 1000) -> Tuple[List[Dict[str, Any]], int]:
+        """Registros sincronizados de `path` a partir de `offset` (bytes) e o offset seguinte."""
+        end = self.durable_size(path)
+        if offset >= end:
+            return [], offset
+        with open(path, "rb") as f:
+            f.seek(offset)
+            data = f.read(end - offset)
+        out, pos = [], 0
+        while pos < len(data) and len(out) < max_records:
+            nl = data.find(b"\n", pos)
+            if nl < 0:
+                break
+            out.append(json.loads(data[pos:nl]))
+            pos = nl + 1
+        return out, offset + pos
+
+    def forget(self, path: str):
+        """Apaga um segmento fechado (já enviado)."""
+        if path == self._path:
+            return
+        with self._lock:
+            self._durable.pop(path, None)
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+class JournalUploader:
+    """
+    Envia o diário ao Supabase em segundo plano, em ordem, com um marcador
+    (<root>/uploaded.json: segmento + offset) que só avança depois de o lote
+    ser aceito. Exatamente uma vez: cada linha leva journal_id =
+    "<id do diário>:<seq>" e vai por upsert ignorando duplicatas, então o
+    lote reenviado após uma queda entre o insert e o marcador não duplica
+    (requer a coluna journal_id com índice único; sem ela vira insert
+    simples, pelo menos uma vez). Supabase fora do ar: o diário acumula e o
+    envio recomeça com backoff até 60s.
+
+    Rejeição permanente (is_permanent_error: linha malformada, NaN no JSON,
+    valor fora do tipo...): o lote é bisseccionado até o registro culpado,
+    que vai para <root>/dead-letter.jsonl (com o erro) e conta em
+    stats["dead"]; o resto segue e o marcador avança. Sem isso um registro
+    ruim travaria tudo o que vem depois. Só vai para o dead-letter o
+    registro recusado ao lado de outros da mesma tabela aceitos; se a tabela
+    recusa todos (coluna/tabela que não existe, permissão), o lote fica no
+    diário e volta com backoff.
+    """
+
+    def __init__(self, journal: Journal, store, batch_rows: int = 500, interval: float = 1.0):
+        self.journal = journal
+        self.store = store
+        self.batch_rows = int(batch_rows)
+        self.interval = float(interval)
+        self.stats: Dict[str, int] = {"uploaded": 0, "batches": 0, "errors": 0, "dead": 0}
+        self._marker_path = os.path.join(journal.root, "uploaded.json")
+        self._wake = threading.Event()
+        self._stop = False
+        self._thread = threading.Thread(target=self._run, daemon=True, name="journal-upload")
+        self._thread.start()
+
+    # ---------- marcador ----------
+    def marker(self) -> Tuple[str, int]:
+        try:
+            with open(self._marker_path, "r", encoding="utf-8") as f:
+                m = json.load(f)
+            return os.path.join(self.journal.root, m["segment"]), int(m["offset"])
+        except (OSError, ValueError, KeyError):
+            segs = self.journal.segments()
+            return (segs[0] if segs else self.journal.current), 0
+
+    def _save_marker(self, path: str, offset: int):
+        tmp = self._marker_path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"segment": os.path.basename(path), "offset": int(offset)}, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self._marker_path)
+
+    # ---------- envio ----------
+    def _ship(self, records: List[Dict[str, Any]]):
+        by_table: Dict[str, List[Dict[str, Any]]] = {}
+        for rec in records:
+            by_table.setdefault(rec["t"], []).append({**rec["r"], "journal_id": f"{self.journal.id}:{rec['s']}"})
+        for table, rows in by_table.items():
+            self.store._insert(table, rows, on_conflict="journal_id")
+
+    def _ship_isolating(self, records: List[Dict[str, Any]]):
+        """
+        _ship com rejeição permanente isolada por bissecção: metades aceitas
+        são gravadas (o upsert por journal_id absorve o reenvio), e os
+        registros isolados vão para o dead-letter, mas só se outro registro
+        da mesma tabela passou neste lote: é isso que prova que a culpa é da
+        linha e não da tabela/schema/credencial. Lote em que a tabela recusa
+        tudo até o registro único sobe o erro (backoff, nada é descartado).
+        Erro transitório sobe (o lote todo é tentado de novo depois).
+        """
+        accepted: Dict[str, int] = {}
+        culprits: List[Tuple[Dict[str, Any], Exception]] = []
+        self._bisect(records, accepted, culprits)
+        for rec, e in culprits:
+            if not accepted.get(rec["t"]):
+                raise e
+        for rec, e in culprits:
+            self._dead_letter(rec, e)
+
+    def _bisect(self, records: List[Dict[str, Any]], accepted: Dict[str, int],
+                culprits: List[Tuple[Dict[str, Any], Exception]]):
+        try:
+            self._ship(records)
+        except Exception as e:
+            if not is_permanent_error(e):
+                raise
+            if len(records) == 1:
+                culprits.append((records[0], e))
+                return
+            mid = len(records) // 2
+            self._bisect(records[:mid], accepted, culprits)
+            self._bisect(records[mid:], accepted, culprits)
+            return
+        for rec in records:
+            accepted[rec["t"]] = accepted.get(rec["t"], 0) + 1
+
+    def _dead_letter(self, rec: Dict[str, Any], e: Exception):
+        line = json.dumps({**rec, "error": f"{type(e).__name__}: {e}"}, default=str, separators=(",", ":"))
+        with open(os.path.join(self.journal.root, _DEAD), "a", encoding="utf-8") as f:
+            f.write(line + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        self.stats["dead"] += 1
+        log.error(f"registro {rec['s']} ({rec['t']}) rejeitado pelo Supabase e movido para {_DEAD}: {e}")
+
+    def step(self) -> int:
+        """Envia um lote a partir do marcador; devolve quantos registros (0 = em dia)."""
+        path, offset = self.marker()
+        if not os.path.exists(path):
+            # segmento apagado depois do marcador salvo: segue para o próximo
+            later = [p for p in self.journal.segments() if p > path]
+            if not later:
+                return 0
+            path, offset = later[0], 0
+            self._save_marker(path, offset)
+        records, new_offset = self.journal.read(path, offset, self.batch_rows)
+        if records:
+            dead = self.stats["dead"]
+            self._ship_isolating(records)
+            self._save_marker(path, new_offset)
+            self.stats["uploaded"] += len(records) - (self.stats["dead"] - dead)
+            self.stats["batches"] += 1
+            return len(records)
+        if path != self.journal.current and new_offset >= self.journal.durable_size(path):
+            later = [p for p in self.journal.segments() if p > path]
+            if later:
+                self._save_marker(later[0], 0)
+                self.journal.forget(path)
+                return self.step()
+        return 0
+
+    def _run(self):
+        backoff = self.interval
+        while not self._stop:
+            try:
+                n = self.step()
+                backoff = self.interval
+            except Exception as e:
+                self.stats["errors"] += 1
+                log.warning(f"envio do diário ao Supabase falhou ({e}); nova tentativa em {backoff:.1f}s")
+                self._wake.wait(backoff)
+                self._wake.clear()
+                backoff = min(60.0, backoff * 2)
+                continue
+            if n:
+                continue
+            self._wake.wait(self.interval)
+            self._wake.clear()
+
+    def drain(self, timeout: Optional[float] = 30.0) -> bool:
+        """Sincroniza o diário e espera o envio alcançá-lo (False se não deu no prazo)."""
+        self.journal.sync()
+        self._wake.set()
+        deadline = time.monotonic() + (timeout or 0)
+        while True:
+            path, offset = self.marker()
+            if path == self.journal.current and offset >= self.journal.durable_size(path):
+                return True
+            if timeout is not None and time.monotonic() >= deadline:
+                return False
+            time.sleep(0.05)
+
+    def stop(self):
+        self._stop = True
+        self._wake.set()
+        self._thread.join(5.0)
+
+
+class JournalWriter:
+    """
+    Mesma interface do SupabaseWriter (put/flush/close/stats), mas durável:
+    put() grava no diário local e o JournalUploader envia depois. Nada se
+    perde com o Supabase lento ou fora do ar; o limite é o disco.
+    """
+
+    def __init__(self, store, root: Optional[str] = None, batch_rows: Optional[int] = None,
+                 interval: Optional[float] = None, segment_bytes: Optional[int] = None,
+                 fsync_interval: Optional[float] = None):
+        self.journal = Journal(root, segment_bytes=segment_bytes, fsync_interval=fsync_interval)
+        self.uploader = JournalUploader(self.journal, store, batch_rows=batch_rows or CONFIG.sb_batch_size,
+                                        interval=interval if interval is not None else CONFIG.sb_flush_s)
+        self._closed = False
+        atexit.register(self.close)
+
+    @property
+    def stats(self) -> Dict[str, int]:
+        return {"journaled": self.journal._seq, **self.uploader.stats}
+
+    def put(self, table: str, row: Dict[str, Any]) -> bool:
+        if self._closed:
+            return False
+        self.journal.append(table, row)
+        return True
+
+    def flush(self, timeout: Optional[float] = 30.0) -> bool:
+        return self.uploader.drain(timeout)
+
+    def close(self, timeout: Optional[float] = 10.0):
+        """Tenta esvaziar o diário no Supabase; o que sobrar é enviado na próxima execução."""
+        if self._closed:
+            return
+        self._closed = True
+        self.uploader.drain(timeout)
+        self.uploader.stop()
+        self.journal.close()
@@ -0,0 +1,291 @@
+# r2d2/kline_stream.py
+from __future__ import annotations
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+import asyncio
+import json
+import time
+
+import ccxt
+
+from r2d2.bybit_rest import BybitRest, get_rest
+from r2d2.supabase_store import ohlcv_symbol
+from r2d2.trade_bars import BYBIT_WS_PUBLIC, BYBIT_WS_PUBLIC_TESTNET
+from r2d2.utils.logger import get_logger
+
+log = get_logger("kline_stream")
+
+# timeframe ccxt -> intervalo da API v5 (REST e tópico kline.<intervalo>.<SYMBOL>)
+BYBIT_INTERVALS = {
+    "1m": "1", "3m": "3", "5m": "5", "15m": "15", "30m": "30",
+    "1h": "60", "2h": "120", "4h": "240", "6h": "360", "12h": "720",
+    "1d": "D", "1w": "W",
+}
+_BACKFILL_PAGE = 1000
+_SUBSCRIBE_CHUNK = 10       # tópicos por mensagem de subscribe (limite da Bybit)
+
+
+def _tf_ms(timeframe: str) -> int:
+    return int(ccxt.Exchange.parse_timeframe(timeframe) * 1000)
+
+
+class KlineStream:
+    """
+    Fonte de candles FECHADOS para o modo live: `bars()` é um iterador
+    assíncrono de dicts {ts, open, high, low, close, volume}, em ordem de ts
+    e sem repetição. Implementações: PollingKlineStream (qualquer
+    ExchangeAPI, via REST) e BybitKlineStream (WebSocket).
+    """
+
+    def __init__(self, symbol: str, timeframe: str):
+        self.symbol = symbol
+        self.timeframe = timeframe
+        self.tf_ms = _tf_ms(timeframe)
+        self.last_ts: Optional[int] = None
+
+    def bars(self) -> AsyncIterator[Dict[str, Any]]:
+        raise NotImplementedError
+
+    def _accept(self, bar: Dict[str, Any]) -> bool:
+        """Descarta candles já entregues (sobreposição do backfill, reenvio após reconectar)."""
+        if self.last_ts is not None and bar["ts"] <= self.last_ts:
+            return False
+        self.last_ts = int(bar["ts"])
+        return True
+
+
+class PollingKlineStream(KlineStream):
+    """
+    Polling de get_ohlcv() a cada `interval` segundos. O último candle da
+    resposta ainda está aberto: só os anteriores são entregues.
+    """
+
+    def __init__(self, exchange, symbol: str, timeframe: str, interval: float = 20.0, limit: int = 3):
+        super().__init__(symbol, timeframe)
+        self.exchange = exchange
+        self.interval = float(interval)
+        self.limit = int(limit)
+
+    async def bars(self) -> AsyncIterator[Dict[str, Any]]:
+        while True:
+            try:
+                rows = await asyncio.to_thread(self.exchange.get_ohlcv, self.symbol, self.timeframe, self.limit)
+                for bar in rows[:-1]:
+                    if self._accept(bar):
+                        yield bar
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                log.warning(f"polling de {self.symbol} {self.timeframe} falhou: {e}")
+            await asyncio.sleep(self.interval)
+
+
+class BybitKlineMux:
+    """
+    Vários símbolos num WebSocket público v5 só (aiohttp): um tópico
+    kline.<intervalo>.<SYMBOL> por símbolo, e `events()` rende (symbol, bar)
+    na ordem em que os candles fecham. A Bybit empurra o candle em formação
+    várias vezes por segundo; só os com confirm=true (fechados) são
+    entregues, logo no fechamento.
+
+    - heartbeat: {"op": "ping"} a cada `ping_interval` s (a Bybit derruba
+      conexões mudas) mais o ping de protocolo do aiohttp; sem nenhuma
+      mensagem por `stale_after` s a conexão é tida como morta;
+    - reconexão automática com backoff exponencial (até 30s);
+    - backfill: ao reconectar (todos os símbolos, em paralelo no pool do
+      BybitRest), e sempre que um candle chega pulando outros, o buraco
+      desde o último entregue é buscado em /v5/market/kline.
+
+    `url` e `rest` podem apontar para dublês locais (testes/replay).
+    """
+
+    def __init__(self, symbols: List[str], timeframe: str, testnet: bool = False, url: Optional[str] = None,
+                 rest: Optional[BybitRest] = None, ping_interval: float = 20.0,
+                 stale_after: Optional[float] = None, reconnect_delay: float = 1.0, backfill: bool = True):
+        if timeframe not in BYBIT_INTERVALS:
+            raise ValueError(f"timeframe sem kline na Bybit: {timeframe}")
+        self.symbols = list(symbols)
+        self.timeframe = timeframe
+        self.tf_ms = _tf_ms(timeframe)
+        self.interval = BYBIT_INTERVALS[timeframe]
+        self.topics = {f"kline.{self.interval}.{ohlcv_symbol(s)}": s for s in self.symbols}
+        self.url = url or (BYBIT_WS_PUBLIC_TESTNET if testnet else BYBIT_WS_PUBLIC)
+        self._rest = rest
+        self.ping_interval = float(ping_interval)
+        self.stale_after = float(stale_after if stale_after is not None else 3 * ping_interval)
+        self.reconnect_delay = float(reconnect_delay)
+        self.backfill = backfill
+        self.last_ts: Dict[str, int] = {}
+        self.reconnects = 0
+        self.backfilled = 0
+
+    @property
+    def rest(self) -> BybitRest:
+        return self._rest or get_rest()
+
+    def _accept(self, symbol: str, bar: Dict[str, Any]) -> bool:
+        last = self.last_ts.get(symbol)
+        if last is not None and bar["ts"] <= last:
+            return False
+        self.last_ts[symbol] = int(bar["ts"])
+        return True
+
+    # ---------- backfill REST ----------
+    def _fetch_gap(self, symbol: str, start_ms: int, end_ms: int) -> List[Dict[str, Any]]:
+        """Candles FECHADOS com ts em [start_ms, end_ms)."""
+        now_ms = int(time.time() * 1000)
+        out: List[Dict[str, Any]] = []
+        start = int(start_ms)
+        while start < end_ms:
+            rows = self.rest.kline(ohlcv_symbol(symbol), start, int(end_ms) - 1,
+                                   interval=self.interval, limit=_BACKFILL_PAGE)
+            if not rows:
+                break
+            for r in rows:
+                ts = int(r[0])
+                if start_ms <= ts < end_ms and ts + self.tf_ms <= now_ms:
+                    out.append({"ts": ts, "open": float(r[1]), "high": float(r[2]), "low": float(r[3]),
+                                "close": float(r[4]), "volume": float(r[5])})
+            nxt = int(rows[-1][0]) + self.tf_ms
+            if nxt <= start or len(rows) < _BACKFILL_PAGE:
+                break
+            start = nxt
+        return out
+
+    async def _backfill(self, symbols: List[str], end_ms: int) -> List[Tuple[str, Dict[str, Any]]]:
+        if not self.backfill:
+            return []
+        jobs = [(s, self.last_ts[s] + self.tf_ms) for s in symbols
+                if s in self.last_ts and end_ms > self.last_ts[s] + self.tf_ms]
+        if not jobs:
+            return []
+
+        def _one(job):
+            s, start = job
+            try:
+                return s, self._fetch_gap(s, start, end_ms)
+            except Exception as e:
+                log.warning(f"backfill de {s} {self.timeframe} falhou: {e}")
+                return s, []
+
+        fetched = await asyncio.to_thread(self.rest.map, _one, jobs)
+        events = sorted(((s, b) for s, rows in fetched for b in rows), key=lambda e: e[1]["ts"])
+        events = [(s, b) for s, b in events if self._accept(s, b)]
+        if events:
+            self.backfilled += len(events)
+            log.info(f"kline {self.timeframe}: {len(events)} candles recuperados via REST "
+                     f"({len({s for s, _ in events})} símbolos)")
+        return events
+
+    # ---------- WebSocket ----------
+    @staticmethod
+    def parse(item: Dict[str, Any]) -> Dict[str, Any]:
+        return {"ts": int(item["start"]), "open": float(item["open"]), "high": float(item["high"]),
+                "low": float(item["low"]), "close": float(item["close"]), "volume": float(item["volume"])}
+
+    async def _ping(self, ws):
+        while True:
+            await asyncio.sleep(self.ping_interval)
+            await ws.send_str(json.dumps({"op": "ping"}))
+
+    async def _subscribe(self, ws):
+        topics = list(self.topics)
+        for i in range(0, len(topics), _SUBSCRIBE_CHUNK):
+            await ws.send_str(json.dumps({"op": "subscribe", "args": topics[i:i + _SUBSCRIBE_CHUNK]}))
+
+    async def events(self) -> AsyncIterator[Tuple[str, Dict[str, Any]]]:
+        import aiohttp
+
+        delay = self.reconnect_delay
+        while True:
+            pinger = None
+            try:
+                async with aiohttp.ClientSession() as session:
+                    async with session.ws_connect(self.url, heartbeat=self.ping_interval) as ws:
+                        await self._subscribe(ws)
+                        pinger = asyncio.create_task(self._ping(ws))
+                        delay = self.reconnect_delay
+                        # assinado antes do backfill: o que fechar durante a
+                        # consulta REST fica no buffer do socket e é deduplicado
+                        for ev in await self._backfill(self.symbols, int(time.time() * 1000)):
+                            yield ev
+                        loop = asyncio.get_running_loop()
+                        deadline = loop.time() + self.stale_after
+                        while True:
+                            # prazo contado só em mensagens de texto: os pongs de
+                            # protocolo (que o receive() engole reiniciando o
+                            # timeout dele) não provam que o tópico anda
+                            msg = await asyncio.wait_for(ws.receive(), max(0.0, deadline - loop.time()))
+                            if msg.type != aiohttp.WSMsgType.TEXT:
+                                if msg.type in (aiohttp.WSMsgType.CLOSE, aiohttp.WSMsgType.CLOSED,
+                                                aiohttp.WSMsgType.CLOSING, aiohttp.WSMsgType.ERROR):
+                                    break
+                                continue
+                            deadline = loop.time() + self.stale_after
+                            body = json.loads(msg.data)
+                            symbol = self.topics.get(body.get("topic"))
+                            if symbol is None:
+                                if body.get("op") == "subscribe" and body.get("success") is False:
+                                    raise RuntimeError(f"assinatura recusada: {body.get('ret_msg')}")
+                                continue
+                            for item in body.get("data", []):
+                                if not item.get("confirm"):
+                                    continue
+                                bar = self.parse(item)
+                                for ev in await self._backfill([symbol], bar["ts"]):
+                                    yield ev
+                                if self._accept(symbol, bar):
+                                    yield symbol, bar
+            except asyncio.CancelledError:
+                raise
+            except asyncio.TimeoutError:
+                log.warning(f"stream kline {self.timeframe} mudo por {self.stale_after:.0f}s; reconectando")
+            except Exception as e:
+                log.warning(f"stream kline {self.timeframe} caiu: {e}; reconectando em {delay:.0f}s")
+            finally:
+                if pinger is not None:
+                    pinger.cancel()
+            self.reconnects += 1
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, 30.0)
+
+
+class BybitKlineStream(KlineStream):
+    """Um símbolo só do BybitKlineMux (mesmos parâmetros), na interface KlineStream."""
+
+    def __init__(self, symbol: str, timeframe: str, **kwargs):
+        super().__init__(symbol, timeframe)
+        self.mux = BybitKlineMux([symbol], timeframe, **kwargs)
+        self.topic = next(iter(self.mux.topics))
+
+    @property
+    def reconnects(self) -> int:
+        return self.mux.reconnects
+
+    @property
+    def backfilled(self) -> int:
+        return self.mux.backfilled
+
+    async def bars(self) -> AsyncIterator[Dict[str, Any]]:
+        async for _, bar in self.mux.events():
+            self.last_ts = bar["ts"]
+            yield bar
+
+
+async def merge_streams(streams: Dict[str, KlineStream]) -> AsyncIterator[Tuple[str, Dict[str, Any]]]:
+    """
+    (symbol, bar) de vários KlineStream independentes (exchanges sem
+    multiplexação nativa, ex.: polling): uma task por stream numa fila só.
+    """
+    q: asyncio.Queue = asyncio.Queue(maxsize=1000)
+
+    async def _pump(symbol: str, stream: KlineStream):
+        async for bar in stream.bars():
+            await q.put((symbol, bar))
+
+    tasks = [asyncio.create_task(_pump(s, st)) for s, st in streams.items()]
+    try:
+        while True:
+            yield await q.get()
+    finally:
+        for t in tasks:
+            t.cancel()
@@ -1,6 +1,9 @@
 # r2d2/live_trader.py
 import time
-from typing import Dict, Any
+import queue
+import asyncio
+import threading
+from typing import Dict, Any, Iterable, Optional
 from r2d2.config import CONFIG, AppConfig
 from r2d2.bybit_exchange import BybitCCXT
 from r2d2.exchange_api import ExchangeAPI
@@ -11,6 +14,8 @@ from r2d2.control_loop import ControlLoop
 from r2d2.strategy.base_strategy import Signal
 from r2d2.utils.logger import get_logger
 from r2d2.supabase_store import SupabaseStore
+from r2d2.kline_stream import KlineStream, PollingKlineStream
+from r2d2.trade_bars import TradeBarAggregator, TradeRecorder, bybit_trade_stream, is_trade_spec
 
 log = get_logger("live")
 
@@ -20,10 +25,36 @@ _TIMEFRAME_SECONDS = {
     "1h": 3600, "2h": 7200, "4h": 14400, "1d": 86400
 }
 
+# margem para trades atrasados antes de o relógio fechar uma barra de tempo
+_TRADE_GRACE_MS = 250
+_END = object()
+
+
 class LiveTrader:
-    def __init__(self, cfg: AppConfig = CONFIG, poll_interval: int | None = None):
+    """
+    Timeframes da Bybit (1m+) vêm do stream de klines da exchange
+    (feed="ws": WebSocket, candle entregue no fechamento) ou de polling REST
+    (feed="poll", a cada poll_interval s). "1s" e barras por atividade
+    (tick:N, vol:N, dollar:N) saem do stream público de trades, agregado
+    localmente (TradeBarAggregator); record_trades grava esse stream em CSV
+    para replay.
+
+    exchange/sb permitem compartilhar o cliente ccxt e o Supabase entre
+    vários traders no mesmo processo (MultiLiveTrader); max_bars limita o
+    histórico de candles guardado em memória (None = sem limite).
+    """
+
+    def __init__(self, cfg: AppConfig = CONFIG, poll_interval: int | None = None,
+                 record_trades: Optional[str] = None, feed: str = "ws",
+                 exchange: Optional[ExchangeAPI] = None, sb: Optional[SupabaseStore] = None,
+                 max_bars: Optional[int] = None):
+        if feed not in ("ws", "poll"):
+            raise ValueError(f"feed inválido: {feed} (use 'ws' ou 'poll')")
         self.cfg = cfg
-        self.exchange: ExchangeAPI = self._load_exchange()
+        self.feed = feed
+        self.record_trades = record_trades
+        self.max_bars = max_bars
+        self.exchange: ExchangeAPI = exchange or self._load_exchange()
         self.sm = StrategyManager(cfg.strategy, params=self._build_params(cfg))
         self.strategy = self.sm.get()
         self.pm = PositionManager()
@@ -48,14 +79,18 @@ class LiveTrader:
             interval_bars=60,
         )
 
+        # ordens enviadas e ainda sem confirmação (só o AsyncLiveTrader tem > 0)
+        self._pending_orders = 0
+
         # Supabase
-        self.sb = SupabaseStore()
-        if self.sb.enabled:
-            self.sb.log_event("startup", {
-                "symbol": cfg.symbol,
-                "tf": cfg.timeframe,
-                "testnet": cfg.bybit_testnet
-            })
+        self.sb = sb or SupabaseStore()
+        # log_event/log_order/log_snapshot só enfileiram; uma thread grava em lotes
+        self.sb.start_writer()
+        self._persist("log_event", "startup", {
+            "symbol": cfg.symbol,
+            "tf": cfg.timeframe,
+            "testnet": cfg.bybit_testnet
+        })
 
     def _load_exchange(self) -> ExchangeAPI:
         if self.cfg.exchange == "bybit":
@@ -76,80 +111,187 @@ class LiveTrader:
             "min_ema_slope_points": cfg.strat_params.min_ema_slope_points,
         }
 
-    def run(self):
+    def run(self, trade_source: Optional[Iterable] = None, kline_stream: Optional[KlineStream] = None):
+        """
+        Loop principal. trade_source (lotes (ts, price, size), ex.:
+        trade_bars.replay_trade_batches) substitui o stream ao vivo nas
+        barras de trades; kline_stream substitui o da exchange (ex.:
+        BybitKlineStream apontando para um WebSocket local).
+        """
+        if trade_source is not None or is_trade_spec(self.cfg.timeframe):
+            return self._run_trades(trade_source)
+        stream = kline_stream or self._kline_stream()
         log.info(
             f"Iniciando R2D2 Live | symbol={self.cfg.symbol} tf={self.cfg.timeframe} "
-            f"exchange={self.cfg.exchange} testnet={self.cfg.bybit_testnet} poll={self.poll_interval}s"
+            f"exchange={self.cfg.exchange} testnet={self.cfg.bybit_testnet} feed={type(stream).__name__}"
         )
         i = 0
-        last_ts = None
+        try:
+            for bar in self._iter_async(stream.bars, "kline-stream"):
+                try:
+                    self._on_bar(bar, i)
+                    i += 1
+                except Exception as e:
+                    self._on_error(e)
+        except KeyboardInterrupt:
+            self._shutdown()
+
+    def _kline_stream(self) -> KlineStream:
+        if self.feed == "poll":
+            return PollingKlineStream(self.exchange, self.cfg.symbol, self.cfg.timeframe, interval=self.poll_interval)
+        return self.exchange.kline_stream(self.cfg.symbol, self.cfg.timeframe, poll_interval=self.poll_interval)
+
+    @staticmethod
+    def _iter_async(make_iter, name: str, poll: Optional[float] = None):
+        """
+        Consome um iterador assíncrono (streams da exchange) numa thread com
+        event loop próprio, entregando os itens a este loop síncrono. Com
+        `poll`, rende None a cada `poll` s sem item. Erro fatal do stream é
+        relançado aqui.
+        """
+        q: "queue.Queue" = queue.Queue(maxsize=10_000)
+
+        async def _pump():
+            async for item in make_iter():
+                q.put(item)
+
+        def _run():
+            try:
+                asyncio.run(_pump())
+                q.put(_END)
+            except BaseException as e:
+                q.put(e)
 
+        threading.Thread(target=_run, daemon=True, name=name).start()
         while True:
             try:
-                bars = self.exchange.get_ohlcv(self.cfg.symbol, self.cfg.timeframe, limit=2)
-                if not bars:
-                    time.sleep(self.poll_interval)
-                    continue
-
-                bar = bars[-1]
-                if last_ts is not None and bar["ts"] == last_ts:
-                    time.sleep(self.poll_interval)
-                    continue
-
-                self.bars_ref.append(bar)
-                last_ts = bar["ts"]
-                price = bar["close"]
-                log.info(
-                    f"New Candle | ts={bar['ts']} O={bar['open']} H={bar['high']} "
-                    f"L={bar['low']} C={bar['close']} V={bar.get('volume',0)}"
-                )
-
-                if self.sb.enabled:
-                    snapshot = {
-                        "equity": self.equity,
-                        "position": {
-                            "side": self.pm.pos.side,
-                            "qty": self.pm.pos.qty,
-                            "entry": self.pm.pos.entry,
-                            "stop": self.pm.pos.stop,
-                            "take": self.pm.pos.take,
-                        } if not self.pm.flat() else None,
-                    }
-                    self.sb.log_snapshot(snapshot)
-
-                pnl_stop = self.pm.check_stops(price)
-                if pnl_stop is not None:
-                    self._apply_pnl(pnl_stop)
-
-                ctx_pos = 0 if self.pm.flat() else (1 if self.pm.pos.side == "LONG" else -1)
-                sig = self.strategy.on_bar(bar, {"position": ctx_pos})
-
-                if self.rm.can_trade():
-                    self._handle_signal(sig, price, bar)
-
-                if self.cfg.risk.use_break_even and not self.pm.flat():
-                    moved = abs(price - self.pm.pos.entry)
-                    r_points = abs(self.pm.pos.entry - self.pm.pos.stop)
-                    if r_points > 0 and moved >= self.cfg.risk.break_even_r * r_points:
-                        self.pm.move_to_breakeven(price)
-
-                upd = self.ctrl.maybe_update(i)
-                if upd.get("applied"):
-                    log.info(f"Overrides aplicados: {upd['applied']}")
-
-                i += 1
-                time.sleep(self.poll_interval)
-
-            except KeyboardInterrupt:
-                log.info("Encerrando R2D2 Live (Ctrl+C).")
-                if self.sb.enabled:
-                    self.sb.log_event("shutdown", {"equity": self.equity})
-                break
-            except Exception as e:
-                log.error(f"Erro no loop live: {e}")
-                if self.sb.enabled:
-                    self.sb.log_event("error", {"msg": str(e)})
-                time.sleep(self.poll_interval)
+                item = q.get(timeout=poll or 1.0)
+            except queue.Empty:
+                if poll:
+                    yield None
+                continue
+            if item is _END:
+                return
+            if isinstance(item, BaseException):
+                raise item
+            yield item
+
+    def _shutdown(self):
+        log.info("Encerrando R2D2 Live (Ctrl+C).")
+        self._persist("log_event", "shutdown", {"equity": self.equity})
+        self.sb.close_writer()
+
+    def _on_error(self, e: Exception):
+        log.error(f"Erro no loop live: {e}")
+        self._persist("log_event", "error", {"msg": str(e)})
+
+    # ---------- pontos de extensão (síncronos aqui; filas no AsyncLiveTrader) ----------
+    def _persist(self, method: str, *args):
+        """SupabaseStore.<method>(*args) se estiver ativo (com o writer ligado, só enfileira)."""
+        if self.sb.enabled:
+            getattr(self.sb, method)(*args)
+
+    def _submit_order(self, intent: Dict[str, Any]):
+        """Envia a ordem e aplica a confirmação na hora."""
+        self._on_order_ack(intent, self._place(intent))
+
+    def _control(self, i: int):
+        upd = self.ctrl.maybe_update(i)
+        if upd.get("applied"):
+            log.info(f"Overrides aplicados: {upd['applied']}")
+
+    def _on_bar(self, bar: Dict[str, Any], i: int):
+        """Processa um candle fechado (stops, sinal, break-even, control loop)."""
+        self.bars_ref.append(bar)
+        if self.max_bars and len(self.bars_ref) > 2 * self.max_bars:
+            del self.bars_ref[:-self.max_bars]
+        price = bar["close"]
+        log.info(
+            f"New Candle | ts={bar['ts']} O={bar['open']} H={bar['high']} "
+            f"L={bar['low']} C={bar['close']} V={bar.get('volume',0)}"
+        )
+
+        if self.sb.enabled:
+            snapshot = {
+                "equity": self.equity,
+                "position": {
+                    "side": self.pm.pos.side,
+                    "qty": self.pm.pos.qty,
+                    "entry": self.pm.pos.entry,
+                    "stop": self.pm.pos.stop,
+                    "take": self.pm.pos.take,
+                } if not self.pm.flat() else None,
+            }
+            self._persist("log_snapshot", snapshot)
+
+        pnl_stop = self.pm.check_stops(price)
+        if pnl_stop is not None:
+            self._apply_pnl(pnl_stop)
+
+        ctx_pos = 0 if self.pm.flat() else (1 if self.pm.pos.side == "LONG" else -1)
+        sig = self.strategy.on_bar(bar, {"position": ctx_pos})
+
+        if self.rm.can_trade() and not self._pending_orders:
+            self._handle_signal(sig, price, bar)
+
+        if self.cfg.risk.use_break_even and not self.pm.flat():
+            moved = abs(price - self.pm.pos.entry)
+            r_points = abs(self.pm.pos.entry - self.pm.pos.stop)
+            if r_points > 0 and moved >= self.cfg.risk.break_even_r * r_points:
+                self.pm.move_to_breakeven(price)
+
+        self._control(i)
+
+    # ---------- barras a partir de trades ----------
+    def _stream_batches(self, poll: float = 0.25):
+        """
+        Lotes (ts, price, size) do WebSocket publicTrade, lido numa thread com
+        event loop próprio. Sem trade por `poll` segundos rende None, para o
+        relógio poder fechar barras de tempo em mercado parado.
+        """
+        recorder = TradeRecorder(self.record_trades) if self.record_trades else None
+
+        async def _trades():
+            async for trades in bybit_trade_stream(self.cfg.symbol, testnet=self.cfg.bybit_testnet):
+                if recorder:
+                    recorder.write(trades)
+                yield trades
+
+        for trades in self._iter_async(_trades, "trade-stream", poll):
+            if trades is None:
+                yield None
+                continue
+            yield ([t["ts"] for t in trades], [t["price"] for t in trades], [t["size"] for t in trades])
+
+    def _run_trades(self, trade_source: Optional[Iterable] = None):
+        agg = TradeBarAggregator(self.cfg.timeframe)
+        live = trade_source is None
+        log.info(
+            f"Iniciando R2D2 Live (trades) | symbol={self.cfg.symbol} barras={self.cfg.timeframe} "
+            f"exchange={self.cfg.exchange} testnet={self.cfg.bybit_testnet} "
+            f"fonte={'stream' if live else 'replay'}"
+        )
+        i = 0
+        try:
+            for batch in (self._stream_batches() if live else trade_source):
+                try:
+                    if batch is None:
+                        closed = agg.flush(now_ms=int(time.time() * 1000) - _TRADE_GRACE_MS)
+                    else:
+                        closed = agg.update_many(*batch)
+                        if live:
+                            closed += agg.flush(now_ms=int(time.time() * 1000) - _TRADE_GRACE_MS)
+                    for bar in closed:
+                        self._on_bar(bar, i)
+                        i += 1
+                except Exception as e:
+                    self._on_error(e)
+            if not live:
+                for bar in agg.flush(force=True):
+                    self._on_bar(bar, i)
+                    i += 1
+        except KeyboardInterrupt:
+            self._shutdown()
 
     def _apply_pnl(self, pnl: float):
         fee = abs(pnl) * self.cfg.commission_perc
@@ -167,6 +309,12 @@ class LiveTrader:
         print(f"Trade #{self.results['trades']}: PnL={net:.2f}, Equity={self.equity:.2f}")
 
     def _handle_signal(self, sig: str, price: float, bar: Dict[str, Any]):
+        intent = self._order_intent(sig, price, bar)
+        if intent is not None:
+            self._submit_order(intent)
+
+    def _order_intent(self, sig: str, price: float, bar: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """Ordem que o sinal pede (entrada com SL/TP ou saída reduce-only), ou None."""
         if sig in (Signal.BUY, Signal.SELL) and self.pm.flat():
             atr_points = bar.get("atr", self.cfg.strat_params.atr_period)
             stop_points = max(1.0, self.cfg.strat_params.sl_atr_mult * atr_points)
@@ -176,38 +324,39 @@ class LiveTrader:
             qty = self.exchange.amount_to_precision(self.cfg.symbol, qty_raw)
 
             if sig == Signal.BUY:
-                sl, tp = price - stop_points, price + tp_points
-                order = self.exchange.place_order(
-                    self.cfg.symbol, "BUY", qty, type_="market",
-                    params={
-                        "takeProfitPrice": self.exchange.price_to_precision(self.cfg.symbol, tp),
-                        "stopLossPrice": self.exchange.price_to_precision(self.cfg.symbol, sl),
-                        "reduceOnly": False,
-                    }
-                )
-                if order.get("status") == "error": return
-                self.pm.open("LONG", qty, price, sl, tp)
-                if self.sb.enabled: self.sb.log_order(order)
-
-            elif sig == Signal.SELL:
-                sl, tp = price + stop_points, price - tp_points
-                order = self.exchange.place_order(
-                    self.cfg.symbol, "SELL", qty, type_="market",
-                    params={
-                        "takeProfitPrice": self.exchange.price_to_precision(self.cfg.symbol, tp),
-                        "stopLossPrice": self.exchange.price_to_precision(self.cfg.symbol, sl),
-                        "reduceOnly": False,
-                    }
-                )
-                if order.get("status") == "error": return
-                self.pm.open("SHORT", qty, price, sl, tp)
-                if self.sb.enabled: self.sb.log_order(order)
-
-        elif sig == Signal.EXIT and not self.pm.flat():
+                side, pos_side, sl, tp = "BUY", "LONG", price - stop_points, price + tp_points
+            else:
+                side, pos_side, sl, tp = "SELL", "SHORT", price + stop_points, price - tp_points
+            return {
+                "action": "open", "side": side, "pos_side": pos_side, "qty": qty, "price": price, "sl": sl, "tp": tp,
+                "params": {
+                    "takeProfitPrice": self.exchange.price_to_precision(self.cfg.symbol, tp),
+                    "stopLossPrice": self.exchange.price_to_precision(self.cfg.symbol, sl),
+                    "reduceOnly": False,
+                },
+            }
+
+        if sig == Signal.EXIT and not self.pm.flat():
             side = "SELL" if self.pm.pos.side == "LONG" else "BUY"
             qty = self.exchange.amount_to_precision(self.cfg.symbol, self.pm.pos.qty)
-            order = self.exchange.place_order(self.cfg.symbol, side, qty, type_="market", params={"reduceOnly": True})
-            if order.get("status") == "error": return
-            pnl = self.pm.close(price)
-            self._apply_pnl(pnl)
-            if self.sb.enabled: self.sb.log_order(order)
\ No newline at end of file
+            return {"action": "close", "side": side, "pos_side": self.pm.pos.side, "qty": qty, "price": price,
+                    "params": {"reduceOnly": True}}
+        return None
+
+    def _place(self, intent: Dict[str, Any]) -> Dict[str, Any]:
+        return self.exchange.place_order(self.cfg.symbol, intent["side"], intent["qty"], type_="market",
+                                         params=intent["params"])
+
+    def _on_order_ack(self, intent: Dict[str, Any], order: Dict[str, Any]):
+        """Aplica a ordem confirmada à posição (erro da exchange: nada muda)."""
+        if order.get("status") == "error":
+            return
+        if intent["action"] == "open":
+            self.pm.open(intent["pos_side"], intent["qty"], intent["price"], intent["sl"], intent["tp"])
+        elif self.pm.flat() or self.pm.pos.side != intent["pos_side"]:
+            # saída confirmada depois que check_stops já fechou a posição localmente:
+            # a reduce-only não tinha o que reduzir, não há PnL a contabilizar
+            log.warning(f"Ack de saída tardio ignorado: posição já {'zerada' if self.pm.flat() else 'trocada'}")
+        else:
+            self._apply_pnl(self.pm.close(intent["price"]))
+        self._persist("log_order", order)
@@ -5,14 +5,30 @@ load_dotenv()
 import argparse
 from r2d2.config import CONFIG
 from r2d2.live_trader import LiveTrader
+from r2d2.async_live_trader import AsyncLiveTrader
+from r2d2.multi_live_trader import MultiLiveTrader
 
 def main():
     parser = argparse.ArgumentParser()
     parser.add_argument("--mode", choices=["live"], default="live")
+    parser.add_argument("--feed", choices=["ws", "poll"], default="ws",
+                        help="candles via WebSocket da exchange (ws) ou polling REST (poll)")
     parser.add_argument("--poll", type=int, default=None, help="segundos entre polls (default: 1/3 do timeframe)")
+    parser.add_argument("--record-trades", type=str, default=None,
+                        help="grava o stream de trades em CSV (barras 1s/tick/vol/dollar) para replay")
+    parser.add_argument("--async", dest="use_async", action="store_true",
+                        help="loop em asyncio: mercado, ordens, Supabase e control loop em tasks separadas")
+    parser.add_argument("--symbols", type=str, default=None,
+                        help="vários símbolos num processo só, separados por vírgula (ex.: BTC/USDT:USDT,ETH/USDT:USDT)")
     args = parser.parse_args()
 
-    lt = LiveTrader(CONFIG, poll_interval=args.poll)
+    if args.symbols:
+        symbols = [s.strip() for s in args.symbols.split(",") if s.strip()]
+        MultiLiveTrader(CONFIG, symbols=symbols, poll_interval=args.poll, feed=args.feed).run()
+        return
+
+    cls = AsyncLiveTrader if args.use_async else LiveTrader
+    lt = cls(CONFIG, poll_interval=args.poll, record_trades=args.record_trades, feed=args.feed)
     lt.run()
 
 if __name__ == "__main__":
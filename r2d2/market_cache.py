@@ -0,0 +1,135 @@
+# r2d2/market_cache.py
+from __future__ import annotations
+from typing import Dict, Optional, Tuple
+import json
+import os
+import threading
+import time
+
+import ccxt
+
+from r2d2.config import CONFIG
+from r2d2.utils.logger import get_logger
+
+log = get_logger("market_cache")
+
+# só derivativos: o bot opera perp linear; spot e opções (milhares de
+# contratos) deixariam o load_markets e o arquivo bem maiores sem uso
+MARKET_TYPES = ["linear", "inverse"]
+
+
+class MarketCache:
+    """
+    Cache de metadados de mercado do ccxt (precisão, limites, contractSize...)
+    em memória e em disco ({data_dir}/markets/<exchange>[-testnet].json).
+
+    - get(): memória -> disco -> rede. Com o cache vencido (`ttl` segundos)
+      devolve o que tem na hora e agenda a atualização em segundo plano;
+      só bloqueia na rede quando não existe cache nenhum.
+    - offline=True nunca acessa a rede (backtests): usa o disco se houver,
+      senão devolve None e o exchange segue sem mercados carregados.
+    - apply(client) injeta os mercados num cliente ccxt via set_markets(),
+      no lugar do load_markets() a cada construção.
+    """
+
+    def __init__(self, root: Optional[str] = None, ttl: Optional[float] = None, offline: Optional[bool] = None):
+        self._root = root
+        self.ttl = float(CONFIG.markets_ttl_s if ttl is None else ttl)
+        self.offline = CONFIG.offline if offline is None else bool(offline)
+        self._mem: Dict[Tuple[str, bool], dict] = {}
+        self._refreshing: set = set()
+        self._lock = threading.Lock()
+
+    @property
+    def root(self) -> str:
+        return self._root or os.path.join(CONFIG.data_dir, "markets")
+
+    def path(self, exchange_id: str = "bybit", testnet: bool = False) -> str:
+        return os.path.join(self.root, f"{exchange_id}{'-testnet' if testnet else ''}.json")
+
+    # ---------- rede ----------
+    def _fetch(self, exchange_id: str, testnet: bool) -> dict:
+        client = getattr(ccxt, exchange_id)({"enableRateLimit": True})
+        if testnet:
+            client.set_sandbox_mode(True)
+        client.options["defaultType"] = "linear"
+        if isinstance(client.options.get("fetchMarkets"), dict):
+            client.options["fetchMarkets"]["types"] = list(MARKET_TYPES)
+        client.load_markets()
+        return {"fetched_at": time.time(), "markets": client.markets, "currencies": client.currencies or None}
+
+    def refresh(self, exchange_id: str = "bybit", testnet: bool = False) -> dict:
+        """Baixa os mercados agora e grava memória + disco."""
+        entry = self._fetch(exchange_id, testnet)
+        path = self.path(exchange_id, testnet)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(entry, f, default=str)
+        os.replace(tmp, path)
+        with self._lock:
+            self._mem[(exchange_id, testnet)] = entry
+        log.info(f"mercados {exchange_id}{' testnet' if testnet else ''} atualizados: {len(entry['markets'])}")
+        return entry
+
+    def refresh_async(self, exchange_id: str = "bybit", testnet: bool = False):
+        """Atualização em segundo plano (uma por vez por exchange); erros só viram log."""
+        key = (exchange_id, testnet)
+        with self._lock:
+            if key in self._refreshing:
+                return
+            self._refreshing.add(key)
+
+        def _run():
+            try:
+                self.refresh(exchange_id, testnet)
+            except Exception as e:
+                log.warning(f"falha ao atualizar mercados {exchange_id}: {e}")
+            finally:
+                with self._lock:
+                    self._refreshing.discard(key)
+
+        threading.Thread(target=_run, daemon=True, name=f"markets-{exchange_id}").start()
+
+    # ---------- leitura ----------
+    def _load_disk(self, exchange_id: str, testnet: bool) -> Optional[dict]:
+        try:
+            with open(self.path(exchange_id, testnet), "r", encoding="utf-8") as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return None
+        with self._lock:
+            self._mem[(exchange_id, testnet)] = entry
+        return entry
+
+    def get(self, exchange_id: str = "bybit", testnet: bool = False, offline: Optional[bool] = None) -> Optional[dict]:
+        """{"fetched_at", "markets", "currencies"} ou None (offline e sem cache)."""
+        offline = self.offline if offline is None else bool(offline)
+        with self._lock:
+            entry = self._mem.get((exchange_id, testnet))
+        if entry is None:
+            entry = self._load_disk(exchange_id, testnet)
+        if entry is None:
+            if offline:
+                return None
+            return self.refresh(exchange_id, testnet)
+        if not offline and time.time() - float(entry.get("fetched_at", 0)) > self.ttl:
+            self.refresh_async(exchange_id, testnet)
+        return entry
+
+    def markets(self, exchange_id: str = "bybit", testnet: bool = False,
+                offline: Optional[bool] = None) -> Dict[str, dict]:
+        entry = self.get(exchange_id, testnet, offline)
+        return entry["markets"] if entry else {}
+
+    def apply(self, client, exchange_id: str = "bybit", testnet: bool = False,
+              offline: Optional[bool] = None) -> bool:
+        """set_markets() no cliente ccxt; False se não houver mercados (offline sem cache)."""
+        entry = self.get(exchange_id, testnet, offline)
+        if not entry:
+            return False
+        client.set_markets(entry["markets"], entry.get("currencies"))
+        return True
+
+
+market_cache = MarketCache()
@@ -0,0 +1,32 @@
+# r2d2/metrics.py
+import numpy as np
+import pandas as pd
+
+def compute_metrics(df_trades: pd.DataFrame):
+    if df_trades.empty:
+        return {}
+    pnl = pd.to_numeric(df_trades["pnl"], errors="coerce").fillna(0.0)
+    equity = pd.to_numeric(df_trades.get("equity", pnl.cumsum()), errors="coerce").ffill().fillna(0.0)
+    wins = pnl[pnl > 0].sum()
+    losses = -pnl[pnl < 0].sum()
+    pf = (wins / losses) if losses > 0 else np.nan
+    wr = (pnl.gt(0).mean() * 100.0) if len(df_trades) else 0.0
+
+    cummax = np.maximum.accumulate(equity)
+    dd = equity - cummax
+    max_dd = float(dd.min()) if len(dd) else 0.0
+    idx_min = int(np.argmin(dd)) if len(dd) else 0
+    peak = float(cummax[idx_min]) if len(cummax) else 0.0
+    max_dd_pct = (max_dd / peak) if peak != 0 else np.nan
+
+    return {
+        "net_pnl": round(float(pnl.sum()), 4),
+        "trades": int(len(df_trades)),
+        "win_rate_%": round(float(wr), 2),
+        "profit_factor": round(float(pf), 3) if not np.isnan(pf) else None,
+        "expectancy": round(float(pnl.mean()), 5),
+        "max_drawdown": round(max_dd, 4),
+        "max_drawdown_%": round(float(max_dd_pct * 100), 2) if not np.isnan(max_dd_pct) else None,
+    }
+
+EMPTY_METRICS = {"net_pnl": 0.0, "profit_factor": None, "win_rate_%": 0.0, "expectancy": 0.0, "trades": 0}
@@ -0,0 +1,96 @@
+# r2d2/monte_carlo.py
+from __future__ import annotations
+from typing import Dict, Any, Optional, Sequence, Union
+
+import numpy as np
+import pandas as pd
+
+# limite de elementos (sims × trades) por bloco: ~8M float64 ≈ 64MB
+_MAX_BLOCK_ELEMS = 8_000_000
+
+
+def _pnl_array(trades: Union[pd.DataFrame, Sequence[Dict[str, Any]]]) -> np.ndarray:
+    if isinstance(trades, pd.DataFrame):
+        s = trades["pnl"] if "pnl" in trades.columns else pd.Series([], dtype=float)
+        return pd.to_numeric(s, errors="coerce").fillna(0.0).to_numpy(dtype=np.float64)
+    return np.asarray([float(t.get("pnl") or 0.0) for t in trades], dtype=np.float64)
+
+
+def _pct(x: np.ndarray) -> Dict[str, float]:
+    p5, p25, p50, p75, p95 = np.percentile(x, [5, 25, 50, 75, 95])
+    return {"mean": float(x.mean()), "p5": float(p5), "p25": float(p25),
+            "p50": float(p50), "p75": float(p75), "p95": float(p95)}
+
+
+def monte_carlo(trades, initial_balance: float, n_sims: int = 10_000, method: str = "bootstrap",
+                ruin_drawdown_pct: float = 50.0, seed: Optional[int] = None,
+                keep_samples: bool = True) -> Dict[str, Any]:
+    """
+    Reamostra a sequência de PnLs das trades para medir quanto do resultado é sorte.
+
+    - bootstrap: sorteia T trades COM reposição (varia PnL final e drawdown)
+    - permutation: embaralha a ordem das T trades (PnL final fixo; varia só o caminho)
+
+    Cada bloco de simulações é uma matriz (sims × trades): índices, cumsum e
+    máximo acumulado são operações 2D do NumPy, sem laço por simulação.
+    Ruína = equity tocar (1 - ruin_drawdown_pct/100) × capital inicial.
+    """
+    pnl = _pnl_array(trades)
+    T = len(pnl)
+    if T == 0:
+        return {"error": "Sem trades para Monte Carlo."}
+    if method not in ("bootstrap", "permutation"):
+        raise ValueError(f"method inválido: {method}")
+
+    rng = np.random.default_rng(seed)
+    initial = float(initial_balance)
+    ruin_level = initial * (1.0 - float(ruin_drawdown_pct) / 100.0)
+    block = max(1, _MAX_BLOCK_ELEMS // T)
+
+    final_pnl = np.empty(n_sims)
+    max_dd = np.empty(n_sims)
+    max_dd_pct = np.empty(n_sims)
+    ruined = np.empty(n_sims, dtype=bool)
+
+    for s0 in range(0, n_sims, block):
+        s1 = min(n_sims, s0 + block)
+        if method == "bootstrap":
+            sample = pnl[rng.integers(0, T, size=(s1 - s0, T))]
+        else:
+            sample = rng.permuted(np.broadcast_to(pnl, (s1 - s0, T)), axis=1)
+        equity = np.cumsum(sample, axis=1)
+        equity += initial
+        peak = np.maximum.accumulate(equity, axis=1)
+        np.maximum(peak, initial, out=peak)
+        dd = equity - peak
+        idx = dd.argmin(axis=1)
+        rows = np.arange(s1 - s0)
+        max_dd[s0:s1] = dd[rows, idx]
+        peak_at = peak[rows, idx]
+        max_dd_pct[s0:s1] = np.where(peak_at != 0, dd[rows, idx] / peak_at * 100.0, 0.0)
+        final_pnl[s0:s1] = equity[:, -1] - initial
+        ruined[s0:s1] = equity.min(axis=1) <= ruin_level
+
+    out = {
+        "method": method,
+        "sims": int(n_sims),
+        "trades": int(T),
+        "final_pnl": _pct(final_pnl),
+        "max_drawdown": _pct(max_dd),
+        "max_drawdown_%": _pct(max_dd_pct),
+        "prob_loss_%": round(float((final_pnl < 0).mean() * 100.0), 2),
+        "risk_of_ruin_%": round(float(ruined.mean() * 100.0), 2),
+        "ruin_drawdown_pct": float(ruin_drawdown_pct),
+    }
+    if keep_samples:
+        out["samples"] = {"final_pnl": final_pnl, "max_drawdown": max_dd, "max_drawdown_%": max_dd_pct}
+    return out
+
+
+def summary_table(mc: Dict[str, Any]) -> pd.DataFrame:
+    """Tabela (métrica × percentis) para exibir no app."""
+    rows = []
+    for k in ("final_pnl", "max_drawdown", "max_drawdown_%"):
+        if k in mc:
+            rows.append({"métrica": k, **{p: round(v, 4) for p, v in mc[k].items()}})
+    return pd.DataFrame(rows)
@@ -0,0 +1,142 @@
+# r2d2/multi_live_trader.py
+import asyncio
+from dataclasses import replace
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+
+from r2d2.async_live_trader import AsyncLiveTrader, _STOP, control_worker, order_worker
+from r2d2.bybit_exchange import BybitCCXT
+from r2d2.config import CONFIG, AppConfig
+from r2d2.exchange_api import ExchangeAPI
+from r2d2.kline_stream import PollingKlineStream, merge_streams
+from r2d2.live_trader import _TIMEFRAME_SECONDS
+from r2d2.supabase_store import SupabaseStore
+from r2d2.trade_bars import is_trade_spec
+from r2d2.utils.logger import get_logger
+
+log = get_logger("live_multi")
+
+
+class MultiLiveTrader:
+    """
+    Vários símbolos num processo só, no lugar de um LiveTrader por símbolo:
+
+    - um cliente ccxt (mercados do market_cache) e um SupabaseStore para todos;
+    - candles de todos os símbolos multiplexados num stream (na Bybit, um
+      WebSocket com um tópico kline por símbolo);
+    - estado por símbolo num AsyncLiveTrader enxuto (estratégia, posição,
+      risco, ControlLoop; histórico limitado a `max_bars` candles), sem
+      cliente nem conexão próprios;
+    - a decisão de cada símbolo roda assim que o candle dele fecha; cada
+      símbolo tem a sua fila/task de ordens (uma ordem lenta de um símbolo
+      não atrasa a dos outros), o control loop é uma fila/task compartilhada
+      (async_live_trader) e a gravação vai para o writer (diário local) do
+      store compartilhado.
+
+    O saldo inicial é dividido igualmente entre os símbolos (cada um
+    dimensiona e controla risco sobre a sua fatia).
+    """
+
+    def __init__(self, cfg: AppConfig = CONFIG, symbols: Optional[List[str]] = None,
+                 poll_interval: int | None = None, feed: str = "ws", max_bars: int = 500,
+                 bar_queue: int = 1000):
+        if is_trade_spec(cfg.timeframe):
+            raise ValueError(f"barras de trades ({cfg.timeframe}) só no LiveTrader de um símbolo")
+        if feed not in ("ws", "poll"):
+            raise ValueError(f"feed inválido: {feed} (use 'ws' ou 'poll')")
+        self.cfg = cfg
+        self.symbols = list(dict.fromkeys(symbols or [cfg.symbol]))
+        self.feed = feed
+        self.poll_interval = poll_interval if poll_interval is not None else \
+            max(1, _TIMEFRAME_SECONDS.get(cfg.timeframe, 60) // 3)
+        self.bar_queue = int(bar_queue)
+        self.exchange: ExchangeAPI = self._load_exchange()
+        self.sb = SupabaseStore()
+        self.sb.start_writer()
+
+        per_symbol = cfg.initial_balance / len(self.symbols)
+        self.traders: Dict[str, AsyncLiveTrader] = {
+            s: AsyncLiveTrader(replace(cfg, symbol=s, initial_balance=per_symbol), poll_interval=self.poll_interval,
+                               feed=feed, exchange=self.exchange, sb=self.sb, max_bars=max_bars)
+            for s in self.symbols
+        }
+        log.info(f"MultiLiveTrader: {len(self.symbols)} símbolos, {per_symbol:.2f} de saldo cada")
+
+    def _load_exchange(self) -> ExchangeAPI:
+        if self.cfg.exchange == "bybit":
+            return BybitCCXT(api_key="", api_secret="", testnet=self.cfg.bybit_testnet)
+        raise ValueError(f"exchange não suportada no modo live: {self.cfg.exchange}")
+
+    def _source(self) -> AsyncIterator[Tuple[str, Dict[str, Any]]]:
+        if self.feed == "poll":
+            return merge_streams({s: PollingKlineStream(self.exchange, s, self.cfg.timeframe,
+                                                        interval=self.poll_interval) for s in self.symbols})
+        return self.exchange.kline_mux(self.symbols, self.cfg.timeframe, poll_interval=self.poll_interval)
+
+    # ---------- estado agregado ----------
+    @property
+    def equity(self) -> float:
+        return sum(t.equity for t in self.traders.values())
+
+    def summary(self) -> Dict[str, Any]:
+        per = {s: {"equity": t.equity, "position": t.pm.pos.side, **t.results, "bars": t.stats["bars"]}
+               for s, t in self.traders.items()}
+        total = {k: sum(p[k] for p in per.values()) for k in ("trades", "wins", "losses", "pnl")}
+        return {"equity": self.equity, **total, "symbols": per}
+
+    # ---------- tasks ----------
+    async def _market(self, source, bars_q: asyncio.Queue):
+        try:
+            async for symbol, bar in source:
+                if symbol in self.traders:
+                    await bars_q.put((symbol, bar))
+        finally:
+            await bars_q.put(_STOP)
+
+    async def _decide(self, bars_q: asyncio.Queue, order_qs: List[asyncio.Queue]):
+        while True:
+            item = await bars_q.get()
+            if item is _STOP:
+                break
+            symbol, bar = item
+            self.traders[symbol].on_bar(bar)
+        for q in order_qs:
+            await q.put(_STOP)
+
+    async def run_async(self, source: Optional[AsyncIterator[Tuple[str, Dict[str, Any]]]] = None):
+        """source: iterador assíncrono de (symbol, bar) no lugar do stream da exchange (replay/testes)."""
+        log.info(
+            f"Iniciando R2D2 Live (multi) | symbols={len(self.symbols)} tf={self.cfg.timeframe} "
+            f"exchange={self.cfg.exchange} testnet={self.cfg.bybit_testnet} feed={self.feed}"
+        )
+        bars_q: asyncio.Queue = asyncio.Queue(maxsize=self.bar_queue)
+        # uma fila de ordens por símbolo (no máximo uma ordem em voo por trader,
+        # via _pending_orders): place_order de símbolos diferentes corre em paralelo
+        order_qs: Dict[str, asyncio.Queue] = {s: asyncio.Queue() for s in self.traders}
+        ctrl_q: asyncio.Queue = asyncio.Queue(maxsize=len(self.traders) + 1)
+        for s, t in self.traders.items():
+            t.bind(order_qs[s], ctrl_q)
+
+        background = [asyncio.create_task(control_worker(ctrl_q), name="control")]
+        pipeline = [asyncio.create_task(self._market(source or self._source(), bars_q), name="market"),
+                    asyncio.create_task(self._decide(bars_q, list(order_qs.values())), name="decision"),
+                    *(asyncio.create_task(order_worker(q), name=f"orders:{s}") for s, q in order_qs.items())]
+        try:
+            await asyncio.gather(*pipeline)
+            await ctrl_q.put(_STOP)
+            await asyncio.gather(*background)
+            if self.sb.writer is not None:
+                await asyncio.to_thread(self.sb.writer.flush)
+        finally:
+            for t in pipeline + background:
+                t.cancel()
+            for t in self.traders.values():
+                t.bind(None, None)
+
+    def run(self, source: Optional[AsyncIterator[Tuple[str, Dict[str, Any]]]] = None):
+        try:
+            asyncio.run(self.run_async(source))
+        except KeyboardInterrupt:
+            log.info("Encerrando R2D2 Live multi (Ctrl+C).")
+            if self.sb.enabled:
+                self.sb.log_event("shutdown", {"equity": self.equity, "symbols": self.symbols})
+            self.sb.close_writer()
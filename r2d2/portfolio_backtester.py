@@ -7,6 +7,7 @@ from datetime import datetime
 import pandas as pd
 
 from r2d2.backtester import Backtester
+from r2d2.monte_carlo import monte_carlo
 from r2d2.strategy_manager import StrategyManager
 
 class PortfolioBacktester:
@@ -16,15 +17,19 @@ class PortfolioBacktester:
     - PnL e métricas por símbolo
     - curva de equity do portfólio (somando PnLs conforme as saídas acontecem)
     """
-    def __init__(self, base_cfg, exchange_factory, strategy_cfg: Optional[dict] = None):
+    def __init__(self, base_cfg, exchange_factory, strategy_cfg: Optional[dict] = None,
+                 mc_sims: int = 10_000):
         """
         base_cfg: AppConfig base (será copiado por símbolo)
         exchange_factory: callable -> instancia do exchange (ex.: lambda: BybitCCXT(testnet=True))
         strategy_cfg: dict opcional para sobrescrever params comuns (allowed_hours/days etc.)
+        mc_sims: nº de reamostragens Monte Carlo no resumo (0 desliga)
         """
         self.base_cfg = base_cfg
         self.exchange_factory = exchange_factory
         self.strategy_cfg = strategy_cfg or {}
+        self.mc_sims = int(mc_sims)
+        self.monte_carlo: Optional[Dict[str, Any]] = None
 
         self.symbol_results: Dict[str, dict] = {}
         self.symbol_trades: Dict[str, List[dict]] = {}
@@ -34,7 +39,7 @@ class PortfolioBacktester:
 
     def run(self, bars_by_symbol: Dict[str, List[dict]], weights: Optional[Dict[str, float]] = None):
         """
-        bars_by_symbol: {symbol: [bars...]}
+        bars_by_symbol: {symbol: [bars...]} — também aceita BarSeries ou caminho de arquivo de barras (bar_file)
         weights: pesos por símbolo (soma ~1) para alocação de capital inicial (equal-weight se None).
         """
         symbols = [s for s, bars in bars_by_symbol.items() if bars]
@@ -126,4 +131,9 @@ class PortfolioBacktester:
             "win_rate_%": round(wr, 2),
             "per_symbol": per_symbol,
         }
+
+        # 4) robustez: Monte Carlo sobre a sequência de PnLs do portfólio
+        if self.mc_sims > 0:
+            self.monte_carlo = monte_carlo(df, float(self.base_cfg.initial_balance), n_sims=self.mc_sims)
+            self.summary["monte_carlo"] = {k: v for k, v in self.monte_carlo.items() if k != "samples"}
         return self.summary
@@ -0,0 +1,69 @@
+# r2d2/resample.py
+from __future__ import annotations
+from typing import Optional
+
+import ccxt
+import numpy as np
+
+from r2d2.bars import BarSeries
+
+BASE_TIMEFRAME = "1m"
+BASE_MS = 60 * 1000
+# 1970-01-01 foi quinta-feira; candles semanais da Bybit começam na segunda
+_WEEK_OFFSET_MS = 4 * 24 * 3600 * 1000
+
+
+def bucket_start(ts_ms: np.ndarray, timeframe: str) -> np.ndarray:
+    """Início (UTC, ms) do candle de `timeframe` que contém cada timestamp."""
+    ts = np.asarray(ts_ms, dtype=np.int64)
+    if timeframe.endswith("M"):
+        months = ts.astype("datetime64[ms]").astype("datetime64[M]")
+        return months.astype("datetime64[ms]").astype(np.int64)
+    tf_ms = ccxt.Exchange.parse_timeframe(timeframe) * 1000
+    offset = _WEEK_OFFSET_MS if timeframe.endswith("w") else 0
+    return (ts - offset) // tf_ms * tf_ms + offset
+
+
+def bucket_end(start_ms: np.ndarray, timeframe: str) -> np.ndarray:
+    """Fim (exclusivo) do candle que começa em start_ms."""
+    start = np.asarray(start_ms, dtype=np.int64)
+    if timeframe.endswith("M"):
+        months = start.astype("datetime64[ms]").astype("datetime64[M]") + 1
+        return months.astype("datetime64[ms]").astype(np.int64)
+    return start + ccxt.Exchange.parse_timeframe(timeframe) * 1000
+
+
+def resample(bars, timeframe: str, complete_only: bool = True, base_ms: int = BASE_MS,
+             until_ms: Optional[int] = None) -> BarSeries:
+    """
+    Agrega candles base (1m) em `timeframe`, sem laço Python:
+    open=first, high=max, low=min, close=last, volume=sum por balde UTC
+    (np.*.reduceat sobre os limites de cada balde).
+
+    complete_only descarta o último balde se os dados base ainda não chegaram
+    ao fim dele (candle em formação). `until_ms` informa até onde a base está
+    completa quando isso é conhecido (default: último ts + base_ms).
+    """
+    bars = BarSeries.from_records(bars)
+    if not len(bars):
+        return BarSeries.empty()
+    ts = bars.ts
+    b = bucket_start(ts, timeframe)
+    starts = np.flatnonzero(np.r_[True, b[1:] != b[:-1]])
+    ends = np.r_[starts[1:], len(ts)] - 1
+
+    out = BarSeries({
+        "ts": b[starts],
+        "open": bars.col("open")[starts],
+        "high": np.maximum.reduceat(bars.col("high"), starts),
+        "low": np.minimum.reduceat(bars.col("low"), starts),
+        "close": bars.col("close")[ends],
+        "volume": np.add.reduceat(bars.col("volume"), starts),
+    }, meta={k: v for k, v in bars.meta.items() if k != "bar_file"})
+    out.meta["timeframe"] = timeframe
+
+    if complete_only:
+        reached = int(ts[-1]) + int(base_ms) if until_ms is None else int(until_ms)
+        if int(bucket_end(out.ts[-1:], timeframe)[0]) > reached:
+            out = out[:-1]
+    return out
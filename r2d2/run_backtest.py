@@ -1,11 +1,25 @@
 import ccxt
 import time
+import asyncio
+import numpy as np
 import argparse
+from typing import Any, Dict, List, Optional, Tuple
 from datetime import datetime, timezone
 from r2d2.config import CONFIG
 from r2d2.strategy_manager import StrategyManager
 from r2d2.backtester import Backtester
 from r2d2.bybit_exchange import BybitCCXT
+from r2d2.supabase_store import SupabaseStore
+from r2d2.file_loader import load_bars_file
+from r2d2.trade_bars import load_trade_bars
+from r2d2.funding import attach_derivs
+from r2d2.bars import BarSeries
+from r2d2.data_store import OHLCVStore
+from r2d2.async_downloader import AsyncDownloader, download_ohlcv
+from r2d2.resample import BASE_TIMEFRAME, bucket_start
+
+STORE_EXCHANGE = "bybit"
+SUPABASE_EXCHANGE = "supabase"  # partição local do cache da tabela ohlcv
 
 
 def normalize_symbol(symbol: str) -> str:
@@ -19,59 +33,252 @@ def normalize_symbol(symbol: str) -> str:
         return symbol.split(":")[0]  # pega só a parte antes do ':'
     return symbol
 
+def _progress_printer(norm_symbol: str):
+    def _cb(done: int, total: int):
+        if done == total or done % 10 == 0:
+            print(f"✅ {norm_symbol}: {done}/{total} janelas baixadas")
+    return _cb
+
+
+def _date_ms(date_str: Optional[str]) -> Optional[int]:
+    if not date_str:
+        return None
+    return int(datetime.fromisoformat(date_str).replace(tzinfo=timezone.utc).timestamp() * 1000)
+
+
+def _range_ms(timeframe: str, start_date: str, end_date: str):
+    """(since, until, timeframe_ms) em UTC, com until limitado ao último candle fechado."""
+    since, until = _date_ms(start_date), _date_ms(end_date)
+    timeframe_ms = ccxt.Exchange.parse_timeframe(timeframe) * 1000
+    until = min(until, int(time.time() * 1000) // timeframe_ms * timeframe_ms)
+    return since, until, timeframe_ms
+
+
+def _from_base(store: OHLCVStore, symbol: str, timeframe: str, since: int, until: int):
+    """Timeframe maior servido do 1m local (sem rede), se o 1m cobre o período; senão None."""
+    if timeframe == BASE_TIMEFRAME:
+        return None
+    base_since = int(bucket_start(np.array([since]), timeframe)[0])
+    if store.missing_ranges(STORE_EXCHANGE, symbol, BASE_TIMEFRAME, base_since, until):
+        return None
+    store.derive(STORE_EXCHANGE, symbol, timeframe)
+    return store.mapped(STORE_EXCHANGE, symbol, timeframe, since, until)
+
+
+def _load_from_supabase(symbol: str, timeframe: str, since: int, until: int) -> BarSeries:
+    """
+    Candles da tabela ohlcv do Supabase (só 1m, gravada pelo bootstrap_history),
+    com cache local numa partição própria do OHLCVStore: só os trechos que
+    faltam localmente são consultados; timeframes maiores saem do 1m.
+    Trechos ausentes na tabela não são marcados como vazios (o bootstrap
+    pode preenchê-los depois) e voltam a ser consultados na próxima carga.
+    """
+    store = OHLCVStore()
+    base_since = int(bucket_start(np.array([since]), timeframe)[0])
+    missing = store.missing_ranges(SUPABASE_EXCHANGE, symbol, BASE_TIMEFRAME, base_since, until)
+    if missing:
+        sb = SupabaseStore()
+        for a, b in missing:
+            part = sb.fetch_ohlcv(symbol, a, b)
+            store.write(SUPABASE_EXCHANGE, symbol, BASE_TIMEFRAME, part)
+    if timeframe != BASE_TIMEFRAME:
+        store.derive(SUPABASE_EXCHANGE, symbol, timeframe)
+    bars = store.mapped(SUPABASE_EXCHANGE, symbol, timeframe, since, until)
+    bars.meta["gaps"] = store.missing_ranges(SUPABASE_EXCHANGE, symbol, BASE_TIMEFRAME, base_since, until)
+    return bars
+
+
+def _fill(store: OHLCVStore, pending: Dict[str, List[Tuple[int, int]]], timeframe: str,
+          notify=None, concurrency: int = 8) -> Dict[str, Exception]:
+    """
+    Baixa só os trechos faltantes de cada símbolo, todos num único event loop
+    (uma conexão, um token bucket). Cada trecho baixado é gravado e o que a
+    exchange não devolveu dentro dele fica marcado como vazio confirmado.
+    No 1m, os timeframes derivados do símbolo são reagregados em seguida.
+    Retorna {symbol: exceção} dos que falharam.
+    """
+    notify = notify or (lambda *a: None)
+    failed: Dict[str, Exception] = {}
+
+    async def _one(dl, s, ranges):
+        try:
+            done = 0
+            total = len(ranges)
+
+            async def _range(a, b):
+                nonlocal done
+                part = await dl.fetch(normalize_symbol(s), timeframe, a, b)
+                store.write(STORE_EXCHANGE, s, timeframe, part)
+                store.mark_fetched(STORE_EXCHANGE, s, timeframe, a, b, part.ts)
+                done += 1
+                notify(s, done, total, "baixando")
+
+            await asyncio.gather(*(_range(a, b) for a, b in ranges))
+            if timeframe == BASE_TIMEFRAME:
+                # o 1m preenchido invalidou os baldes derivados que o cruzam: reagrega já
+                store.rederive(STORE_EXCHANGE, s)
+            notify(s, 1, 1, "ok")
+        except Exception as e:
+            failed[s] = e
+            print(f"⚠️ Erro ao carregar {s}: {e} – ignorando.")
+            notify(s, 1, 1, "erro")
+
+    async def _run():
+        async with AsyncDownloader(concurrency=concurrency) as dl:
+            await asyncio.gather(*(_one(dl, s, r) for s, r in pending.items()))
+
+    if pending:
+        asyncio.run(_run())
+    return failed
+
+
+def _describe(ranges: List[Tuple[int, int]]) -> str:
+    return ", ".join(f"{datetime.utcfromtimestamp(a/1000)} → {datetime.utcfromtimestamp(b/1000)}" for a, b in ranges)
+
+
 def load_historical(symbol="BTC/USDT:USDT", timeframe="1m",
-                    start_date="2025-09-01", end_date="2025-09-30"):
-    bybit = ccxt.bybit()
-    bybit.set_sandbox_mode(False)  # dados reais
-    bybit.options["defaultType"] = "linear"
+                    start_date="2025-09-01", end_date="2025-09-30", use_store: bool = True,
+                    gaps: str = "fill", source: str = "exchange") -> BarSeries:
+    """
+    Candles [start_date, end_date) como BarSeries (compatível com a lista de dicts).
 
+    Com use_store=True lê do OHLCVStore local e só baixa os trechos que faltam
+    (início, fim ou buracos no meio) — gaps="fill" (default) — ou apenas
+    informa as lacunas sem rede — gaps="report". Em ambos os casos as lacunas
+    restantes ficam em bars.meta["gaps"]. O fim é limitado ao último candle
+    FECHADO, para nunca gravar um candle ainda em formação.
+    Timeframes acima de 1m saem agregados do 1m local quando ele cobre o período.
+    source="supabase" lê da tabela ohlcv do Supabase em vez da exchange.
+    """
     norm_symbol = normalize_symbol(symbol)
-    print(f"🔎 Baixando {symbol} (normalizado: {norm_symbol}), timeframe={timeframe}, "
-          f"de {start_date} até {end_date}")
-
-    since = int(datetime.fromisoformat(start_date).replace(tzinfo=timezone.utc).timestamp() * 1000)
-    until = int(datetime.fromisoformat(end_date).replace(tzinfo=timezone.utc).timestamp() * 1000)
-
-    all_candles = []
-    limit = 1000
-    timeframe_ms = bybit.parse_timeframe(timeframe) * 1000
-
-    now = since
-    while now < until:
-        candles = bybit.fetch_ohlcv(norm_symbol, timeframe, since=now, limit=limit)
-        if not candles:
-            print(f"⚠️ Nenhum candle retornado para {norm_symbol} a partir de {datetime.utcfromtimestamp(now/1000)}")
-            break
-
-        for ts, o, h, l, c, v in candles:
-            if ts >= until:
-                break
-            all_candles.append({
-                "ts": ts,
-                "open": o,
-                "high": h,
-                "low": l,
-                "close": c,
-                "volume": v,
-            })
-
-        last_ts = candles[-1][0]
-        now = last_ts + timeframe_ms
-        print(f"✅ {norm_symbol}: já baixados {len(all_candles)} candles... "
-              f"até {datetime.utcfromtimestamp(last_ts/1000)}")
-
-        time.sleep(bybit.rateLimit / 1000)
-
-    print(f"📊 Total de candles carregados para {norm_symbol}: {len(all_candles)}")
-    return all_candles
-    
+    since, until, timeframe_ms = _range_ms(timeframe, start_date, end_date)
+
+    if source == "supabase":
+        bars = _load_from_supabase(symbol, timeframe, since, until)
+        print(f"📊 Total de candles carregados para {norm_symbol}: {len(bars)} (Supabase ohlcv + cache local)")
+        return bars
+
+    if not use_store:
+        print(f"🔎 Baixando {symbol} (normalizado: {norm_symbol}), timeframe={timeframe}, "
+              f"de {start_date} até {end_date}")
+        bars = download_ohlcv(norm_symbol, timeframe, since, until, progress=_progress_printer(norm_symbol))
+        bars.meta.update(exchange=STORE_EXCHANGE, symbol=symbol, timeframe=timeframe)
+        print(f"📊 Total de candles carregados para {norm_symbol}: {len(bars)}")
+        return bars
+
+    store = OHLCVStore()
+    bars = _from_base(store, symbol, timeframe, since, until)
+    if bars is not None:
+        bars.meta["gaps"] = []
+        print(f"📊 Total de candles carregados para {norm_symbol}: {len(bars)} (agregado do 1m local)")
+        return bars
+
+    missing = store.missing_ranges(STORE_EXCHANGE, symbol, timeframe, since, until)
+    if missing and gaps == "fill":
+        print(f"🔎 Baixando {symbol} (normalizado: {norm_symbol}), timeframe={timeframe}, "
+              f"{len(missing)} trecho(s): {_describe(missing[:5])}{' …' if len(missing) > 5 else ''}")
+        failed = _fill(store, {symbol: missing}, timeframe)
+        if symbol in failed:
+            raise failed[symbol]
+
+    bars = store.mapped(STORE_EXCHANGE, symbol, timeframe, since, until)
+    bars.meta["gaps"] = store.missing_ranges(STORE_EXCHANGE, symbol, timeframe, since, until)
+    if bars.meta["gaps"]:
+        print(f"⚠️ {norm_symbol}: {len(bars.meta['gaps'])} lacuna(s) sem dados: {_describe(bars.meta['gaps'][:5])}")
+    print(f"📊 Total de candles carregados para {norm_symbol}: {len(bars)} "
+          f"({'cache local' if not missing or gaps != 'fill' else f'{len(missing)} trecho(s) baixado(s)'})")
+    return bars
+
+
+def load_historical_multi(symbols, timeframe="1m", start_date="2025-09-01", end_date="2025-09-30",
+                          progress=None, concurrency: int = 8):
+    """
+    Vários símbolos de uma vez: os que já estão no OHLCVStore saem do cache;
+    os trechos faltantes dos demais são baixados em paralelo, com UMA conexão
+    async e UM token bucket compartilhados (o limite da exchange vale para a
+    soma dos símbolos).
+
+    progress(symbol, done, total, status) é chamado a cada trecho baixado e
+    quando o símbolo termina (status: "cache", "baixando", "ok", "erro").
+    Um símbolo que falha não interrompe os outros.
+
+    Retorna (bars_by_symbol, failed) — failed = {symbol: mensagem de erro}.
+    """
+    since, until, timeframe_ms = _range_ms(timeframe, start_date, end_date)
+    store = OHLCVStore()
+    notify = progress or (lambda *a: None)
+    pending = {}
+    for s in symbols:
+        if timeframe != BASE_TIMEFRAME and _from_base(store, s, timeframe, since, until) is not None:
+            notify(s, 1, 1, "cache")
+            continue
+        missing = store.missing_ranges(STORE_EXCHANGE, s, timeframe, since, until)
+        if missing:
+            pending[s] = missing
+        else:
+            notify(s, 1, 1, "cache")
+
+    if pending:
+        print(f"🔎 Baixando {len(pending)} de {len(symbols)} símbolos ({timeframe}, {start_date} → {end_date})")
+    failed = {s: f"{type(e).__name__}: {e}" for s, e in _fill(store, pending, timeframe, notify, concurrency).items()}
+
+    data = {}
+    for s in symbols:
+        data[s] = BarSeries.empty() if s in failed else store.mapped(STORE_EXCHANGE, s, timeframe, since, until)
+    return data, failed
+
+
+def repair_gaps(timeframe: str = "1m", symbols: Optional[List[str]] = None, concurrency: int = 8) -> Dict[str, Any]:
+    """
+    Varre as séries armazenadas e baixa só os buracos entre o primeiro e o
+    último candle de cada uma (o que a exchange não tiver fica marcado como
+    vazio confirmado e não volta a ser pedido).
+    Retorna {symbol: {"missing": n_trechos, "status": ...}}.
+    """
+    store = OHLCVStore()
+    symbols = symbols or store.list_series(STORE_EXCHANGE, timeframe)
+    pending = {}
+    report: Dict[str, Any] = {}
+    for s in symbols:
+        missing = store.gap_index(STORE_EXCHANGE, s, timeframe)["missing"]
+        report[s] = {"missing": len(missing), "status": "ok" if not missing else "pendente"}
+        if missing:
+            pending[s] = missing
+            print(f"🩹 {s}: {len(missing)} lacuna(s): {_describe(missing[:5])}{' …' if len(missing) > 5 else ''}")
+    failed = _fill(store, pending, timeframe, concurrency=concurrency)
+    for s in pending:
+        report[s]["status"] = f"erro: {failed[s]}" if s in failed else "reparado"
+        report[s]["remaining"] = len(store.gap_index(STORE_EXCHANGE, s, timeframe)["missing"])
+    return report
+
+def archive_series(timeframe: str = "1m", symbols: Optional[List[str]] = None) -> Dict[str, Any]:
+    """
+    Compacta cada série armazenada em series.r2c (bar_codec). O OHLCVStore
+    passa a ler dali até a próxima gravação da série.
+    Retorna {symbol: {"rows": n, "bytes": tamanho}}.
+    """
+    store = OHLCVStore()
+    report: Dict[str, Any] = {}
+    for s in symbols or store.list_series(STORE_EXCHANGE, timeframe):
+        info = store.archive(STORE_EXCHANGE, s, timeframe)
+        report[s] = {"rows": info["rows"], "bytes": info["bytes"]}
+    return report
+
 def main():
     parser = argparse.ArgumentParser(description="Rodar backtest do R2D2")
     parser.add_argument("--symbol", type=str, default="BTC/USDT:USDT")
     parser.add_argument("--timeframe", type=str, default="1m")
-    parser.add_argument("--start", type=str, default="2025-09-01")
-    parser.add_argument("--end", type=str, default="2025-09-30")
+    parser.add_argument("--start", type=str, default=None, help="default: 2025-09-01 (arquivo: início do arquivo)")
+    parser.add_argument("--end", type=str, default=None, help="default: 2025-09-30 (arquivo: fim do arquivo)")
+    parser.add_argument("--csv", type=str, default=CONFIG.data_csv,
+                        help="CSV/Parquet local com candles (AppConfig.data_csv); se informado, não usa a exchange")
+    parser.add_argument("--trades", type=str, default="",
+                        help="arquivo de trades (CSV/.csv.gz/Parquet); --timeframe vira o tipo de barra: 1s, tick:N, vol:N, dollar:N")
+    parser.add_argument("--funding", action="store_true",
+                        help="anexa funding rate/open interest (Bybit, cache local) e cobra funding das posições")
     parser.add_argument("--initial", type=float, default=1000.0)
+    parser.add_argument("--source", type=str, default="exchange", choices=["exchange", "supabase"],
+                        help="origem dos candles: API da exchange ou tabela ohlcv do Supabase")
 
     # parâmetros da estratégia
     parser.add_argument("--sl_atr_mult", type=float, default=1.8)
@@ -87,8 +294,20 @@ def main():
     parser.add_argument("--commission_perc", type=float, default=0.0004)
     parser.add_argument("--slippage_points", type=int, default=2)
 
+    parser.add_argument("--repair-gaps", action="store_true",
+                        help="só repara lacunas das séries locais do --timeframe e sai")
+    parser.add_argument("--archive", action="store_true",
+                        help="só compacta as séries locais do --timeframe em series.r2c (leitura fria) e sai")
+
     args = parser.parse_args()
 
+    if args.repair_gaps:
+        print("🩹 Reparo de lacunas:", repair_gaps(timeframe=args.timeframe))
+        return
+    if args.archive:
+        print("🗜️ Arquivo morto:", archive_series(timeframe=args.timeframe))
+        return
+
     # aplica configs
     CONFIG.initial_balance = args.initial
     CONFIG.symbol = args.symbol
@@ -108,14 +327,28 @@ def main():
     CONFIG.strat_params.use_atr_trailing = args.use_atr_trailing
     CONFIG.strat_params.trail_atr_mult = args.trail_atr_mult
 
-    print(f"🔎 Baixando dados: {args.symbol}, {args.timeframe}, de {args.start} até {args.end}...")
-    bars = load_historical(symbol=args.symbol, timeframe=args.timeframe,
-                           start_date=args.start, end_date=args.end)
+    if args.trades:
+        print(f"🧾 Agregando trades de {args.trades} em barras {args.timeframe}...")
+        bars = load_trade_bars(args.trades, args.timeframe, start_ms=_date_ms(args.start), end_ms=_date_ms(args.end))
+    elif args.csv:
+        CONFIG.data_csv = args.csv
+        print(f"📂 Carregando candles de {args.csv} ({args.timeframe})...")
+        bars = load_bars_file(args.csv, start_ms=_date_ms(args.start), end_ms=_date_ms(args.end),
+                              timeframe=args.timeframe)
+    else:
+        args.start = args.start or "2025-09-01"
+        args.end = args.end or "2025-09-30"
+        print(f"🔎 Baixando dados: {args.symbol}, {args.timeframe}, de {args.start} até {args.end}...")
+        bars = load_historical(symbol=args.symbol, timeframe=args.timeframe,
+                               start_date=args.start, end_date=args.end, source=args.source)
+    if args.funding:
+        bars = attach_derivs(bars, args.symbol)
+        print(f"💸 Funding: {bars.meta.get('funding_points', 0)} liquidações no cache")
     print(f"✅ Total de candles carregados: {len(bars)}")
 
     sm = StrategyManager(CONFIG.strategy, params=CONFIG.strat_params.__dict__)
 
-    bt = Backtester(CONFIG, sm.get(), BybitCCXT(testnet=True))
+    bt = Backtester(CONFIG, sm.get(), BybitCCXT(testnet=True, offline=True))
     res = bt.run(bars)
     print("📊 Resultado final:", res)
 
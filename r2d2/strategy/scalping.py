@@ -1,10 +1,12 @@
-from typing import Dict, Any, List
+from collections import deque
+from typing import Dict, Any, Deque
 from .base_strategy import BaseStrategy, Signal
 
 class ScalpingStrategy(BaseStrategy):
     def __init__(self, params: Dict[str, Any]):
         super().__init__(params)
-        self.buffer: Dict[str, List[float]] = {"close": []}
+        # só os últimos 5 fechamentos importam
+        self.buffer: Dict[str, Deque[float]] = {"close": deque(maxlen=5)}
 
     def on_bar(self, bar: Dict[str, float], ctx: Dict[str, Any]) -> str:
         self.buffer["close"].append(bar["close"])
@@ -1,45 +1,83 @@
-from typing import Dict, Any, List
+from collections import deque
+from typing import Dict, Any, Deque, Optional, Tuple
 from .base_strategy import BaseStrategy, Signal
 from r2d2.utils.indicators import keltner_channels
 
+# candles guardados para recalcular os indicadores quando ema/atr_period
+# mudam (ControlLoop); a EMA esquece o começo bem antes disso
+BUFFER_BARS = 5000
+
+
 class TrendFollowingStrategy(BaseStrategy):
     def __init__(self, params: Dict[str, Any]):
         super().__init__(params)
-        self.buffer: Dict[str, List[float]] = {"close": [], "high": [], "low": []}
+        self.buffer: Dict[str, Deque[float]] = {k: deque(maxlen=BUFFER_BARS) for k in ("close", "high", "low")}
         self.break_count_up = 0
         self.break_count_dn = 0
+        # EMA/ATR incrementais (mesma recursão de utils.indicators, O(1) por candle)
+        self._kc_key: Optional[Tuple[int, int]] = None
+        self._mid = self._mid_prev = self._atr = 0.0
+
+    def _update_kc(self, h: float, l: float, c: float):
+        p = self.params
+        key = (p["ema_period"], p["atr_period"])
+        if key != self._kc_key:
+            _, _, mid_l, a = keltner_channels(list(self.buffer["close"]), list(self.buffer["high"]),
+                                              list(self.buffer["low"]), key[0], key[1], 0.0)
+            self._kc_key = key
+            self._mid, self._atr = mid_l[-1], a[-1]
+            self._mid_prev = mid_l[-2] if len(mid_l) > 1 else mid_l[-1]
+            return
+        prev_c = self.buffer["close"][-2]
+        tr = max(h - l, abs(h - prev_c), abs(l - prev_c))
+        self._mid_prev = self._mid
+        if key[0] > 1:
+            k = 2.0 / (key[0] + 1)
+            self._mid = c * k + self._mid * (1 - k)
+        else:
+            self._mid = c
+        if key[1] > 1:
+            k = 2.0 / (key[1] + 1)
+            self._atr = tr * k + self._atr * (1 - k)
+        else:
+            self._atr = tr
 
     def on_bar(self, bar: Dict[str, float], ctx: Dict[str, Any]) -> str:
         p = self.params
         self.buffer["close"].append(bar["close"])
         self.buffer["high"].append(bar["high"])
         self.buffer["low"].append(bar["low"])
+        if "kc_mid" not in bar:
+            self._update_kc(bar["high"], bar["low"], bar["close"])
 
         n = len(self.buffer["close"])
         min_len = max(p["ema_period"], p["atr_period"]) + 5
         if n < min_len:
             return Signal.NONE
 
-        upper, lower, mid, a = keltner_channels(
-            self.buffer["close"], self.buffer["high"], self.buffer["low"],
-            p["ema_period"], p["atr_period"], p["keltner_mult"]
-        )
+        if "kc_mid" in bar:
+            # indicadores pré-calculados na série inteira (IndicatorCache)
+            upper, lower, mid, atr_now = bar["kc_upper"], bar["kc_lower"], bar["kc_mid"], bar["atr"]
+            ema_slope = bar["kc_slope"]
+        else:
+            mid, atr_now = self._mid, self._atr
+            upper, lower = mid + p["keltner_mult"] * atr_now, mid - p["keltner_mult"] * atr_now
+            ema_slope = mid - self._mid_prev
 
         c = self.buffer["close"][-1]
-        ema_slope = mid[-1] - mid[-2]
 
         # filtro de inclinação da média
         if p["filter_ema_slope"] and abs(ema_slope) < p["min_ema_slope_points"]:
             return Signal.NONE
         # filtro de volatilidade mínima
-        if a[-1] < p["min_atr_points"]:
+        if atr_now < p["min_atr_points"]:
             return Signal.NONE
 
         # confirmações de rompimento
-        if c > upper[-1]:
+        if c > upper:
             self.break_count_up += 1
             self.break_count_dn = 0
-        elif c < lower[-1]:
+        elif c < lower:
             self.break_count_dn += 1
             self.break_count_up = 0
         else:
@@ -53,9 +91,9 @@ class TrendFollowingStrategy(BaseStrategy):
 
         # saída básica: se já tem posição e preço voltar pro meio da banda
         if "position" in ctx and ctx["position"] != 0:
-            if ctx["position"] > 0 and c < mid[-1]:
+            if ctx["position"] > 0 and c < mid:
                 return Signal.EXIT
-            if ctx["position"] < 0 and c > mid[-1]:
+            if ctx["position"] < 0 and c > mid:
                 return Signal.EXIT
 
         return Signal.NONE
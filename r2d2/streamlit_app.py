@@ -7,7 +7,7 @@ if ROOT not in sys.path:
 # -----------------------------------------------------------------
 
 import json
-from datetime import date, datetime, timedelta
+from datetime import date, datetime, timezone
 from copy import deepcopy
 import pandas as pd
 import numpy as np
@@ -19,6 +19,9 @@ from r2d2.backtester import Backtester
 from r2d2.bybit_exchange import BybitCCXT
 from r2d2.supabase_store import SupabaseStore
 from r2d2.run_backtest import load_historical
+from r2d2.bars import BarSeries
+from r2d2.metrics import compute_metrics, EMPTY_METRICS
+from r2d2.monte_carlo import monte_carlo, summary_table
 
 st.set_page_config(page_title="R2D2 Backtester", layout="wide")
 st.title("R2D2 Backtester – Nova Simulação, Otimização & Histórico")
@@ -80,6 +83,31 @@ HELP = {
         "Por que alterar: Para separar ambiente de desenvolvimento/produção.\n"
         "Quando alterar: Mantenha ligado em simulações; desligue se for integrar com produção."
     ),
+    "data_source": (
+        "O que é: De onde vêm os candles do backtest.\n"
+        "Como funciona: 'exchange' baixa da Bybit via CCXT; 'supabase' lê a tabela ohlcv preenchida pelo "
+        "bootstrap_history (só 1m; 5m/15m/1h são agregados localmente); 'arquivo' lê um CSV/Parquet local. "
+        "Em todos os casos há cache local.\n"
+        "Por que alterar: O Supabase evita a API da exchange e serve históricos longos em poucas requisições.\n"
+        "Quando alterar: Use 'supabase' depois de rodar o bootstrap do símbolo; 'exchange' para o resto."
+    ),
+    "data_file": (
+        "O que é: Caminho de um CSV ou Parquet local com candles (AppConfig.data_csv).\n"
+        "Como funciona: Lido com o leitor multithread do pyarrow; colunas reconhecidas por nome "
+        "(timestamp/time/open_time, open, high, low, close, volume) e unidade do timestamp detectada "
+        "automaticamente (s/ms/µs/ns ou data ISO). A 1ª leitura fica em cache local.\n"
+        "Por que alterar: Para testar datasets offline sem depender da exchange.\n"
+        "Quando alterar: Só com a fonte 'arquivo'; o período do formulário recorta o arquivo."
+    ),
+    "funding": (
+        "O que é: Cobra/paga o funding dos perps lineares sobre a posição aberta.\n"
+        "Como funciona: Baixa o histórico de funding rate e open interest da Bybit (cache local), "
+        "alinha às barras (colunas funding_rate e open_interest para a estratégia) e, a cada "
+        "liquidação (normalmente 8h), debita qty x preço x taxa de quem está comprado e credita "
+        "quem está vendido (taxa positiva).\n"
+        "Por que alterar: Sem funding, posições de várias horas parecem mais (ou menos) lucrativas do que são.\n"
+        "Quando alterar: Ligue para estratégias que seguram posição por horas; scalps de minutos quase não mudam."
+    ),
     "max_daily_loss": (
         "O que é: Perda máxima diária (USD). Ao atingir, o dia é encerrado.\n"
         "Como funciona: RiskManager checa PnL do dia e bloqueia novas entradas.\n"
@@ -264,6 +292,53 @@ HELP = {
         "Por que alterar: Ajuste conforme o total de trades do período."
     ),
 
+    # Monte Carlo
+    "mc_sims": (
+        "O que é: Quantas reamostragens da sequência de trades simular.\n"
+        "Como funciona: Cada simulação monta uma curva de equity alternativa a partir das trades reais.\n"
+        "Por que alterar: Mais simulações = percentis mais estáveis (10k já é bem estável).\n"
+        "Quando alterar: Raramente; aumente só para conferir caudas extremas."
+    ),
+    "mc_method": (
+        "O que é: Forma de reamostrar as trades.\n"
+        "Como funciona: 'bootstrap' sorteia trades com reposição; 'permutation' só embaralha a ordem.\n"
+        "Por que alterar: Permutation isola o efeito da ORDEM (drawdown); bootstrap também varia o PnL final.\n"
+        "Quando alterar: Use os dois para separar sorte de sequência vs. sorte de amostra."
+    ),
+    "mc_ruin": (
+        "O que é: Drawdown (em % do capital inicial) considerado 'ruína'.\n"
+        "Como funciona: Conta a fração das simulações em que a equity toca esse nível.\n"
+        "Por que alterar: Ajuste ao ponto em que você pararia o robô.\n"
+        "Quando alterar: Perfis conservadores usam 20–30%."
+    ),
+
+    "use_vector": (
+        "O que é: Avalia todas as combinações do grid numa única passada pelos candles (arrays barras × combinações).\n"
+        "Como funciona: Indicadores são calculados uma vez; limiares (SL/TP, min ATR, slope, confirmação, janelas) viram um eixo do array.\n"
+        "Por que alterar: Grids grandes rodam em segundos em vez de um backtest completo por combinação.\n"
+        "Quando alterar: Desligue só para comparar com o backtest clássico barra-a-barra."
+    ),
+
+    # Walk-forward
+    "wf_folds": (
+        "O que é: Quantidade de janelas in-sample/out-of-sample.\n"
+        "Como funciona: Cada fold otimiza o grid no trecho IS e roda o vencedor no trecho OOS seguinte.\n"
+        "Por que alterar: Mais folds = validação mais granular, porém janelas menores.\n"
+        "Quando alterar: Períodos longos comportam mais folds."
+    ),
+    "wf_is_ratio": (
+        "O que é: Proporção do primeiro fold usada para calibração (IS).\n"
+        "Como funciona: 0.75 ⇒ 3 partes de IS para 1 de OOS.\n"
+        "Por que alterar: IS maior dá mais amostra para otimizar; OOS maior valida mais.\n"
+        "Quando alterar: Estratégias com poucas trades pedem IS maior."
+    ),
+    "wf_anchored": (
+        "O que é: Modo anchored (IS cresce desde o início) vs. rolling (IS de tamanho fixo que anda).\n"
+        "Como funciona: Anchored usa todo o histórico até o fold; rolling esquece o passado distante.\n"
+        "Por que alterar: Rolling adapta mais rápido a mudanças de regime.\n"
+        "Quando alterar: Use anchored se o comportamento do ativo for estável."
+    ),
+
     # Portfólio
     "min_vol": (
         "O que é: Volume 24h mínimo (USD) para considerar uma memecoin.\n"
@@ -683,8 +758,15 @@ def _render_faq():
 # ========= Helpers =========
 
 @st.cache_data(show_spinner=False)
-def get_bars_cached(symbol: str, timeframe: str, start: str, end: str):
-    return load_historical(symbol=symbol, timeframe=timeframe, start_date=start, end_date=end)
+def get_bars_cached(symbol: str, timeframe: str, start: str, end: str, source: str = "exchange"):
+    return load_historical(symbol=symbol, timeframe=timeframe, start_date=start, end_date=end, source=source)
+
+@st.cache_data(show_spinner=False)
+def get_bars_file_cached(path: str, timeframe: str, start: str, end: str, mtime_ns: int = 0, size: int = 0):
+    # mtime_ns/size só entram na chave do cache: arquivo regravado no mesmo caminho = nova entrada
+    from r2d2.file_loader import load_bars_file
+    to_ms = lambda d: int(datetime.fromisoformat(d).replace(tzinfo=timezone.utc).timestamp() * 1000)
+    return load_bars_file(path, start_ms=to_ms(start), end_ms=to_ms(end), timeframe=timeframe)
 
 def supabase_fetch_backtests(sb: SupabaseStore, symbol=None, timeframe=None, limit=100):
     try:
@@ -710,33 +792,6 @@ def supabase_fetch_trades(sb: SupabaseStore, backtest_id: int):
         st.warning(f"Não foi possível buscar trades no Supabase: {e}")
     return []
 
-def compute_metrics(df_trades: pd.DataFrame):
-    if df_trades.empty:
-        return {}
-    pnl = pd.to_numeric(df_trades["pnl"], errors="coerce").fillna(0.0)
-    equity = pd.to_numeric(df_trades.get("equity", pnl.cumsum()), errors="coerce").fillna(method="ffill").fillna(0.0)
-    wins = pnl[pnl > 0].sum()
-    losses = -pnl[pnl < 0].sum()
-    pf = (wins / losses) if losses > 0 else np.nan
-    wr = (pnl.gt(0).mean() * 100.0) if len(df_trades) else 0.0
-
-    cummax = np.maximum.accumulate(equity)
-    dd = equity - cummax
-    max_dd = float(dd.min()) if len(dd) else 0.0
-    idx_min = int(np.argmin(dd)) if len(dd) else 0
-    peak = float(cummax[idx_min]) if len(cummax) else 0.0
-    max_dd_pct = (max_dd / peak) if peak != 0 else np.nan
-
-    return {
-        "net_pnl": round(float(pnl.sum()), 4),
-        "trades": int(len(df_trades)),
-        "win_rate_%": round(float(wr), 2),
-        "profit_factor": round(float(pf), 3) if not np.isnan(pf) else None,
-        "expectancy": round(float(pnl.mean()), 5),
-        "max_drawdown": round(max_dd, 4),
-        "max_drawdown_%": round(float(max_dd_pct * 100), 2) if not np.isnan(max_dd_pct) else None,
-    }
-
 def show_metrics(metrics: dict, columns=6):
     if not metrics:
         st.info("Sem métricas para exibir.")
@@ -746,6 +801,26 @@ def show_metrics(metrics: dict, columns=6):
         with cols[i % columns]:
             st.metric(k, v)
 
+def show_monte_carlo(mc: dict):
+    """Cards + tabela de percentis + histogramas de uma análise Monte Carlo."""
+    if not mc or "error" in mc:
+        st.info((mc or {}).get("error", "Sem Monte Carlo para exibir."))
+        return
+    c1, c2, c3, c4 = st.columns(4)
+    c1.metric("PnL final (mediana)", f"{mc['final_pnl']['p50']:.2f}")
+    c2.metric("PnL final (p5)", f"{mc['final_pnl']['p5']:.2f}")
+    c3.metric("Prob. de prejuízo", f"{mc['prob_loss_%']}%")
+    c4.metric(f"Risco de ruína (DD ≥ {mc['ruin_drawdown_pct']:.0f}%)", f"{mc['risk_of_ruin_%']}%")
+    st.dataframe(summary_table(mc), use_container_width=True, hide_index=True)
+    samples = mc.get("samples") or {}
+    hc1, hc2 = st.columns(2)
+    for col, name in ((hc1, "final_pnl"), (hc2, "max_drawdown")):
+        if name in samples:
+            counts, edges = np.histogram(samples[name], bins=50)
+            with col:
+                st.markdown(f"**Distribuição: {name}**")
+                st.bar_chart(pd.DataFrame({"sims": counts}, index=np.round(edges[:-1], 2)))
+
 def parse_float_list(s: str) -> list:
     if not s: return []
     parts = [p.strip() for p in s.replace(";", ",").split(",")]
@@ -755,8 +830,9 @@ def parse_float_list(s: str) -> list:
         except: pass
     return out
 
-# ======= Helpers de descoberta de universo (Bybit via CCXT) =======
-import ccxt
+# ======= Helpers de descoberta de universo (Bybit REST v5 + cache de mercados) =======
+from r2d2.bybit_rest import get_rest
+from r2d2.market_cache import market_cache
 
 BLUECHIPS = {"BTC","ETH","SOL","BNB","XRP","ADA","DOGE","TRX","DOT","LTC","BCH","MATIC","AVAX","LINK","ATOM","TON","NEAR","APT","OP","ARB","TIA"}
 STABLES  = {"USDT","USDC","DAI","FDUSD","TUSD","PYUSD","FRAX"}
@@ -764,32 +840,30 @@ STABLES  = {"USDT","USDC","DAI","FDUSD","TUSD","PYUSD","FRAX"}
 @st.cache_data(show_spinner=True, ttl=600)
 def list_bybit_linear_usdt_perps_full() -> list[dict]:
     """
-    Retorna info dos mercados perp lineares USDT na Bybit com tentativa de volume via fetch_tickers().
+    Retorna info dos mercados perp lineares USDT na Bybit com volume 24h.
+    Metadados dos mercados vêm do market_cache (memória/disco, sem
+    load_markets() a cada chamada); só os tickers vão à rede, pelo cliente
+    REST compartilhado.
     """
-    ex = ccxt.bybit()
-    ex.set_sandbox_mode(False)
-    ex.options["defaultType"] = "linear"
-    markets = ex.load_markets()
-    # tenta tickers; se falhar, segue sem volume
+    markets = market_cache.markets("bybit", testnet=False)
+    # tenta tickers; se falhar (ou offline), segue sem volume
     try:
-        tickers = ex.fetch_tickers()
+        tickers = [] if CONFIG.offline else get_rest().tickers("linear")
     except Exception:
-        tickers = {}
+        tickers = []
+    by_id = {t.get("symbol"): t for t in tickers}
     out = []
     for m in markets.values():
         if m.get("type") == "swap" and m.get("linear") and m.get("quote") == "USDT":
-            sym = m["symbol"]
-            t = tickers.get(sym, {})
-            last = t.get("last") or t.get("close")
-            base_vol = t.get("baseVolume")
-            quote_vol = t.get("quoteVolume")
+            t = by_id.get(m.get("id"), {})
+            last = float(t["lastPrice"]) if t.get("lastPrice") else None
             vol_usd = None
-            if quote_vol is not None:
-                vol_usd = float(quote_vol)
-            elif base_vol is not None and last is not None:
-                vol_usd = float(base_vol) * float(last)
+            if t.get("turnover24h"):
+                vol_usd = float(t["turnover24h"])
+            elif t.get("volume24h") and last is not None:
+                vol_usd = float(t["volume24h"]) * last
             out.append({
-                "symbol": sym,
+                "symbol": m["symbol"],
                 "base": m.get("base"),
                 "quote": m.get("quote"),
                 "active": m.get("active", True),
@@ -830,26 +904,31 @@ def filter_rank_memecoins(markets: list[dict], min_vol_usd: float = 1e6, top_n:
 @st.cache_data(show_spinner=True, ttl=600)
 def get_bars_multi_cached(symbols: tuple[str, ...], timeframe: str, start: str, end: str):
     """
-    Baixa OHLCV para vários símbolos (usa load_historical).
-    - Normaliza os símbolos antes de chamar o CCXT.
+    Baixa OHLCV para vários símbolos em paralelo (usa load_historical_multi).
+    - Símbolos já presentes no store local saem do cache, sem rede.
+    - Os demais são baixados ao mesmo tempo sob um rate limit global.
     - Ignora automaticamente os que não retornarem candles ou derem erro.
-    - Mostra aviso no Streamlit com a lista dos símbolos ignorados.
+    - Mostra progresso por símbolo e aviso com a lista dos ignorados.
     """
-    from r2d2.run_backtest import normalize_symbol, load_historical
-    data = {}
-    skipped = []
+    from r2d2.run_backtest import load_historical_multi
+    bar = st.progress(0.0, text="Carregando símbolos…")
+    finished = set()
+
+    def _progress(sym, done, total, status):
+        if status in ("cache", "ok", "erro"):
+            finished.add(sym)
+        frac = len(finished) / max(1, len(symbols))
+        bar.progress(min(1.0, frac), text=f"{len(finished)}/{len(symbols)} · {sym}: {status} ({done}/{total})")
 
+    data, failed = load_historical_multi(symbols, timeframe=timeframe, start_date=start, end_date=end,
+                                         progress=_progress)
+    bar.empty()
+
+    skipped = []
     for s in symbols:
-        try:
-            bars = load_historical(symbol=s, timeframe=timeframe, start_date=start, end_date=end)
-            if not bars:
+        if not data.get(s):
+            if s not in failed:
                 print(f"⚠️ Nenhum candle retornado para {s} – ignorando.")
-                skipped.append(s)
-                data[s] = []
-                continue
-            data[s] = bars
-        except Exception as e:
-            print(f"⚠️ Erro ao carregar {s}: {e} – ignorando.")
             skipped.append(s)
             data[s] = []
 
@@ -902,6 +981,14 @@ with tab_run:
             testnet = st.checkbox("Bybit Testnet",
                                   value=bool(st.session_state.get("form_testnet", True)),
                                   key="form_testnet", help=HELP["testnet"])
+            data_source = st.selectbox("Fonte dos candles", ["exchange", "supabase", "arquivo"],
+                                       key="form_data_source", help=HELP["data_source"])
+            data_file = st.text_input("Arquivo CSV/Parquet (fonte 'arquivo')",
+                                      value=st.session_state.get("form_data_file", CONFIG.data_csv),
+                                      key="form_data_file", help=HELP["data_file"])
+            use_funding = st.checkbox("Funding rate (perp)",
+                                      value=bool(st.session_state.get("form_funding", False)),
+                                      key="form_funding", help=HELP["funding"])
 
             with st.expander("Opções de risco (se disponíveis)"):
                 max_daily_loss = st.number_input("Perda diária máxima (USDT)",
@@ -992,11 +1079,26 @@ with tab_run:
         sp.allowed_weekdays = list(map(str, weekdays)) if weekdays else []
 
         st.info(f"🔎 Baixando dados: {symbol}, {timeframe}, de {start} até {end}…")
-        bars = get_bars_cached(symbol, timeframe, str(start), str(end))
+        if data_source == "arquivo":
+            if not data_file:
+                st.error("Informe o caminho do arquivo CSV/Parquet.")
+                st.stop()
+            CONFIG.data_csv = data_file
+            try:
+                fst = os.stat(data_file)
+            except OSError as e:
+                st.error(f"Arquivo inacessível: {e}")
+                st.stop()
+            bars = get_bars_file_cached(data_file, timeframe, str(start), str(end), fst.st_mtime_ns, fst.st_size)
+        else:
+            bars = get_bars_cached(symbol, timeframe, str(start), str(end), data_source)
+        if use_funding:
+            from r2d2.funding import attach_derivs
+            bars = attach_derivs(bars, symbol)
         st.success(f"✅ Total de candles carregados: {len(bars)}")
 
         sm = StrategyManager(CONFIG.strategy, params=CONFIG.strat_params.__dict__)
-        bt = Backtester(CONFIG, sm.get(), BybitCCXT(testnet=testnet))
+        bt = Backtester(CONFIG, sm.get(), BybitCCXT(testnet=testnet, offline=True))
 
         with st.spinner("Executando backtest..."):
             results = bt.run(bars)
@@ -1061,6 +1163,20 @@ with tab_run:
             st.subheader("Métricas")
             show_metrics(compute_metrics(df))
 
+            with st.expander("🎲 Monte Carlo (robustez da curva de equity)"):
+                mc1, mc2, mc3 = st.columns(3)
+                with mc1:
+                    mc_sims = st.number_input("Simulações", value=10_000, step=1_000, min_value=100,
+                                              key="mc_sims", help=HELP["mc_sims"])
+                with mc2:
+                    mc_method = st.selectbox("Método", ["bootstrap", "permutation"], key="mc_method",
+                                             help=HELP["mc_method"])
+                with mc3:
+                    mc_ruin = st.number_input("Ruína = drawdown de (%)", value=50.0, step=5.0,
+                                              key="mc_ruin", help=HELP["mc_ruin"])
+                show_monte_carlo(monte_carlo(df, float(initial), n_sims=int(mc_sims), method=mc_method,
+                                             ruin_drawdown_pct=float(mc_ruin)))
+
             # Sugestão automática de janelas (com base nas trades desta execução)
             with st.expander("💡 Sugerir janelas (horas/dias) com base neste período"):
                 if "exit_time" in df.columns and df["exit_time"].notna().any():
@@ -1179,6 +1295,8 @@ with tab_opt:
                                      index=0, key="opt_metric_target", help=HELP["metric_target"])
         min_trades = st.number_input("Mínimo de trades", value=100, step=10,
                                      key="opt_min_trades", help=HELP["min_trades"])
+        use_vector = st.checkbox("⚡ Motor vetorizado (todas as combinações numa passada)", value=True,
+                                 key="opt_use_vector", help=HELP["use_vector"])
     with c9:
         use_time_filters = st.checkbox("Usar filtros de tempo da aba Rodar", value=True,
                                        key="opt_use_time_filters", help=HELP["use_time_filters"])
@@ -1219,8 +1337,7 @@ with tab_opt:
             # recorta últimos N dias do período
             last_ts = bars[-1].get("ts")
             if last_ts:
-                cutoff = datetime.utcfromtimestamp(last_ts/1000) - timedelta(days=int(suggest_days))
-                bars_suggest = [b for b in bars if datetime.utcfromtimestamp(b["ts"]/1000) >= cutoff]
+                bars_suggest = bars.between(last_ts - int(suggest_days) * 86_400_000)
             else:
                 bars_suggest = bars
 
@@ -1248,25 +1365,19 @@ with tab_opt:
             sp0.allowed_hours = []
             sp0.allowed_weekdays = []
             cfg0.strat_params = sp0
-            sm0 = StrategyManager(cfg0.strategy, params=sp0.__dict__)
-            bt0 = Backtester(cfg0, sm0.get(), BybitCCXT(testnet=testnet_opt))
+
+            # 1 baseline + ranking vetorizado de máscaras; backtest real só nas top máscaras
+            from r2d2.window_search import WindowSearch
+            ws = WindowSearch(cfg0, bars_suggest)
             with st.spinner("Calculando sugestão de janelas…"):
-                _ = bt0.run(bars_suggest)
-            dft = pd.DataFrame(bt0.trades_log)
-            if not dft.empty and "exit_time" in dft.columns:
-                dft["exit_time"] = pd.to_datetime(dft["exit_time"], errors="coerce")
-                dft = dft.dropna(subset=["exit_time"])
-                dft["hour"] = dft["exit_time"].dt.hour
-                per_hour = dft.groupby("hour")["pnl"].agg(["count","sum","mean"]).reset_index()
-                per_day = dft.copy()
-                per_day["dow"] = dft["exit_time"].dt.day_name()
-                per_day = per_day.groupby("dow")["pnl"].agg(["count","sum","mean"]).reset_index()
-                order = ["Monday","Tuesday","Wednesday","Thursday","Friday","Saturday","Sunday"]
-                per_day["dow"] = pd.Categorical(per_day["dow"], categories=order, ordered=True)
-                per_day = per_day.sort_values("dow")
-                hours_for_grid = per_hour[per_hour["count"]>=int(suggest_minH)].sort_values("mean", ascending=False).head(int(suggest_topH))["hour"].astype(int).tolist()
-                days_for_grid  = per_day[per_day["count"]>=int(suggest_minD)].sort_values("mean", ascending=False).head(int(suggest_topD))["dow"].astype(str).tolist()
-                st.success(f"Horas sugeridas (UTC): {hours_for_grid} | Dias sugeridos: {days_for_grid}")
+                sugg = ws.suggest(top_k=5, top_hours=int(suggest_topH), min_trades_hour=int(suggest_minH),
+                                  top_days=int(suggest_topD), min_trades_day=int(suggest_minD))
+            if not sugg["table"].empty:
+                hours_for_grid = sugg["allowed_hours"]
+                days_for_grid = sugg["allowed_weekdays"]
+                st.success(f"Horas sugeridas (UTC): {hours_for_grid or 'todas'} | Dias sugeridos: {days_for_grid or 'todos'}")
+                st.caption(f"{sugg['candidates']} máscaras ranqueadas pelo baseline; top {len(sugg['table'])} validadas com backtest.")
+                st.dataframe(sugg["table"], use_container_width=True, hide_index=True)
             else:
                 st.warning("Não foi possível gerar sugestão (poucas trades). Seguindo sem filtro de tempo.")
 
@@ -1277,46 +1388,72 @@ with tab_opt:
         else:
             st.write(f"Total de combinações: **{len(combos)}**")
             prog = st.progress(0)
-            rows = []
-            for idx, (sl, tp, tr) in enumerate(combos, start=1):
-                cfg = deepcopy(CONFIG)
-                cfg.initial_balance = float(initial_opt)
-                cfg.symbol = symbol_opt
-                cfg.timeframe = timeframe_opt
-                cfg.commission_perc = float(commission_opt)
-                cfg.slippage_points = int(slippage_opt)
-
-                if hasattr(cfg, "risk") and hasattr(cfg.risk, "max_trades_per_day"):
-                    cfg.risk.max_trades_per_day = int(st.session_state.get("form_maxtrades", 200))
-
-                sp = deepcopy(cfg.strat_params)
-                sp.sl_atr_mult = float(sl)
-                sp.tp_r_mult = float(tp)
-                sp.trail_atr_mult = float(tr)
-                sp.bars_confirm_break = int(bars_confirm_break_opt)
-                sp.min_atr_points = int(min_atr_points_opt)
-                sp.filter_ema_slope = bool(filter_ema_opt)
-                sp.min_ema_slope_points = int(min_ema_slope_opt)
-                sp.use_break_even = bool(use_be_opt)
-                sp.break_even_r = float(be_r_opt)
-                sp.use_atr_trailing = bool(use_trail_opt)
-                sp.allowed_hours = list(map(int, hours_for_grid)) if use_time_filters and hours_for_grid else (st.session_state.get("form_hours", []) if use_time_filters else [])
-                sp.allowed_weekdays = list(map(str, days_for_grid)) if use_time_filters and days_for_grid else (st.session_state.get("form_weekdays", []) if use_time_filters else [])
-                cfg.strat_params = sp
-
-                sm = StrategyManager(cfg.strategy, params=sp.__dict__)
-                bt = Backtester(cfg, sm.get(), BybitCCXT(testnet=testnet_opt))
-                res = bt.run(bars)
-                dft = pd.DataFrame(bt.trades_log)
-                metrics = compute_metrics(dft) if not dft.empty else {"net_pnl":0.0,"profit_factor":None,"win_rate_%":0.0,"expectancy":0.0,"trades":0}
-                row = {
-                    "sl_atr_mult": sl,
-                    "tp_r_mult": tp,
-                    "trail_atr_mult": tr,
-                    **metrics
-                }
-                rows.append(row)
-                prog.progress(idx/len(combos))
+            grid_hours = list(map(int, hours_for_grid)) if use_time_filters and hours_for_grid else (st.session_state.get("form_hours", []) if use_time_filters else [])
+            grid_days = list(map(str, days_for_grid)) if use_time_filters and days_for_grid else (st.session_state.get("form_weekdays", []) if use_time_filters else [])
+            vector_ok = use_vector and CONFIG.strategy == "trend_following"
+
+            cfg_grid = deepcopy(CONFIG)
+            cfg_grid.initial_balance = float(initial_opt)
+            cfg_grid.symbol = symbol_opt
+            cfg_grid.timeframe = timeframe_opt
+            cfg_grid.commission_perc = float(commission_opt)
+            cfg_grid.slippage_points = int(slippage_opt)
+            if hasattr(cfg_grid, "risk") and hasattr(cfg_grid.risk, "max_trades_per_day"):
+                cfg_grid.risk.max_trades_per_day = int(st.session_state.get("form_maxtrades", 200))
+
+            param_sets = [{
+                "sl_atr_mult": float(sl), "tp_r_mult": float(tp), "trail_atr_mult": float(tr),
+                "bars_confirm_break": int(bars_confirm_break_opt), "min_atr_points": int(min_atr_points_opt),
+                "filter_ema_slope": bool(filter_ema_opt), "min_ema_slope_points": int(min_ema_slope_opt),
+                "use_break_even": bool(use_be_opt), "break_even_r": float(be_r_opt),
+                "use_atr_trailing": bool(use_trail_opt),
+                "allowed_hours": grid_hours, "allowed_weekdays": grid_days,
+            } for sl, tp, tr in combos]
+
+            # checkpoint: combinações já avaliadas (mesmo dataset/config) são reaproveitadas
+            from r2d2.sweep_store import SweepStore
+            sweep = SweepStore()
+            sweep_ctx = {
+                "symbol": symbol_opt, "timeframe": timeframe_opt,
+                # hash do conteúdo: mesmo período com candles corrigidos vira outro dataset
+                "dataset": BarSeries.from_records(bars).manifest()["hash"],
+                "strategy": cfg_grid.strategy, "initial": cfg_grid.initial_balance,
+                "commission": cfg_grid.commission_perc, "slippage": cfg_grid.slippage_points,
+                "risk": cfg_grid.risk.__dict__, "base_params": cfg_grid.strat_params.__dict__,
+                "engine": "vector" if vector_ok else "loop",
+            }
+            done, todo = sweep.split(sweep_ctx, param_sets)
+            if done:
+                st.caption(f"♻️ {len(done)} combinações reaproveitadas do checkpoint ({sweep.path}); {len(todo)} a calcular.")
+
+            if vector_ok:
+                if todo:
+                    from r2d2.vector_backtester import VectorBacktester
+                    with st.spinner("Motor vetorizado: avaliando todas as combinações…"):
+                        dfv = VectorBacktester(cfg_grid).run(bars, [p for _, p in todo])
+                    for (k, _), row in zip(todo, dfv.to_dict("records")):
+                        sweep.put(k, row)
+                prog.progress(1.0)
+                rows = sweep.lookup(sweep_ctx, param_sets)
+            else:
+                def _evaluate(params):
+                    cfg = deepcopy(cfg_grid)
+                    sp = deepcopy(cfg.strat_params)
+                    for k, v in params.items():
+                        setattr(sp, k, v)
+                    cfg.strat_params = sp
+                    sm = StrategyManager(cfg.strategy, params=sp.__dict__)
+                    bt = Backtester(cfg, sm.get(), BybitCCXT(testnet=testnet_opt, offline=True))
+                    bt.run(bars)
+                    dft = pd.DataFrame(bt.trades_log)
+                    return compute_metrics(dft) if not dft.empty else dict(EMPTY_METRICS)
+
+                rows = sweep.run(sweep_ctx, param_sets, evaluate=_evaluate,
+                                 progress=lambda i, n: prog.progress(i / n))
+            rows = [{k: v for k, v in r.items() if k not in ("bars_confirm_break", "min_atr_points", "filter_ema_slope",
+                                                           "min_ema_slope_points", "use_break_even", "break_even_r",
+                                                           "use_atr_trailing", "allowed_hours", "allowed_weekdays")}
+                    for r in rows]
 
             dfres = pd.DataFrame(rows)
             dfres = dfres[dfres["trades"] >= int(min_trades)]
@@ -1344,6 +1481,66 @@ with tab_opt:
                     st.session_state["p_trail"] = float(best["trail_atr_mult"])
                     st.success("Parâmetros aplicados! Volte à aba 'Rodar Backtest'.")
 
+    # ---- Walk-forward (IS/OOS) ----
+    st.markdown("---")
+    st.subheader("Walk-forward (in-sample → out-of-sample)")
+    st.caption("Usa as mesmas listas SL/TP/Trail, métrica e mínimo de trades acima. Cada fold otimiza no IS e valida o vencedor no OOS.")
+    wc1, wc2, wc3 = st.columns(3)
+    with wc1:
+        wf_folds = st.number_input("Nº de folds", value=6, min_value=1, step=1, key="wf_folds", help=HELP["wf_folds"])
+    with wc2:
+        wf_is_ratio = st.slider("Fração in-sample", min_value=0.5, max_value=0.9, value=0.75, step=0.05,
+                                key="wf_is_ratio", help=HELP["wf_is_ratio"])
+    with wc3:
+        wf_anchored = st.checkbox("Anchored (IS sempre desde o início)", value=False,
+                                  key="wf_anchored", help=HELP["wf_anchored"])
+
+    if st.button("🚶 Rodar walk-forward"):
+        bars = get_bars_cached(symbol_opt, timeframe_opt, str(start_opt), str(end_opt))
+        combos = [{"sl_atr_mult": sl, "tp_r_mult": tp, "trail_atr_mult": tr}
+                  for sl in sl_values for tp in tp_values for tr in tr_values]
+        if not bars or not combos:
+            st.error("Sem candles ou listas SL/TP/Trail inválidas.")
+        else:
+            from r2d2.walk_forward import WalkForward
+            cfg_wf = deepcopy(CONFIG)
+            cfg_wf.initial_balance = float(initial_opt)
+            cfg_wf.symbol = symbol_opt
+            cfg_wf.timeframe = timeframe_opt
+            cfg_wf.commission_perc = float(commission_opt)
+            cfg_wf.slippage_points = int(slippage_opt)
+            if hasattr(cfg_wf, "risk") and hasattr(cfg_wf.risk, "max_trades_per_day"):
+                cfg_wf.risk.max_trades_per_day = int(st.session_state.get("form_maxtrades", 200))
+            sp = deepcopy(cfg_wf.strat_params)
+            sp.bars_confirm_break = int(bars_confirm_break_opt)
+            sp.min_atr_points = int(min_atr_points_opt)
+            sp.filter_ema_slope = bool(filter_ema_opt)
+            sp.min_ema_slope_points = int(min_ema_slope_opt)
+            sp.use_break_even = bool(use_be_opt)
+            sp.break_even_r = float(be_r_opt)
+            sp.use_atr_trailing = bool(use_trail_opt)
+            sp.allowed_hours = list(map(int, allowed_hours_opt)) if use_time_filters else []
+            sp.allowed_weekdays = list(map(str, allowed_days_opt)) if use_time_filters else []
+            cfg_wf.strat_params = sp
+
+            wf = WalkForward(cfg_wf, combos, metric=metric_target, min_trades=int(min_trades),
+                             n_folds=int(wf_folds), is_ratio=float(wf_is_ratio), anchored=bool(wf_anchored))
+            with st.spinner(f"Walk-forward: {int(wf_folds)} folds × {len(combos)} combinações…"):
+                try:
+                    summary_wf = wf.run(bars)
+                except ValueError as e:
+                    summary_wf = {"error": str(e)}
+
+            if "error" in summary_wf:
+                st.error(summary_wf["error"])
+            else:
+                st.subheader("Resultado OOS (costurado)")
+                show_metrics(summary_wf.get("oos", {}))
+                st.dataframe(pd.DataFrame(summary_wf.get("per_fold", [])), use_container_width=True, hide_index=True)
+                if wf.equity_curve is not None and not wf.equity_curve.empty:
+                    st.subheader("Curva de Equity OOS")
+                    st.line_chart(wf.equity_curve["equity"].reset_index(drop=True))
+
 # ========= TAB: Portfólio (multi‑ativos) =========
 with tab_portfolio:
     st.subheader("Rodar backtest nas Memecoins")
@@ -1481,7 +1678,7 @@ with tab_portfolio:
                 sp.allowed_weekdays = list(map(str, days_p)) if days_p else []
 
                 from r2d2.portfolio_backtester import PortfolioBacktester
-                pbt = PortfolioBacktester(cfg_base, exchange_factory=lambda: BybitCCXT(testnet=testnet_p),
+                pbt = PortfolioBacktester(cfg_base, exchange_factory=lambda: BybitCCXT(testnet=testnet_p, offline=True),
                                           strategy_cfg=sp.__dict__)
                 with st.spinner("Executando backtests por símbolo e agregando resultados…"):
                     summary = pbt.run(bars_by_symbol)
@@ -1517,6 +1714,9 @@ with tab_portfolio:
                         if pbt.portfolio_equity_curve is not None and not pbt.portfolio_equity_curve.empty:
                             st.subheader("Curva de Equity do Portfólio")
                             st.line_chart(pbt.portfolio_equity_curve.set_index("exit_time"))
+
+                        st.subheader("Monte Carlo do portfólio")
+                        show_monte_carlo(pbt.monte_carlo)
                     else:
                         st.info("Sem trades registradas no portfólio.")
 
@@ -1,11 +1,172 @@
 # r2d2/supabase_store.py
-import os, time
-from typing import Dict, Any, Optional
+import atexit, os, queue, threading, time
+from datetime import datetime
+from typing import Dict, Any, List, Optional
+import numpy as np
 from supabase import create_client, Client
+from r2d2.bars import BarSeries
+from r2d2.config import CONFIG
+from r2d2.journal import JournalWriter
 from r2d2.utils.logger import get_logger
 
 log = get_logger("supabase")
 
+OHLCV_TABLE = "ohlcv"
+OHLCV_EXCHANGE = "Bybit"
+OHLCV_PAGE = 10000
+
+
+def ohlcv_symbol(symbol: str) -> str:
+    """Símbolo CCXT -> id gravado pelo bootstrap ('BTC/USDT:USDT' -> 'BTCUSDT')."""
+    return symbol.split(":")[0].replace("/", "").upper()
+
+
+def ohlcv_ts_to_iso(ts_ms: int) -> str:
+    # convenção da tabela ohlcv (bootstrap_history): horário local, sem fuso
+    return datetime.fromtimestamp(ts_ms / 1000).isoformat()
+
+
+def ohlcv_iso_to_ts(ts: str) -> int:
+    return int(datetime.fromisoformat(str(ts).replace("Z", "+00:00")).timestamp() * 1000)
+
+WRITER_POLICIES = ("drop_old", "drop_new", "block")
+
+
+class SupabaseWriter:
+    """
+    Gravação em segundo plano da telemetria do live (eventos, ordens,
+    snapshots): quem chama só enfileira (microssegundos) e uma thread junta
+    as linhas por tabela e grava com um insert de várias linhas.
+
+    - flush quando a fila acumula `batch_size` linhas ou `flush_interval` s
+      depois da primeira linha pendente, o que vier antes;
+    - fila limitada (`max_queue`); cheia, segue `policy`:
+        drop_old  descarta a linha mais antiga (telemetria recente vale mais)
+        drop_new  descarta a linha nova
+        block     segura quem chama até `block_timeout` s, depois descarta
+    - falha no insert: `retries` novas tentativas com backoff; depois o lote
+      é contado em stats["failed"] e segue;
+    - flush() espera gravar o que já foi enfileirado; close() também para a
+      thread (chamado no atexit).
+    """
+
+    _FLUSH = object()
+    _STOP = object()
+
+    def __init__(self, store: "SupabaseStore", batch_size: Optional[int] = None,
+                 flush_interval: Optional[float] = None, max_queue: Optional[int] = None,
+                 policy: Optional[str] = None, block_timeout: float = 1.0, retries: int = 3):
+        self.store = store
+        self.batch_size = int(batch_size or CONFIG.sb_batch_size)
+        self.flush_interval = float(flush_interval if flush_interval is not None else CONFIG.sb_flush_s)
+        self.policy = policy or CONFIG.sb_policy
+        if self.policy not in WRITER_POLICIES:
+            raise ValueError(f"policy inválida: {self.policy} (use {', '.join(WRITER_POLICIES)})")
+        self.block_timeout = float(block_timeout)
+        self.retries = int(retries)
+        self.stats: Dict[str, int] = {"enqueued": 0, "written": 0, "dropped": 0, "failed": 0, "batches": 0}
+        self._q: "queue.Queue" = queue.Queue(maxsize=int(max_queue or CONFIG.sb_queue))
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, daemon=True, name="supabase-writer")
+        self._thread.start()
+        atexit.register(self.close)
+
+    # ---------- lado de quem grava ----------
+    def _drop(self, n: int = 1):
+        self.stats["dropped"] += n
+        d = self.stats["dropped"]
+        if d in (1, 10, 100) or d % 1000 == 0:
+            log.warning(f"fila do Supabase cheia ({self.policy}): {d} linhas descartadas")
+
+    def put(self, table: str, row: Dict[str, Any]) -> bool:
+        """Enfileira uma linha; False se ela foi descartada."""
+        if self._closed:
+            return False
+        item = (table, row)
+        try:
+            self._q.put_nowait(item)
+        except queue.Full:
+            if self.policy == "block":
+                try:
+                    self._q.put(item, timeout=self.block_timeout)
+                except queue.Full:
+                    self._drop()
+                    return False
+            elif self.policy == "drop_old":
+                try:
+                    self._q.get_nowait()
+                    self._drop()
+                except queue.Empty:
+                    pass
+                try:
+                    self._q.put_nowait(item)
+                except queue.Full:
+                    self._drop()
+                    return False
+            else:
+                self._drop()
+                return False
+        self.stats["enqueued"] += 1
+        return True
+
+    def flush(self, timeout: Optional[float] = 30.0) -> bool:
+        """Bloqueia até o que já está na fila ser gravado."""
+        if self._closed or not self._thread.is_alive():
+            return False
+        done = threading.Event()
+        self._q.put((self._FLUSH, done))
+        return done.wait(timeout)
+
+    def close(self, timeout: Optional[float] = 30.0):
+        if self._closed:
+            return
+        self._closed = True
+        if self._thread.is_alive():
+            self._q.put((self._STOP, None))
+            self._thread.join(timeout)
+
+    # ---------- thread de gravação ----------
+    def _write(self, table: str, rows: List[Dict[str, Any]]):
+        for attempt in range(self.retries + 1):
+            try:
+                self.store._insert(table, rows)
+                self.stats["written"] += len(rows)
+                self.stats["batches"] += 1
+                return
+            except Exception as e:
+                if attempt >= self.retries:
+                    self.stats["failed"] += len(rows)
+                    log.error(f"Erro ao salvar {len(rows)} linhas em {table}: {e}")
+                    return
+                time.sleep(min(10.0, 0.5 * (2 ** attempt)))
+
+    def _run(self):
+        pending: Dict[str, List[Dict[str, Any]]] = {}
+        n = 0
+        deadline: Optional[float] = None
+        while True:
+            timeout = None if deadline is None else max(0.0, deadline - time.monotonic())
+            try:
+                table, row = self._q.get(timeout=timeout)
+            except queue.Empty:
+                table, row = None, None
+            if table is not None and table is not self._FLUSH and table is not self._STOP:
+                pending.setdefault(table, []).append(row)
+                n += 1
+                if deadline is None:
+                    deadline = time.monotonic() + self.flush_interval
+                if n < self.batch_size:
+                    continue
+            # lote cheio, prazo vencido, flush() ou close()
+            for t, rows in pending.items():
+                self._write(t, rows)
+            pending, n, deadline = {}, 0, None
+            if table is self._FLUSH:
+                row.set()
+            elif table is self._STOP:
+                return
+
+
 class SupabaseStore:
     def __init__(self):
         url = os.getenv("SUPABASE_URL")
@@ -18,12 +179,77 @@ class SupabaseStore:
             self.client: Client = create_client(url, key)
             self.enabled = True
             log.info("Supabase conectado.")
+        self.writer: Optional[SupabaseWriter] = None
+
+    def start_writer(self, journal: Optional[bool] = None, **kwargs):
+        """
+        Liga a gravação em segundo plano para log_event, log_order e
+        log_snapshot. Com `journal` (padrão CONFIG.sb_journal), JournalWriter:
+        diário local primeiro, envio depois, nada perdido com o Supabase fora
+        do ar; sem ele, SupabaseWriter (fila em memória). Idempotente; None
+        com o Supabase desativado.
+        """
+        if self.enabled and self.writer is None:
+            if CONFIG.sb_journal if journal is None else journal:
+                self.writer = JournalWriter(self, **kwargs)
+            else:
+                self.writer = SupabaseWriter(self, **kwargs)
+        return self.writer
+
+    def close_writer(self):
+        """Grava o que estiver pendente e volta aos inserts síncronos."""
+        if self.writer is not None:
+            self.writer.close()
+            self.writer = None
+
+    # colunas novas que bancos antigos podem não ter (migração opcional): tabela -> {coluna: tipo}
+    OPTIONAL_COLUMNS = {
+        "backtests": {"dataset": "jsonb"},
+        "backtest_trades": {"funding": "double precision"},
+        # chave de idempotência do diário local (precisa de índice único:
+        # CREATE UNIQUE INDEX ON <tabela> (journal_id))
+        "r2d2_events": {"journal_id": "text"},
+        "r2d2_orders": {"journal_id": "text"},
+        "r2d2_snapshots": {"journal_id": "text"},
+    }
+
+    def _insert(self, table: str, rows, on_conflict: Optional[str] = None):
+        """
+        insert que sobrevive a coluna opcional ausente no schema: retira a
+        coluna (avisando o ALTER TABLE) e tenta de novo, em vez de perder a linha.
+        on_conflict: upsert que ignora linhas com a chave já gravada (reenvio
+        idempotente); sem a coluna ou sem índice único nela, vira insert simples.
+        """
+        optional = self.OPTIONAL_COLUMNS.get(table, {})
+        while True:
+            try:
+                if on_conflict:
+                    return self.client.table(table).upsert(rows, on_conflict=on_conflict,
+                                                           ignore_duplicates=True).execute()
+                return self.client.table(table).insert(rows).execute()
+            except Exception as e:
+                msg = str(e)
+                if on_conflict and ("42P10" in msg or "ON CONFLICT" in msg):
+                    log.warning(f"{table}.{on_conflict} sem índice único (CREATE UNIQUE INDEX ON {table} "
+                                f"({on_conflict})); gravando sem deduplicar")
+                    on_conflict = None
+                    continue
+                first = rows[0] if isinstance(rows, list) else rows
+                col = next((c for c in optional if c in first and f"'{c}'" in msg), None)
+                if col is None:
+                    raise
+                log.warning(f"{table} sem a coluna {col} (ALTER TABLE {table} ADD COLUMN {col} "
+                            f"{optional[col]}); gravando sem ela")
+                if col == on_conflict:
+                    on_conflict = None
+                strip = lambda r: {k: v for k, v in r.items() if k != col}
+                rows = [strip(r) for r in rows] if isinstance(rows, list) else strip(rows)
 
     def insert_backtest(self, data: Dict[str, Any]) -> Optional[str]:
         if not self.enabled:
             return None
         try:
-            res = self.client.table("backtests").insert(data).execute()
+            res = self._insert("backtests", data)
             return res.data[0]["id"]
         except Exception as e:
             log.error(f"Erro ao salvar backtest: {e}")
@@ -33,37 +259,62 @@ class SupabaseStore:
         if not self.enabled or not trades:
             return
         try:
-            self.client.table("backtest_trades").insert(trades).execute()
+            self._insert("backtest_trades", trades)
         except Exception as e:
             log.error(f"Erro ao salvar trades: {e}")
 
-    def log_event(self, event: str, data: Dict[str, Any]):
-        if not self.enabled: return
+    def _log(self, table: str, row: Dict[str, Any], what: str):
+        if self.writer is not None:
+            self.writer.put(table, row)
+            return
         try:
-            self.client.table("r2d2_events").insert({
-                "ts": int(time.time() * 1000),
-                "event": event,
-                "data": data
-            }).execute()
+            self.client.table(table).insert(row).execute()
         except Exception as e:
-            log.error(f"Erro ao salvar evento: {e}")
+            log.error(f"Erro ao salvar {what}: {e}")
+
+    def log_event(self, event: str, data: Dict[str, Any]):
+        if not self.enabled: return
+        self._log("r2d2_events", {"ts": int(time.time() * 1000), "event": event, "data": data}, "evento")
 
     def log_order(self, order: Dict[str, Any]):
         if not self.enabled: return
-        try:
-            self.client.table("r2d2_orders").insert({
-                "ts": int(time.time() * 1000),
-                "raw": order
-            }).execute()
-        except Exception as e:
-            log.error(f"Erro ao salvar ordem: {e}")
+        self._log("r2d2_orders", {"ts": int(time.time() * 1000), "raw": order}, "ordem")
 
     def log_snapshot(self, snapshot: Dict[str, Any]):
         if not self.enabled: return
-        try:
-            self.client.table("r2d2_snapshots").insert({
-                "ts": int(time.time() * 1000),
-                "snapshot": snapshot
-            }).execute()
-        except Exception as e:
-            log.error(f"Erro ao salvar snapshot: {e}")
+        self._log("r2d2_snapshots", {"ts": int(time.time() * 1000), "snapshot": snapshot}, "snapshot")
+
+    def fetch_ohlcv(self, symbol: str, start_ms: int, end_ms: int, page_size: int = OHLCV_PAGE,
+                    exchange: str = OHLCV_EXCHANGE) -> BarSeries:
+        """
+        Candles [start_ms, end_ms) da tabela ohlcv, com paginação por chave
+        (timestamp > último lido) em vez de OFFSET: cada página é uma busca no
+        índice (symbol, exchange, timestamp), sem reler as anteriores.
+        Só as colunas necessárias são pedidas. Se o servidor limitar o número
+        de linhas por resposta abaixo de page_size, segue até uma página vazia.
+        """
+        if not self.enabled:
+            raise RuntimeError("Supabase desativado (sem URL/KEY).")
+        sym = ohlcv_symbol(symbol)
+        parts = []
+        lower = ohlcv_ts_to_iso(start_ms)
+        first = True
+        end_iso = ohlcv_ts_to_iso(end_ms)
+        while True:
+            q = self.client.table(OHLCV_TABLE) \
+                .select("timestamp,open,high,low,close,volume") \
+                .eq("symbol", sym).eq("exchange", exchange)
+            q = q.gte("timestamp", lower) if first else q.gt("timestamp", lower)
+            rows = q.lt("timestamp", end_iso).order("timestamp").limit(int(page_size)).execute().data or []
+            if not rows:
+                break
+            parts.append(BarSeries({
+                "ts": np.fromiter((ohlcv_iso_to_ts(r["timestamp"]) for r in rows), dtype=np.int64, count=len(rows)),
+                **{c: np.fromiter((float(r[c]) for r in rows), dtype=np.float64, count=len(rows))
+                   for c in ("open", "high", "low", "close", "volume")},
+            }))
+            lower, first = rows[-1]["timestamp"], False
+            if int(parts[-1].ts[-1]) + 60_000 >= end_ms:
+                break
+        log.info(f"ohlcv {sym}: {sum(len(p) for p in parts)} candles em {len(parts)} página(s)")
+        return BarSeries.concat(parts)
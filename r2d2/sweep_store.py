@@ -0,0 +1,118 @@
+# r2d2/sweep_store.py
+from __future__ import annotations
+from typing import Dict, Any, Callable, Iterable, List, Optional, Tuple
+import hashlib
+import json
+import os
+import time
+
+from r2d2.config import CONFIG
+from r2d2.utils.logger import get_logger
+
+log = get_logger("sweep_store")
+
+
+def _canonical(obj: Any) -> str:
+    return json.dumps(obj, sort_keys=True, separators=(",", ":"), default=str)
+
+
+def combo_key(context: Dict[str, Any], params: Dict[str, Any]) -> str:
+    """Hash estável de (dataset/config do sweep + parâmetros da combinação)."""
+    return hashlib.sha1(_canonical({"ctx": context, "params": params}).encode("utf-8")).hexdigest()
+
+
+class SweepStore:
+    """
+    Checkpoint de sweeps: arquivo JSONL append-only onde cada linha é uma
+    combinação já avaliada, indexada pelo hash (contexto + parâmetros).
+
+    - cada resultado é gravado assim que termina (flush + fsync), então um
+      sweep interrompido (reload do Streamlit, OOM...) perde no máximo a
+      combinação em andamento;
+    - ao reiniciar, as combinações já presentes no índice são puladas;
+    - sweeps diferentes com grids sobrepostos compartilham o mesmo arquivo
+      e reaproveitam as linhas uns dos outros.
+    Uma última linha truncada por crash é ignorada na leitura.
+    """
+
+    def __init__(self, path: Optional[str] = None, fsync: bool = True):
+        self.path = path or os.path.join(CONFIG.data_dir, "sweeps", "results.jsonl")
+        self.fsync = fsync
+        self._index: Dict[str, Dict[str, Any]] = {}
+        self._load()
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            return
+        bad = 0
+        with open(self.path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    rec = json.loads(line)
+                    self._index[rec["key"]] = rec["row"]
+                except (ValueError, KeyError):
+                    bad += 1
+        if bad:
+            log.warning(f"{bad} linha(s) inválida(s) ignorada(s) em {self.path}")
+        # linha truncada no fim: termina com \n para a próxima gravação não grudar nela
+        with open(self.path, "rb+") as f:
+            f.seek(0, os.SEEK_END)
+            if f.tell() > 0:
+                f.seek(-1, os.SEEK_END)
+                if f.read(1) != b"\n":
+                    f.write(b"\n")
+
+    def __len__(self) -> int:
+        return len(self._index)
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._index
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        return self._index.get(key)
+
+    def put(self, key: str, row: Dict[str, Any]):
+        if key in self._index:
+            return
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        line = _canonical({"key": key, "ts": int(time.time() * 1000), "row": row}) + "\n"
+        # O_APPEND + uma única escrita por linha: seguro com vários processos no mesmo arquivo
+        fd = os.open(self.path, os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o644)
+        try:
+            os.write(fd, line.encode("utf-8"))
+            if self.fsync:
+                os.fsync(fd)
+        finally:
+            os.close(fd)
+        self._index[key] = row
+
+    def split(self, context: Dict[str, Any], combos: Iterable[Dict[str, Any]]) -> Tuple[List[Tuple[str, Dict[str, Any]]], List[Tuple[str, Dict[str, Any]]]]:
+        """Separa combinações em (já avaliadas, pendentes), cada item = (key, params)."""
+        done, todo = [], []
+        for params in combos:
+            k = combo_key(context, params)
+            (done if k in self._index else todo).append((k, params))
+        return done, todo
+
+    def lookup(self, context: Dict[str, Any], combos: Iterable[Dict[str, Any]]) -> List[Optional[Dict[str, Any]]]:
+        """Linhas já gravadas para as combinações (None nas pendentes), na mesma ordem."""
+        return [self._index.get(combo_key(context, p)) for p in combos]
+
+    def run(self, context: Dict[str, Any], combos: Iterable[Dict[str, Any]],
+            evaluate: Callable[[Dict[str, Any]], Dict[str, Any]],
+            progress: Optional[Callable[[int, int], None]] = None) -> List[Dict[str, Any]]:
+        """
+        Roda evaluate(params) -> métricas para cada combinação pendente,
+        gravando cada uma ao terminar. Devolve as linhas (params + métricas)
+        na ordem das combinações, incluindo as reaproveitadas.
+        """
+        combos = list(combos)
+        keys = [combo_key(context, p) for p in combos]
+        total, done = len(combos), 0
+        for k, params in zip(keys, combos):
+            if k not in self._index:
+                self.put(k, {**params, **evaluate(params)})
+            done += 1
+            if progress:
+                progress(done, total)
+        return [self._index[k] for k in keys]
@@ -0,0 +1,356 @@
+# r2d2/trade_bars.py
+from __future__ import annotations
+from typing import Any, AsyncIterator, Dict, Iterable, Iterator, List, Optional, Tuple
+import asyncio
+import json
+import os
+import re
+
+import ccxt
+import numpy as np
+
+from r2d2.bars import BarSeries
+from r2d2.utils.logger import get_logger
+
+log = get_logger("trade_bars")
+
+BYBIT_WS_PUBLIC = "wss://stream.bybit.com/v5/public/linear"
+BYBIT_WS_PUBLIC_TESTNET = "wss://stream-testnet.bybit.com/v5/public/linear"
+
+# colunas de um arquivo de trades (Bybit public data: timestamp,symbol,side,size,price,...)
+TRADE_ALIASES: Dict[str, List[str]] = {
+    "ts": ["ts", "timestamp", "time", "t", "trade_time", "exec_time"],
+    "price": ["price", "p", "exec_price"],
+    "size": ["size", "qty", "amount", "v", "volume", "exec_qty"],
+}
+
+_TIME_SPEC = re.compile(r"^\d+[smhd]$")
+MAX_FILL = 3600  # candles vazios preenchidos num buraco de barras de tempo (ao vivo e em lote)
+
+
+def parse_bar_spec(spec: str) -> Tuple[str, float]:
+    """
+    "1s"/"5s"/"1m"  -> ("time", ms)
+    "tick:500"      -> ("tick", 500)      a cada N trades
+    "vol:25"        -> ("volume", 25)     a cada N contratos negociados
+    "dollar:1e6"    -> ("dollar", 1e6)    a cada N de notional (preço x qtd)
+    """
+    spec = str(spec).strip()
+    if _TIME_SPEC.match(spec):
+        return "time", float(ccxt.Exchange.parse_timeframe(spec) * 1000)
+    kind, _, value = spec.partition(":")
+    kind = {"tick": "tick", "ticks": "tick", "vol": "volume", "volume": "volume",
+            "dollar": "dollar", "usd": "dollar"}.get(kind.lower())
+    if kind is None or not value:
+        raise ValueError(f"barra inválida: {spec!r} (use 1s, tick:N, vol:N ou dollar:N)")
+    threshold = float(value)
+    if threshold <= 0:
+        raise ValueError(f"limiar da barra deve ser > 0: {spec!r}")
+    return kind, threshold
+
+
+def is_trade_spec(spec: str) -> bool:
+    """True para barras que só saem de trades (sub-minuto ou por atividade)."""
+    try:
+        kind, value = parse_bar_spec(spec)
+    except ValueError:
+        return False
+    return kind != "time" or value < 60_000
+
+
+class TradeBarAggregator:
+    """
+    Agregação incremental de trades em barras (tempo, tick, volume, dollar).
+
+    O estado da barra aberta são alguns escalares (open/high/low/close,
+    volume, turnover, nº de trades): memória constante por barra, não
+    importa quantos trades ela tenha. update() devolve as barras que
+    fecharam com aquele trade.
+
+    - tempo: a barra do balde [k*ms, (k+1)*ms) fecha quando chega um trade
+      de balde posterior ou quando flush(now_ms) passa do fim dela; baldes
+      sem trade viram candles "flat" (close anterior, volume 0) se
+      fill_empty=True, no máximo MAX_FILL por buraco (os mais recentes).
+      Trade atrasado (balde anterior) entra na barra aberta.
+    - tick/volume/dollar: a quantidade acumulada desde o início é dividida
+      em faixas de `threshold`; o trade pertence à faixa onde a soma estava
+      quando ele chegou e a barra fecha assim que a soma passa da faixa.
+      É o mesmo critério de aggregate_trades(), então replay incremental e
+      agregação em lote geram as mesmas barras.
+    """
+
+    def __init__(self, spec: str, fill_empty: bool = True):
+        self.spec = spec
+        self.kind, self.threshold = parse_bar_spec(spec)
+        self.fill_empty = fill_empty
+        self._cum = 0.0
+        self._bar: Optional[Dict[str, Any]] = None
+        self._id = None
+        self.last_close: Optional[float] = None
+
+    def _new(self, bar_id, ts: int, price: float) -> Dict[str, Any]:
+        start = int(bar_id * self.threshold) if self.kind == "time" else int(ts)
+        self._id = bar_id
+        return {"ts": start, "open": price, "high": price, "low": price, "close": price,
+                "volume": 0.0, "turnover": 0.0, "trades": 0}
+
+    def _flat(self, start: int) -> Dict[str, Any]:
+        c = self.last_close
+        return {"ts": int(start), "open": c, "high": c, "low": c, "close": c,
+                "volume": 0.0, "turnover": 0.0, "trades": 0}
+
+    def update(self, ts: int, price: float, size: float) -> List[Dict[str, Any]]:
+        ts, price, size = int(ts), float(price), float(size)
+        out: List[Dict[str, Any]] = []
+        if self.kind == "time":
+            bar_id = ts // int(self.threshold)
+            if self._id is not None:
+                if bar_id < self._id:
+                    bar_id = self._id  # trade atrasado: entra na barra aberta
+                if self._bar is not None and bar_id > self._id:
+                    out.append(self._close())
+                if self._bar is None:
+                    if bar_id <= self._id:
+                        bar_id = self._id + 1  # balde já fechado pelo relógio (flush)
+                    else:
+                        out.extend(self._fill(bar_id))
+        else:
+            qty = 1.0 if self.kind == "tick" else (size if self.kind == "volume" else size * price)
+            bar_id = int(self._cum // self.threshold)
+            self._cum += qty
+        if self._bar is None:
+            self._bar = self._new(bar_id, ts, price)
+        b = self._bar
+        if price > b["high"]:
+            b["high"] = price
+        if price < b["low"]:
+            b["low"] = price
+        b["close"] = price
+        b["volume"] += size
+        b["turnover"] += size * price
+        b["trades"] += 1
+        if self.kind != "time" and self._cum // self.threshold > bar_id:
+            out.append(self._close())
+        return out
+
+    def update_many(self, ts: Iterable, price: Iterable, size: Iterable) -> List[Dict[str, Any]]:
+        out: List[Dict[str, Any]] = []
+        for t, p, s in zip(ts, price, size):
+            out.extend(self.update(t, p, s))
+        return out
+
+    def _close(self) -> Dict[str, Any]:
+        bar, self._bar = self._bar, None
+        self.last_close = bar["close"]
+        return bar
+
+    def _fill(self, until_id: int) -> List[Dict[str, Any]]:
+        """Candles flat para os baldes vazios entre a última barra e `until_id` (exclusivo)."""
+        if not self.fill_empty or self.last_close is None:
+            return []
+        step = int(self.threshold)
+        first = max(self._id + 1, until_id - MAX_FILL)
+        self._id = max(self._id, until_id - 1)
+        return [self._flat(k * step) for k in range(first, until_id)]
+
+    def flush(self, now_ms: Optional[int] = None, force: bool = False) -> List[Dict[str, Any]]:
+        """
+        Fecha a barra de tempo cujo fim já passou (relógio `now_ms`) — e, com
+        fill_empty, os baldes vazios até agora — ou qualquer barra com force=True.
+        """
+        out: List[Dict[str, Any]] = []
+        if self.kind == "time" and now_ms is not None and self._id is not None:
+            now_id = int(now_ms) // int(self.threshold)
+            if self._bar is not None and now_id > self._id:
+                out.append(self._close())
+            if self._bar is None:
+                out.extend(self._fill(now_id))
+        if force and self._bar is not None:
+            out.append(self._close())
+        return out
+
+    @property
+    def partial(self) -> Optional[Dict[str, Any]]:
+        """Cópia da barra ainda aberta (ou None)."""
+        return dict(self._bar) if self._bar is not None else None
+
+
+def aggregate_trades(ts: np.ndarray, price: np.ndarray, size: np.ndarray, spec: str,
+                     fill_empty: bool = True, include_partial: bool = True) -> BarSeries:
+    """
+    Versão em lote (NumPy, sem laço por trade) do TradeBarAggregator, para
+    backtests sobre arquivos de trades. Mesmas regras de fechamento.
+    include_partial=False descarta a última barra (pode estar incompleta).
+    """
+    kind, threshold = parse_bar_spec(spec)
+    ts = np.asarray(ts, dtype=np.int64)
+    price = np.asarray(price, dtype=np.float64)
+    size = np.asarray(size, dtype=np.float64)
+    if not len(ts):
+        return BarSeries.empty()
+
+    if kind == "time":
+        ids = ts // int(threshold)
+    else:
+        qty = np.ones(len(ts)) if kind == "tick" else (size if kind == "volume" else size * price)
+        before = np.concatenate(([0.0], np.cumsum(qty)[:-1]))
+        ids = np.floor(before / threshold).astype(np.int64)
+    if len(ids) > 1 and np.any(ids[1:] < ids[:-1]):
+        ids = np.maximum.accumulate(ids)  # trade atrasado entra na barra aberta
+    starts = np.flatnonzero(np.r_[True, ids[1:] != ids[:-1]])
+    ends = np.r_[starts[1:], len(ts)] - 1
+
+    cols = {
+        "ts": (ids[starts] * int(threshold)) if kind == "time" else ts[starts],
+        "open": price[starts],
+        "high": np.maximum.reduceat(price, starts),
+        "low": np.minimum.reduceat(price, starts),
+        "close": price[ends],
+        "volume": np.add.reduceat(size, starts),
+        "turnover": np.add.reduceat(size * price, starts),
+        "trades": np.diff(np.r_[starts, len(ts)]).astype(np.int64),
+    }
+    if kind == "time" and fill_empty and len(starts) > 1:
+        bar_ids = ids[starts]
+        # baldes vazios antes de cada barra real, com o mesmo teto (MAX_FILL) do _fill ao vivo
+        gap = np.minimum(np.diff(bar_ids) - 1, MAX_FILL)
+        if gap.any():
+            seg = np.r_[0, gap] + 1                      # flats + a própria barra real
+            owner = np.repeat(np.arange(len(bar_ids)), seg)
+            offs = np.arange(int(seg.sum())) - np.repeat(np.cumsum(seg) - seg, seg)
+            real = offs == seg[owner] - 1
+            full = bar_ids[owner] - (seg[owner] - 1) + offs
+            pos = np.where(real, owner, owner - 1)       # flat: close da última barra real antes dele
+            close = cols["close"][pos]
+            filled = {"ts": full * int(threshold)}
+            for c in ("open", "high", "low", "close"):
+                filled[c] = np.where(real, cols[c][pos], close)
+            for c in ("volume", "turnover", "trades"):
+                filled[c] = np.where(real, cols[c][pos], 0).astype(cols[c].dtype)
+            cols = filled
+    bars = BarSeries(cols, meta={"timeframe": spec, "source": "trades"})
+    if not include_partial and len(bars):
+        bars = bars[:-1]
+    return bars
+
+
+# ---------- arquivos de trades ----------
+def read_trades(path: str, start_ms: Optional[int] = None,
+                end_ms: Optional[int] = None) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    (ts_ms, price, size) de um CSV (também .csv.gz, como os dumps públicos da
+    Bybit) ou Parquet de trades, ordenados por ts. Mesma leitura em colunas
+    do file_loader (pyarrow multithread, aliases, unidade do ts detectada).
+    """
+    import pyarrow.csv as pacsv
+    import pyarrow.parquet as pq
+    from r2d2.file_loader import _ts_to_ms
+
+    def _pick(names):
+        lower = {n.strip().lower(): n for n in names}
+        cols = {}
+        for k, opts in TRADE_ALIASES.items():
+            for o in opts:
+                if o in lower:
+                    cols[k] = lower[o]
+                    break
+        if len(cols) < 3:
+            raise ValueError(f"{path}: colunas de trade não encontradas (precisa ts, price, size; há {names})")
+        return cols
+
+    if path.lower().endswith((".parquet", ".pq")):
+        cols = _pick(pq.read_schema(path).names)
+        t = pq.read_table(path, columns=list(cols.values()), use_threads=True)
+    else:
+        head = pacsv.open_csv(path).schema.names
+        cols = _pick(head)
+        t = pacsv.read_csv(path, read_options=pacsv.ReadOptions(use_threads=True, block_size=64 << 20),
+                           convert_options=pacsv.ConvertOptions(include_columns=list(cols.values())))
+    ts = _ts_to_ms(t.column(cols["ts"]))
+    price = t.column(cols["price"]).to_numpy().astype(np.float64)
+    size = t.column(cols["size"]).to_numpy().astype(np.float64)
+    if len(ts) > 1 and np.any(ts[1:] < ts[:-1]):
+        order = np.argsort(ts, kind="stable")
+        ts, price, size = ts[order], price[order], size[order]
+    i0 = 0 if start_ms is None else int(np.searchsorted(ts, start_ms, side="left"))
+    i1 = len(ts) if end_ms is None else int(np.searchsorted(ts, end_ms, side="left"))
+    return ts[i0:i1], price[i0:i1], size[i0:i1]
+
+
+def load_trade_bars(path: str, spec: str, start_ms: Optional[int] = None, end_ms: Optional[int] = None,
+                    fill_empty: bool = True) -> BarSeries:
+    """Arquivo de trades -> BarSeries no `spec` pedido (para o Backtester)."""
+    ts, price, size = read_trades(path, start_ms, end_ms)
+    bars = aggregate_trades(ts, price, size, spec, fill_empty=fill_empty)
+    bars.meta["source"] = f"trades:{os.path.abspath(path)}"
+    return bars
+
+
+def replay_trade_batches(path: str, batch: int = 1000, start_ms: Optional[int] = None,
+                         end_ms: Optional[int] = None) -> Iterator[Tuple[np.ndarray, np.ndarray, np.ndarray]]:
+    """Lotes (ts, price, size) de um arquivo gravado, no formato do stream ao vivo."""
+    ts, price, size = read_trades(path, start_ms, end_ms)
+    for i in range(0, len(ts), batch):
+        yield ts[i:i + batch], price[i:i + batch], size[i:i + batch]
+
+
+def replay_bars(path: str, spec: str, batch: int = 1000) -> Iterator[Dict[str, Any]]:
+    """Barras fechadas na ordem em que o modo ao vivo as veria, a partir de um arquivo."""
+    agg = TradeBarAggregator(spec)
+    for ts, price, size in replay_trade_batches(path, batch):
+        yield from agg.update_many(ts.tolist(), price.tolist(), size.tolist())
+    yield from agg.flush(force=True)
+
+
+class TradeRecorder:
+    """Grava o stream ao vivo em CSV (ts,price,size,side) para replay depois."""
+
+    def __init__(self, path: str):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        new = not os.path.exists(path) or os.path.getsize(path) == 0
+        self._f = open(path, "a", encoding="utf-8", buffering=1 << 16)
+        if new:
+            self._f.write("ts,price,size,side\n")
+
+    def write(self, trades: Iterable[Dict[str, Any]]):
+        self._f.write("".join(f"{t['ts']},{t['price']},{t['size']},{t.get('side', '')}\n" for t in trades))
+
+    def close(self):
+        self._f.close()
+
+
+# ---------- stream público da Bybit ----------
+async def bybit_trade_stream(symbol: str, testnet: bool = False, ping_interval: float = 20.0,
+                             reconnect_delay: float = 1.0) -> AsyncIterator[List[Dict[str, Any]]]:
+    """
+    Lotes de trades {"ts","price","size","side"} do tópico publicTrade.<SYMBOL>
+    (WebSocket v5, aiohttp). Reconecta sozinho com backoff.
+    """
+    import aiohttp
+    from r2d2.supabase_store import ohlcv_symbol
+
+    topic = f"publicTrade.{ohlcv_symbol(symbol)}"
+    url = BYBIT_WS_PUBLIC_TESTNET if testnet else BYBIT_WS_PUBLIC
+    delay = reconnect_delay
+    while True:
+        try:
+            async with aiohttp.ClientSession() as session:
+                async with session.ws_connect(url, heartbeat=ping_interval) as ws:
+                    await ws.send_str(json.dumps({"op": "subscribe", "args": [topic]}))
+                    delay = reconnect_delay
+                    async for msg in ws:
+                        if msg.type != aiohttp.WSMsgType.TEXT:
+                            if msg.type in (aiohttp.WSMsgType.CLOSED, aiohttp.WSMsgType.ERROR):
+                                break
+                            continue
+                        body = json.loads(msg.data)
+                        if body.get("topic") != topic:
+                            continue
+                        yield [{"ts": int(t["T"]), "price": float(t["p"]), "size": float(t["v"]), "side": t.get("S")}
+                               for t in body.get("data", [])]
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            log.warning(f"stream de trades {topic} caiu: {e}; reconectando em {delay:.0f}s")
+        await asyncio.sleep(delay)
+        delay = min(delay * 2, 30.0)
@@ -1,5 +1,6 @@
 # r2d2/utils/indicators.py
 from typing import List, Tuple
+import numpy as np
 
 def ema(values: List[float], period: int) -> List[float]:
     if period <= 1 or len(values) == 0:
@@ -30,3 +31,36 @@ def keltner_channels(close, high, low, ema_period, atr_period, mult) -> Tuple[Li
     upper = [m + mult * av for m, av in zip(mid, a)]
     lower = [m - mult * av for m, av in zip(mid, a)]
     return upper, lower, mid, a
+
+
+# ---------- versões vetorizadas (NumPy), mesmas fórmulas das funções acima ----------
+def ema_np(values, period: int) -> np.ndarray:
+    x = np.asarray(values, dtype=np.float64)
+    if period <= 1 or len(x) == 0:
+        return x.copy()
+    k = 2.0 / (period + 1)
+    out = np.empty_like(x)
+    prev = None
+    # recursão da EMA: laço único sobre floats nativos (sem overhead de indexação NumPy)
+    for i, v in enumerate(x.tolist()):
+        prev = v if prev is None else v * k + prev * (1 - k)
+        out[i] = prev
+    return out
+
+def true_range_np(high, low, close) -> np.ndarray:
+    h = np.asarray(high, dtype=np.float64)
+    l = np.asarray(low, dtype=np.float64)
+    c = np.asarray(close, dtype=np.float64)
+    tr = h - l
+    if len(tr) > 1:
+        prev_c = c[:-1]
+        tr[1:] = np.maximum.reduce([h[1:] - l[1:], np.abs(h[1:] - prev_c), np.abs(l[1:] - prev_c)])
+    return tr
+
+def atr_np(high, low, close, period: int) -> np.ndarray:
+    return ema_np(true_range_np(high, low, close), period)
+
+def keltner_channels_np(close, high, low, ema_period, atr_period, mult):
+    mid = ema_np(close, ema_period)
+    a = atr_np(high, low, close, atr_period)
+    return mid + mult * a, mid - mult * a, mid, a
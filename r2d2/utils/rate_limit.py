@@ -0,0 +1,76 @@
+import asyncio
+import threading
+import time
+
+# Bybit v5 (endpoints públicos): 600 requisições / 5s por IP = 120 req/s.
+# Usamos menos da metade para sobrar folga para o bot ao vivo no mesmo IP.
+BYBIT_PUBLIC_RATE = 50.0
+BYBIT_PUBLIC_BURST = 20
+
+
+class AsyncTokenBucket:
+    """
+    Token bucket para asyncio: `rate` tokens/s, até `capacity` acumulados.
+    Compartilhado entre tarefas (e entre símbolos) para que a soma das
+    requisições respeite o limite da exchange.
+    """
+
+    def __init__(self, rate: float = BYBIT_PUBLIC_RATE, capacity: int = BYBIT_PUBLIC_BURST):
+        self.rate = float(rate)
+        self.capacity = float(capacity)
+        self._tokens = float(capacity)
+        self._last = time.monotonic()
+        self._lock = None
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._last) * self.rate)
+        self._last = now
+
+    async def acquire(self, tokens: float = 1.0):
+        # lock criado sob demanda: o bucket pode ser instanciado fora do loop
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            while True:
+                self._refill()
+                if self._tokens >= tokens:
+                    self._tokens -= tokens
+                    return
+                await asyncio.sleep((tokens - self._tokens) / self.rate)
+
+    def penalize(self, seconds: float):
+        """Esvazia o bucket por `seconds` (ex.: após um 429 da exchange)."""
+        self._refill()
+        self._tokens = min(self._tokens, 0.0) - float(seconds) * self.rate
+
+
+class TokenBucket:
+    """Mesma ideia do AsyncTokenBucket, para threads (requests/supabase síncronos)."""
+
+    def __init__(self, rate: float = BYBIT_PUBLIC_RATE, capacity: int = BYBIT_PUBLIC_BURST):
+        self.rate = float(rate)
+        self.capacity = float(capacity)
+        self._tokens = float(capacity)
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._last) * self.rate)
+        self._last = now
+
+    def acquire(self, tokens: float = 1.0):
+        while True:
+            with self._lock:
+                self._refill()
+                if self._tokens >= tokens:
+                    self._tokens -= tokens
+                    return
+                wait = (tokens - self._tokens) / self.rate
+            time.sleep(wait)
+
+    def penalize(self, seconds: float):
+        with self._lock:
+            self._refill()
+            self._tokens = min(self._tokens, 0.0) - float(seconds) * self.rate
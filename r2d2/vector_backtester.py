@@ -0,0 +1,267 @@
+# r2d2/vector_backtester.py
+from __future__ import annotations
+from typing import Dict, List, Any, Optional, Sequence
+
+import numpy as np
+import pandas as pd
+
+from r2d2.bars import BarSeries
+from r2d2.indicator_cache import IndicatorCache
+from r2d2.utils.logger import get_logger
+
+log = get_logger("vector_backtest")
+
+WEEKDAYS = ["Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday"]
+
+# parâmetros que viram um eixo de array (só mudam limiares)
+VECTOR_PARAMS = ("min_atr_points", "min_ema_slope_points", "filter_ema_slope", "bars_confirm_break",
+                 "sl_atr_mult", "tp_r_mult", "allowed_hours", "allowed_weekdays")
+# parâmetros que mudam os indicadores: cada combinação distinta vira um grupo
+INDICATOR_PARAMS = ("ema_period", "atr_period", "keltner_mult")
+
+
+class VectorBacktester:
+    """
+    Avalia P conjuntos de parâmetros da TrendFollowingStrategy numa única
+    passada pelas barras: o estado de cada conjunto (contadores de rompimento,
+    posição, equity, dia do RiskManager) é um vetor de tamanho P e cada barra
+    atualiza todos de uma vez.
+
+    Os filtros dependentes de parâmetro (ATR/slope mínimos, janela de hora/dia)
+    são montados como matrizes (barras × P) em blocos de barras, com tamanho
+    limitado por mem_budget_mb.
+
+    Replica as regras do Backtester com indicadores pré-calculados
+    (IndicatorCache): mesmos stops no fechamento (a estratégia vê a barra do
+    stop, mas não opera nela), sizing do RiskManager, taxas sobre notional
+    de entrada+saída e fechamento no fim do período.
+    Parâmetros que o Backtester não usa (trail/break-even) só são repassados
+    para a tabela de resultados.
+    """
+
+    def __init__(self, cfg, point_value: float = 1.0, mem_budget_mb: float = 256.0):
+        if cfg.strategy != "trend_following":
+            raise ValueError(f"motor vetorizado só suporta trend_following (recebido: {cfg.strategy})")
+        self.cfg = cfg
+        self.point_value = float(point_value)
+        self.mem_budget = int(mem_budget_mb * 1024 * 1024)
+
+    # ---------- API ----------
+    def run(self, bars, param_sets: Sequence[Dict[str, Any]], cache: Optional[IndicatorCache] = None) -> pd.DataFrame:
+        cache = cache or IndicatorCache.for_bars(bars)
+        base = dict(self.cfg.strat_params.__dict__)
+        full = [{**base, **p} for p in param_sets]
+
+        groups: Dict[Any, List[int]] = {}
+        for j, p in enumerate(full):
+            groups.setdefault(IndicatorCache.key(p), []).append(j)
+
+        rows: List[Optional[Dict[str, Any]]] = [None] * len(full)
+        for key, idx in groups.items():
+            series = cache.annotate(full[idx[0]])
+            for j, m in zip(idx, self._run_group(series, [full[j] for j in idx])):
+                rows[j] = {**dict(param_sets[j]), **m}
+        return pd.DataFrame(rows)
+
+    # ---------- núcleo ----------
+    def _param_vectors(self, params: List[Dict[str, Any]]) -> Dict[str, np.ndarray]:
+        P = len(params)
+        hour_mask = np.ones((P, 24), dtype=bool)
+        day_mask = np.ones((P, 7), dtype=bool)
+        for j, p in enumerate(params):
+            hours = p.get("allowed_hours") or []
+            days = p.get("allowed_weekdays") or []
+            if hours:
+                hour_mask[j] = False
+                hour_mask[j, [int(h) for h in hours]] = True
+            if days:
+                day_mask[j] = False
+                day_mask[j, [WEEKDAYS.index(d) for d in days]] = True
+        return {
+            "min_atr": np.array([float(p["min_atr_points"]) for p in params]),
+            "min_slope": np.array([float(p["min_ema_slope_points"]) for p in params]),
+            "use_slope": np.array([bool(p["filter_ema_slope"]) for p in params]),
+            "bcb": np.array([int(p["bars_confirm_break"]) for p in params]),
+            "stop_pts": np.maximum(1.0, np.array([float(p["sl_atr_mult"]) for p in params]) * 10),
+            "tp_mult": np.array([float(p["tp_r_mult"]) for p in params]),
+            "hour_mask": hour_mask,
+            "day_mask": day_mask,
+        }
+
+    def _run_group(self, bars: BarSeries, params: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        n, P = len(bars), len(params)
+        if n == 0 or P == 0:
+            return [{} for _ in range(P)]
+        v = self._param_vectors(params)
+        risk = self.cfg.risk
+        commission = float(self.cfg.commission_perc)
+        pv = self.point_value
+        min_len = max(int(params[0]["ema_period"]), int(params[0]["atr_period"])) + 5
+
+        close = bars.col("close")
+        upper, lower, mid = bars.col("kc_upper"), bars.col("kc_lower"), bars.col("kc_mid")
+        slope_abs, atr = np.abs(bars.col("kc_slope")), bars.col("atr")
+        ts = bars.ts
+        day = ts // 86_400_000
+        hour = (ts // 3_600_000) % 24
+        weekday = (day + 3) % 7  # 1970-01-01 foi quinta-feira
+        brk_up = close > upper
+        brk_dn = close < lower
+
+        # ---- estado por conjunto de parâmetros (vetores P) ----
+        up = np.zeros(P, dtype=np.int64)
+        dn = np.zeros(P, dtype=np.int64)
+        pos = np.zeros(P, dtype=np.int8)
+        entry = np.zeros(P)
+        qty = np.zeros(P)
+        sl = np.zeros(P)
+        tp = np.zeros(P)
+        equity = np.full(P, float(self.cfg.initial_balance))
+        day_start = equity.copy()
+        day_trades = np.zeros(P, dtype=np.int64)
+        day_dd = np.zeros(P)
+        day_closed = np.zeros(P, dtype=bool)
+        st = {
+            "pnl": np.zeros(P), "trades": np.zeros(P, dtype=np.int64), "wins": np.zeros(P, dtype=np.int64),
+            "pos_trades": np.zeros(P, dtype=np.int64), "gross_win": np.zeros(P), "gross_loss": np.zeros(P),
+            "peak": np.full(P, -np.inf), "max_dd": np.full(P, np.inf), "dd_peak": np.zeros(P),
+            "tp_hits": np.zeros(P, dtype=np.int64), "sl_hits": np.zeros(P, dtype=np.int64),
+        }
+
+        def settle(mask: np.ndarray, price: float, stop_exit: bool = False):
+            """_apply_pnl + RiskManager.register_trade, para os conjuntos em mask."""
+            gross = np.where(pos[mask] == 1, price - entry[mask], entry[mask] - price) * qty[mask]
+            fee = commission * (np.abs(entry[mask]) * np.abs(qty[mask]) + abs(price) * np.abs(qty[mask]))
+            net = gross - fee
+            eq = equity[mask] + net
+            equity[mask] = eq
+            st["pnl"][mask] += net
+            st["trades"][mask] += 1
+            st["wins"][mask] += net >= 0
+            st["pos_trades"][mask] += net > 0
+            st["gross_win"][mask] += np.where(net > 0, net, 0.0)
+            st["gross_loss"][mask] += np.where(net < 0, -net, 0.0)
+            peak = np.maximum(st["peak"][mask], eq)
+            st["peak"][mask] = peak
+            dd = eq - peak
+            better = dd < st["max_dd"][mask]
+            st["max_dd"][mask] = np.where(better, dd, st["max_dd"][mask])
+            st["dd_peak"][mask] = np.where(better, peak, st["dd_peak"][mask])
+            if stop_exit:
+                is_long = pos[mask] == 1
+                hit_tp = np.where(is_long, price >= tp[mask], price <= tp[mask])
+                hit_sl = ~hit_tp & np.where(is_long, price <= sl[mask], price >= sl[mask])
+                st["tp_hits"][mask] += hit_tp
+                st["sl_hits"][mask] += hit_sl
+            day_trades[mask] += 1
+            dd_day = day_dd[mask] + np.where(net < 0, -net, 0.0)
+            day_dd[mask] = dd_day
+            day_closed[mask] |= dd_day >= risk.max_daily_loss_money
+            pos[mask] = 0
+            qty[mask] = 0.0
+
+        # bloco de barras para as matrizes (barras × P): ~4 bools por célula
+        chunk = max(1, min(n, self.mem_budget // max(1, 4 * P)))
+        current_day = None
+        for c0 in range(0, n, chunk):
+            c1 = min(n, c0 + chunk)
+            atr_ok = atr[c0:c1, None] >= v["min_atr"][None, :]
+            slope_ok = ~v["use_slope"][None, :] | (slope_abs[c0:c1, None] >= v["min_slope"][None, :])
+            filt_ok = atr_ok & slope_ok
+            time_ok = v["hour_mask"][:, hour[c0:c1]].T & v["day_mask"][:, weekday[c0:c1]].T
+
+            for r in range(c1 - c0):
+                i = c0 + r
+                price = float(close[i])
+
+                # rollover diário (UTC)
+                if day[i] != current_day:
+                    current_day = day[i]
+                    day_start[:] = equity
+                    day_trades[:] = 0
+                    day_dd[:] = 0.0
+                    day_closed[:] = False
+
+                # 1) stops no fechamento: quem fecha aqui não opera nesta barra
+                active = np.ones(P, dtype=bool)
+                is_open = pos != 0
+                if is_open.any():
+                    hit = is_open & np.where(pos == 1, (price <= sl) | (price >= tp), (price >= sl) | (price <= tp))
+                    if hit.any():
+                        settle(hit, price, stop_exit=True)
+                        active = ~hit
+
+                # 2) estratégia: vê toda barra, inclusive a do stop (como o Backtester)
+                if i + 1 < min_len:
+                    continue
+                passes = filt_ok[r]
+                if not passes.any():
+                    continue
+                if brk_up[i]:
+                    up[passes] += 1
+                    dn[passes] = 0
+                elif brk_dn[i]:
+                    dn[passes] += 1
+                    up[passes] = 0
+                else:
+                    up[passes] = np.maximum(0, up[passes] - 1)
+                    dn[passes] = np.maximum(0, dn[passes] - 1)
+
+                buy = passes & (up >= v["bcb"])
+                sell = passes & ~buy & (dn >= v["bcb"])
+                c_mid = close[i] - mid[i]
+                exit_ = passes & ~buy & ~sell & (((pos == 1) & (c_mid < 0)) | ((pos == -1) & (c_mid > 0)))
+
+                # 2a) entradas (somente flat, fora da barra do stop): tempo -> risco -> não abrir na última barra
+                want = (buy | sell) & (pos == 0) & active
+                if want.any() and i != n - 1:
+                    ok = want & time_ok[r] & ~day_closed & (day_trades < risk.max_trades_per_day) \
+                        & (day_dd < risk.max_daily_loss_money)
+                    if ok.any():
+                        stop_pts = v["stop_pts"][ok]
+                        capital = equity[ok] if risk.use_equity_for_risk else day_start[ok]
+                        q = capital * (risk.risk_per_trade_pct / 100.0) / (stop_pts * pv)
+                        if risk.lot_per_money and risk.lot_per_money > 0:
+                            q = np.minimum(q, np.maximum(1.0, capital / risk.lot_per_money))
+                        q = np.maximum(0.01, np.round(q, 3))
+                        side = np.where(buy[ok], 1, -1).astype(np.int8)
+                        pos[ok] = side
+                        entry[ok] = price
+                        qty[ok] = q
+                        sl[ok] = price - side * stop_pts
+                        tp[ok] = price + side * v["tp_mult"][ok] * stop_pts
+
+                # 2b) saídas por EXIT
+                if exit_.any():
+                    settle(exit_, price)
+
+        # 3) fecha o que sobrou no fim do período
+        still = pos != 0
+        if still.any():
+            settle(still, float(close[-1]))
+
+        out = []
+        for j in range(P):
+            trades = int(st["trades"][j])
+            if trades == 0:
+                out.append({"net_pnl": 0.0, "profit_factor": None, "win_rate_%": 0.0, "expectancy": 0.0, "trades": 0,
+                            "final_balance": float(equity[j])})
+                continue
+            gl = st["gross_loss"][j]
+            pf = st["gross_win"][j] / gl if gl > 0 else None
+            max_dd, dd_peak = float(st["max_dd"][j]), float(st["dd_peak"][j])
+            out.append({
+                "net_pnl": round(float(st["pnl"][j]), 4),
+                "trades": trades,
+                "win_rate_%": round(float(st["pos_trades"][j] / trades * 100.0), 2),
+                "profit_factor": round(float(pf), 3) if pf is not None else None,
+                "expectancy": round(float(st["pnl"][j] / trades), 5),
+                "max_drawdown": round(max_dd, 4),
+                "max_drawdown_%": round(max_dd / dd_peak * 100, 2) if dd_peak != 0 else None,
+                "wins": int(st["wins"][j]),
+                "losses": trades - int(st["wins"][j]),
+                "tp_hits": int(st["tp_hits"][j]),
+                "sl_hits": int(st["sl_hits"][j]),
+                "final_balance": float(equity[j]),
+            })
+        return out
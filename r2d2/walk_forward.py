@@ -0,0 +1,221 @@
+# r2d2/walk_forward.py
+from __future__ import annotations
+from dataclasses import dataclass
+from typing import Dict, List, Any, Optional, Tuple
+from copy import deepcopy
+from concurrent.futures import ProcessPoolExecutor
+import math
+
+import pandas as pd
+
+from r2d2.bars import BarSeries
+from r2d2.backtester import Backtester
+from r2d2.exchange_api import OfflineExchange
+from r2d2.indicator_cache import IndicatorCache
+from r2d2.metrics import compute_metrics, EMPTY_METRICS
+from r2d2.strategy_manager import StrategyManager
+from r2d2.utils.logger import get_logger
+
+log = get_logger("walk_forward")
+
+
+@dataclass
+class Fold:
+    index: int
+    is_start: int
+    is_end: int      # exclusivo
+    oos_start: int
+    oos_end: int     # exclusivo
+
+
+def make_folds(n_bars: int, n_folds: int = 12, is_ratio: float = 0.75, anchored: bool = False) -> List[Fold]:
+    """
+    Divide [0, n_bars) em folds in-sample/out-of-sample.
+
+    - rolling: janela IS de tamanho fixo que anda OOS barras a cada fold
+    - anchored: IS sempre começa na barra 0 e cresce a cada fold
+    is_ratio = IS / (IS + OOS) do primeiro fold.
+    """
+    if n_folds < 1 or not (0.0 < is_ratio < 1.0):
+        raise ValueError("n_folds >= 1 e 0 < is_ratio < 1")
+    is_per_oos = is_ratio / (1.0 - is_ratio)
+    oos_len = int(n_bars // (n_folds + is_per_oos))
+    is_len = n_bars - n_folds * oos_len
+    if oos_len < 1 or is_len < 1:
+        raise ValueError(f"poucas barras ({n_bars}) para {n_folds} folds")
+
+    folds = []
+    for k in range(n_folds):
+        oos_start = is_len + k * oos_len
+        oos_end = n_bars if k == n_folds - 1 else oos_start + oos_len
+        is_start = 0 if anchored else k * oos_len
+        folds.append(Fold(k, is_start, oos_start, oos_start, oos_end))
+    return folds
+
+
+def _cfg_with_params(base_cfg, params: Dict[str, Any]):
+    cfg = deepcopy(base_cfg)
+    sp = deepcopy(cfg.strat_params)
+    for k, v in params.items():
+        setattr(sp, k, v)
+    cfg.strat_params = sp
+    return cfg
+
+
+def _run_once(cfg, bars, point_value: float) -> List[dict]:
+    sm = StrategyManager(cfg.strategy, params=cfg.strat_params.__dict__)
+    bt = Backtester(cfg, sm.get(), OfflineExchange(point_value), persist=False)
+    bt.run(bars)
+    return bt.trades_log
+
+
+def _score(metrics: Dict[str, Any], metric: str) -> Tuple[float, float]:
+    v = metrics.get(metric)
+    return (float(v) if v is not None else -math.inf, float(metrics.get("net_pnl") or 0.0))
+
+
+def _optimize_fold(job: Dict[str, Any]) -> Dict[str, Any]:
+    """Worker (processo separado): grid no IS, roda o vencedor no OOS."""
+    base_cfg, combos, point_value = job["cfg"], job["combos"], job["point_value"]
+    rows, best, best_score = [], None, None
+    for ci, params in enumerate(combos):
+        cfg = _cfg_with_params(base_cfg, params)
+        trades = _run_once(cfg, job["is_bars"][job["combo_keys"][ci]], point_value)
+        m = compute_metrics(pd.DataFrame(trades)) if trades else dict(EMPTY_METRICS)
+        rows.append({**params, **m})
+        if m.get("trades", 0) < job["min_trades"]:
+            continue
+        sc = _score(m, job["metric"])
+        if best_score is None or sc > best_score:
+            best, best_score = ci, sc
+
+    out = {"fold": job["fold"], "is_rows": rows, "best_params": None, "oos_trades": []}
+    if best is not None:
+        params = combos[best]
+        cfg = _cfg_with_params(base_cfg, params)
+        out["best_params"] = params
+        out["is_metrics"] = {k: v for k, v in rows[best].items() if k not in params}
+        out["oos_trades"] = _run_once(cfg, job["oos_bars"][job["combo_keys"][best]], point_value)
+    return out
+
+
+class WalkForward:
+    """
+    Walk-forward: otimiza em cada janela in-sample (folds em paralelo),
+    valida o vencedor fora da amostra e costura as trades OOS numa curva só.
+
+    Os indicadores são calculados uma vez sobre a série inteira (IndicatorCache)
+    e cada fold recebe apenas recortes dela, então folds sobrepostos
+    (rolling/anchored) não recalculam nada. O Backtester sobre esses recortes
+    dá o mesmo que sobre as barras cruas do trecho quando ele começa na barra
+    0 (folds ancorados); nos demais, os indicadores já chegam aquecidos pelas
+    barras anteriores ao fold, como chegariam ao vivo.
+    """
+
+    def __init__(self, base_cfg, param_grid: List[Dict[str, Any]], metric: str = "net_pnl",
+                 min_trades: int = 0, n_folds: int = 12, is_ratio: float = 0.75,
+                 anchored: bool = False, max_workers: Optional[int] = None, point_value: float = 1.0):
+        self.base_cfg = base_cfg
+        self.param_grid = [dict(p) for p in param_grid] or [{}]
+        self.metric = metric
+        self.min_trades = int(min_trades)
+        self.n_folds = int(n_folds)
+        self.is_ratio = float(is_ratio)
+        self.anchored = bool(anchored)
+        self.max_workers = max_workers
+        self.point_value = float(point_value)
+
+        self.folds: List[Fold] = []
+        self.fold_results: List[Dict[str, Any]] = []
+        self.oos_trades: List[dict] = []
+        self.equity_curve: Optional[pd.DataFrame] = None
+        self.summary: Dict[str, Any] = {}
+
+    def _jobs(self, bars: BarSeries) -> List[Dict[str, Any]]:
+        cache = IndicatorCache.for_bars(bars)
+        base_params = dict(self.base_cfg.strat_params.__dict__)
+        annotated, combo_keys = {}, []
+        for params in self.param_grid:
+            p = {**base_params, **params}
+            if self.base_cfg.strategy == "trend_following":
+                key = IndicatorCache.key(p)
+                if key not in annotated:
+                    annotated[key] = cache.annotate(p)
+            else:
+                key = None
+                annotated.setdefault(None, cache.bars)
+            combo_keys.append(key)
+
+        jobs = []
+        for f in self.folds:
+            jobs.append({
+                "fold": f.index,
+                "cfg": self.base_cfg,
+                "combos": self.param_grid,
+                "combo_keys": combo_keys,
+                "is_bars": {k: s[f.is_start:f.is_end] for k, s in annotated.items()},
+                "oos_bars": {k: s[f.oos_start:f.oos_end] for k, s in annotated.items()},
+                "metric": self.metric,
+                "min_trades": self.min_trades,
+                "point_value": self.point_value,
+            })
+        return jobs
+
+    def run(self, bars) -> Dict[str, Any]:
+        bars = BarSeries.from_records(bars)
+        if not len(bars):
+            return {"error": "Sem dados para walk-forward."}
+        self.folds = make_folds(len(bars), self.n_folds, self.is_ratio, self.anchored)
+        jobs = self._jobs(bars)
+
+        if self.max_workers == 1 or len(jobs) == 1:
+            results = [_optimize_fold(j) for j in jobs]
+        else:
+            try:
+                with ProcessPoolExecutor(max_workers=self.max_workers) as ex:
+                    results = list(ex.map(_optimize_fold, jobs))
+            except Exception as e:
+                log.warning(f"Pool de processos falhou ({e}); rodando folds em série.")
+                results = [_optimize_fold(j) for j in jobs]
+
+        ts = bars.ts
+        self.fold_results, self.oos_trades = [], []
+        for f, r in zip(self.folds, results):
+            oos_m = compute_metrics(pd.DataFrame(r["oos_trades"])) if r["oos_trades"] else dict(EMPTY_METRICS)
+            self.fold_results.append({
+                "fold": f.index,
+                "is_from": int(ts[f.is_start]), "is_to": int(ts[f.is_end - 1]),
+                "oos_from": int(ts[f.oos_start]), "oos_to": int(ts[f.oos_end - 1]),
+                "best_params": r["best_params"],
+                "is_metrics": r.get("is_metrics", {}),
+                "oos_metrics": oos_m,
+                "is_rows": r["is_rows"],
+            })
+            for t in r["oos_trades"]:
+                tt = dict(t)
+                tt["fold"] = f.index
+                self.oos_trades.append(tt)
+
+        if not self.oos_trades:
+            self.summary = {"folds": len(self.folds), "trades": 0, "pnl": 0.0}
+            return self.summary
+
+        # costura: cada fold roda com o capital inicial; a curva OOS soma os PnLs em ordem
+        df = pd.DataFrame(self.oos_trades)
+        df["pnl"] = pd.to_numeric(df["pnl"], errors="coerce").fillna(0.0)
+        df["equity"] = float(self.base_cfg.initial_balance) + df["pnl"].cumsum()
+        for t, eq in zip(self.oos_trades, df["equity"].tolist()):
+            t["equity"] = float(eq)
+        self.equity_curve = df[["exit_time", "equity"]]
+
+        self.summary = {
+            "folds": len(self.folds),
+            "mode": "anchored" if self.anchored else "rolling",
+            "metric": self.metric,
+            "oos": compute_metrics(df),
+            "per_fold": [{"fold": r["fold"], "best_params": r["best_params"],
+                          "is_" + self.metric: r["is_metrics"].get(self.metric),
+                          "oos_net_pnl": r["oos_metrics"].get("net_pnl"),
+                          "oos_trades": r["oos_metrics"].get("trades", 0)} for r in self.fold_results],
+        }
+        return self.summary
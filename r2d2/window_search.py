@@ -0,0 +1,146 @@
+# r2d2/window_search.py
+from __future__ import annotations
+from typing import Dict, List, Any, Optional
+from copy import deepcopy
+
+import numpy as np
+import pandas as pd
+
+from r2d2.backtester import Backtester
+from r2d2.exchange_api import OfflineExchange
+from r2d2.indicator_cache import IndicatorCache
+from r2d2.metrics import compute_metrics, EMPTY_METRICS
+from r2d2.strategy_manager import StrategyManager
+from r2d2.vector_backtester import VectorBacktester, WEEKDAYS
+
+
+class WindowSearch:
+    """
+    Sugestão de janelas (horas UTC × dias da semana) para ENTRADAS a partir de
+    UM backtest baseline sem filtro de tempo.
+
+    1) baseline: trades atribuídas à célula (dia, hora) da ENTRADA — é onde o
+       filtro de tempo atua;
+    2) candidatos: prefixos do ranking de horas × prefixos do ranking de dias;
+       cada máscara é um vetor de 168 células e o PnL estimado de todas sai de
+       um único produto matriz × vetor;
+    3) só as top_k máscaras passam por backtest de verdade (numa passada do
+       VectorBacktester quando a estratégia permite), porque filtrar entradas
+       muda o caminho das trades seguintes.
+    """
+
+    def __init__(self, cfg, bars, point_value: float = 1.0, cache: Optional[IndicatorCache] = None):
+        self.cfg = deepcopy(cfg)
+        self.cfg.strat_params.allowed_hours = []
+        self.cfg.strat_params.allowed_weekdays = []
+        self.point_value = float(point_value)
+        self.cache = cache or IndicatorCache.for_bars(bars)
+        self.baseline_trades: List[dict] = []
+        self.cells: Optional[pd.DataFrame] = None
+
+    def _bars(self):
+        if self.cfg.strategy == "trend_following":
+            return self.cache.annotate(self.cfg.strat_params.__dict__)
+        return self.cache.bars
+
+    def _backtest(self, hours: List[int], days: List[str]) -> List[dict]:
+        cfg = deepcopy(self.cfg)
+        cfg.strat_params.allowed_hours = list(hours)
+        cfg.strat_params.allowed_weekdays = list(days)
+        sm = StrategyManager(cfg.strategy, params=cfg.strat_params.__dict__)
+        bt = Backtester(cfg, sm.get(), OfflineExchange(self.point_value), persist=False)
+        bt.run(self._bars())
+        return bt.trades_log
+
+    def baseline(self) -> pd.DataFrame:
+        """Roda o baseline e monta a grade 7×24 (count/sum) por célula de entrada."""
+        self.baseline_trades = self._backtest([], [])
+        df = pd.DataFrame(self.baseline_trades)
+        count = np.zeros(7 * 24)
+        total = np.zeros(7 * 24)
+        if not df.empty and "entry_time" in df.columns:
+            et = pd.to_datetime(df["entry_time"], errors="coerce")
+            ok = et.notna().to_numpy()
+            cell = (et.dt.dayofweek.to_numpy()[ok] * 24 + et.dt.hour.to_numpy()[ok]).astype(np.int64)
+            pnl = pd.to_numeric(df["pnl"], errors="coerce").fillna(0.0).to_numpy()[ok]
+            count = np.bincount(cell, minlength=168).astype(float)
+            total = np.bincount(cell, weights=pnl, minlength=168)
+        self.cells = pd.DataFrame({"dow": np.repeat(np.arange(7), 24), "hour": np.tile(np.arange(24), 7),
+                                   "count": count, "sum": total})
+        return self.cells
+
+    @staticmethod
+    def _ranked(count: np.ndarray, total: np.ndarray, min_trades: int, top: int) -> List[int]:
+        mean = np.divide(total, count, out=np.full_like(total, -np.inf), where=count > 0)
+        eligible = np.flatnonzero(count >= max(1, min_trades))
+        order = eligible[np.argsort(-mean[eligible], kind="stable")]
+        return order[:max(0, int(top))].tolist()
+
+    def candidates(self, top_hours: int = 6, min_trades_hour: int = 50,
+                   top_days: int = 2, min_trades_day: int = 100, min_trades: int = 0) -> pd.DataFrame:
+        """
+        Todas as máscaras candidatas com PnL/trades estimados pelo baseline.
+        Vazio quando não há o que sugerir: baseline sem trades, ou nenhuma
+        hora/dia com trades suficientes (só sobraria a máscara "todas").
+        """
+        if self.cells is None:
+            self.baseline()
+        count = self.cells["count"].to_numpy().reshape(7, 24)
+        total = self.cells["sum"].to_numpy().reshape(7, 24)
+        hours_rank = self._ranked(count.sum(0), total.sum(0), min_trades_hour, top_hours)
+        days_rank = self._ranked(count.sum(1), total.sum(1), min_trades_day, top_days)
+        if not hours_rank and not days_rank:
+            return pd.DataFrame(columns=["allowed_hours", "allowed_weekdays", "est_pnl", "est_trades",
+                                         "est_expectancy"])
+
+        # prefixos dos rankings (+ "todas" = sem filtro naquele eixo)
+        hour_sets = [list(range(24))] + [sorted(hours_rank[:k]) for k in range(1, len(hours_rank) + 1)]
+        day_sets = [list(range(7))] + [sorted(days_rank[:k]) for k in range(1, len(days_rank) + 1)]
+        masks, meta = [], []
+        for hs in hour_sets:
+            for ds in day_sets:
+                m = np.zeros((7, 24), dtype=bool)
+                m[np.ix_(ds, hs)] = True
+                masks.append(m.ravel())
+                meta.append((hs, ds))
+        M = np.vstack(masks).astype(np.float64)          # (máscaras × 168)
+        est_pnl = M @ total.ravel()
+        est_trades = M @ count.ravel()
+
+        df = pd.DataFrame({
+            "allowed_hours": [[] if len(hs) == 24 else hs for hs, _ in meta],
+            "allowed_weekdays": [[] if len(ds) == 7 else [WEEKDAYS[d] for d in ds] for _, ds in meta],
+            "est_pnl": est_pnl,
+            "est_trades": est_trades.astype(int),
+        })
+        df["est_expectancy"] = np.divide(est_pnl, est_trades, out=np.zeros_like(est_pnl), where=est_trades > 0)
+        df = df[df["est_trades"] >= int(min_trades)]
+        return df.sort_values(["est_pnl", "est_trades"], ascending=[False, False]).reset_index(drop=True)
+
+    def validate(self, cands: pd.DataFrame, top_k: int = 5) -> pd.DataFrame:
+        """Backtest real das top_k máscaras; devolve a tabela com as métricas validadas."""
+        top = cands.head(int(top_k)).reset_index(drop=True)
+        if top.empty:
+            return top
+        masks = top[["allowed_hours", "allowed_weekdays"]].to_dict("records")
+        if self.cfg.strategy == "trend_following":
+            res = VectorBacktester(self.cfg, point_value=self.point_value).run(self.cache.bars, masks, self.cache)
+            res = res.drop(columns=["allowed_hours", "allowed_weekdays"])
+        else:
+            rows = []
+            for m in masks:
+                trades = self._backtest(m["allowed_hours"], m["allowed_weekdays"])
+                rows.append(compute_metrics(pd.DataFrame(trades)) if trades else dict(EMPTY_METRICS))
+            res = pd.DataFrame(rows)
+        out = pd.concat([top, res], axis=1)
+        return out.sort_values(["net_pnl"], ascending=False).reset_index(drop=True)
+
+    def suggest(self, top_k: int = 5, **kwargs) -> Dict[str, Any]:
+        """Atalho: baseline → candidatos → validação; devolve a melhor janela validada."""
+        cands = self.candidates(**kwargs)
+        validated = self.validate(cands, top_k=top_k)
+        if validated.empty:
+            return {"allowed_hours": [], "allowed_weekdays": [], "table": validated, "candidates": len(cands)}
+        best = validated.iloc[0]
+        return {"allowed_hours": list(best["allowed_hours"]), "allowed_weekdays": list(best["allowed_weekdays"]),
+                "table": validated, "candidates": len(cands)}
@@ -0,0 +1,200 @@
+# tests/fake_bybit.py
+"""
+Dublês locais da Bybit para os testes (sem rede):
+
+- FakeKlineWS: WebSocket público v5 (aiohttp) que roda um roteiro por
+  conexão — BybitKlineMux/BybitKlineStream apontam para ele via `url=`;
+- FakeRest: o pedaço do BybitRest que o backfill usa (kline, map);
+- FakeKlineServer: HTTP /v5/market/kline com 429 e timeouts injetados;
+  `exchange()` devolve um ccxt.async_support.bybit apontado para ele
+  (mercado pré-carregado, sem load_markets) para o AsyncDownloader.
+"""
+from __future__ import annotations
+from contextlib import asynccontextmanager
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Optional, Set, Union
+import asyncio
+import json
+
+from aiohttp import web
+
+T0 = 1756684800000          # 2025-09-01 00:00 UTC
+TF_MS = 60_000
+SYMBOL = "BTC/USDT:USDT"
+TOPIC = "kline.1.BTCUSDT"
+
+
+def bar_values(i: int) -> Dict[str, float]:
+    """Candle determinístico número i (ts = T0 + i minutos)."""
+    return {"open": 100.0 + i, "high": 102.0 + i, "low": 99.0 + i, "close": 101.0 + i, "volume": 5.0}
+
+
+def ws_kline(i: int, confirm: bool = True) -> Dict[str, Any]:
+    v = bar_values(i)
+    return {"start": T0 + i * TF_MS, "end": T0 + (i + 1) * TF_MS - 1, "interval": "1",
+            "open": str(v["open"]), "close": str(v["close"]), "high": str(v["high"]), "low": str(v["low"]),
+            "volume": str(v["volume"]), "confirm": confirm}
+
+
+@asynccontextmanager
+async def serve(app: web.Application):
+    """Sobe o app numa porta livre de 127.0.0.1 e rende a URL base."""
+    runner = web.AppRunner(app, shutdown_timeout=0.1)  # handlers ociosos (dublê mudo) não seguram o teardown
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    try:
+        yield f"http://127.0.0.1:{port}"
+    finally:
+        await runner.cleanup()
+
+
+# ---------- WebSocket de klines ----------
+class WSConn:
+    """Uma conexão aceita pelo FakeKlineWS (o roteiro recebe isto)."""
+
+    def __init__(self, ws: web.WebSocketResponse, index: int, topics: List[str]):
+        self.ws = ws
+        self.index = index
+        self.topics = topics
+        self.pings = 0
+
+    async def kline(self, i: int, confirm: bool = True, topic: str = TOPIC):
+        await self.ws.send_str(json.dumps({"topic": topic, "data": [ws_kline(i, confirm)]}))
+
+
+Script = Callable[[WSConn], Awaitable[None]]
+
+
+class FakeKlineWS:
+    """
+    Roteiro por conexão: a conexão n roda scripts[n] (a última se repete).
+    Quando o roteiro termina o servidor fecha o socket; um roteiro que só
+    dorme simula uma conexão muda. Responde {"op": "ping"} com pong, salvo
+    com answer_pings=False.
+    """
+
+    def __init__(self, scripts: List[Script], answer_pings: bool = True):
+        self.scripts = scripts
+        self.answer_pings = answer_pings
+        self.conns: List[WSConn] = []
+
+    async def _handler(self, req: web.Request):
+        ws = web.WebSocketResponse()
+        await ws.prepare(req)
+        sub = json.loads((await ws.receive()).data)
+        conn = WSConn(ws, len(self.conns), list(sub.get("args", [])))
+        self.conns.append(conn)
+        await ws.send_str(json.dumps({"success": True, "op": "subscribe"}))
+
+        async def reader():
+            async for msg in ws:
+                body = json.loads(msg.data)
+                if body.get("op") == "ping":
+                    conn.pings += 1
+                    if self.answer_pings:
+                        await ws.send_str(json.dumps({"op": "pong"}))
+
+        rt = asyncio.create_task(reader())
+        try:
+            await self.scripts[min(conn.index, len(self.scripts) - 1)](conn)
+        finally:
+            rt.cancel()
+            await ws.close()
+        return ws
+
+    def app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_get("/v5/public/linear", self._handler)
+        return app
+
+
+class FakeRest:
+    """kline() servindo os candles de `available` (índices i); map() sequencial."""
+
+    def __init__(self, available: Iterable[int] = ()):
+        self.available: Set[int] = set(available)
+        self.calls: List[tuple] = []
+
+    def map(self, fn, items, max_workers=None):
+        return [fn(x) for x in items]
+
+    def kline(self, symbol, start, end, interval="1", category="linear", limit=1000):
+        self.calls.append((symbol, start, end))
+        rows = []
+        for i in sorted(self.available):
+            ts = T0 + i * TF_MS
+            if start <= ts <= end:
+                v = bar_values(i)
+                rows.append([str(ts), str(v["open"]), str(v["high"]), str(v["low"]), str(v["close"]),
+                             str(v["volume"]), "0"])
+        return rows[:limit]
+
+
+# ---------- HTTP /v5/market/kline ----------
+class FakeKlineServer:
+    """
+    /v5/market/kline no formato v5 (lista do mais novo para o mais antigo),
+    candles contínuos de 1m a partir de T0. `faults` mapeia o start pedido
+    para uma fila de falhas a servir antes da resposta boa: "429" (HTTP 429)
+    ou "timeout" (segura a resposta além do timeout do cliente). `overlap`
+    candles extras no fim de cada página simulam bordas sobrepostas.
+    `delay`: segundos por resposta, ou função start -> segundos.
+    """
+
+    def __init__(self, faults: Optional[Dict[int, List[str]]] = None, overlap: int = 0,
+                 delay: Union[float, Callable[[int], float]] = 0.0, hang: float = 2.0):
+        self.faults = {k: list(v) for k, v in (faults or {}).items()}
+        self.overlap = int(overlap)
+        self.delay = delay
+        self.hang = float(hang)
+        self.requests: List[Dict[str, Any]] = []
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.url: Optional[str] = None
+
+    async def _kline(self, req: web.Request):
+        q = req.query
+        start, limit = int(q["start"]), int(q.get("limit", 200))
+        fault = self.faults.get(start, []).pop(0) if self.faults.get(start) else None
+        self.requests.append({"start": start, "limit": limit, "fault": fault})
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            if fault == "429":
+                return web.Response(status=429, text="Too Many Requests")
+            if fault == "timeout":
+                await asyncio.sleep(self.hang)
+            await asyncio.sleep(self.delay(start) if callable(self.delay) else self.delay)
+            first = -(-(start - T0) // TF_MS)
+            rows = []
+            for i in range(first, first + limit + self.overlap):
+                v = bar_values(i)
+                rows.append([str(T0 + i * TF_MS), str(v["open"]), str(v["high"]), str(v["low"]),
+                             str(v["close"]), str(v["volume"]), "0"])
+            rows.reverse()
+            return web.json_response({"retCode": 0, "retMsg": "OK", "result": {
+                "category": "linear", "symbol": q["symbol"], "list": rows}, "retExtInfo": {}, "time": 0})
+        finally:
+            self.in_flight -= 1
+
+    def app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_get("/v5/market/kline", self._kline)
+        return app
+
+    def exchange(self, timeout_ms: int = 500):
+        """ccxt async bybit falando com este servidor (mercado BTC/USDT:USDT já carregado)."""
+        import ccxt.async_support as ccxt_async
+
+        ex = ccxt_async.bybit({"enableRateLimit": False, "timeout": timeout_ms,
+                               "options": {"defaultType": "linear"}})
+        ex.urls["api"] = {k: self.url for k in ex.urls["api"]}
+        ex.set_markets([{
+            "id": "BTCUSDT", "symbol": SYMBOL, "base": "BTC", "quote": "USDT", "settle": "USDT",
+            "baseId": "BTC", "quoteId": "USDT", "settleId": "USDT", "type": "swap", "spot": False,
+            "margin": False, "swap": True, "future": False, "option": False, "active": True,
+            "contract": True, "linear": True, "inverse": False, "contractSize": 1.0,
+            "precision": {"amount": 0.001, "price": 0.1}, "limits": {}, "info": {"category": "linear"},
+        }])
+        return ex
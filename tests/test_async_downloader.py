@@ -0,0 +1,72 @@
+# tests/test_async_downloader.py
+import asyncio
+import time
+
+import ccxt
+import numpy as np
+import pytest
+
+from r2d2.async_downloader import AsyncDownloader, make_windows
+from r2d2.utils.rate_limit import AsyncTokenBucket
+from tests.fake_bybit import SYMBOL, T0, TF_MS, FakeKlineServer, bar_values, serve
+
+
+def _download(srv: FakeKlineServer, since: int, until: int, **kwargs):
+    async def main():
+        async with serve(srv.app()) as url:
+            srv.url = url
+            ex = srv.exchange()
+            try:
+                async with AsyncDownloader(exchange=ex, **kwargs) as dl:
+                    return await dl.fetch(SYMBOL, "1m", since, until)
+            finally:
+                await ex.close()
+    return asyncio.run(main())
+
+
+def _assert_complete(bars, n):
+    assert len(bars) == n
+    assert np.array_equal(bars.ts, T0 + np.arange(n) * TF_MS)
+    assert np.array_equal(bars.col("close"), [bar_values(i)["close"] for i in range(n)])
+
+
+def test_make_windows():
+    assert make_windows(0, 2500, 1, limit=1000) == [(0, 1000), (1000, 2000), (2000, 2500)]
+    assert make_windows(0, 1000, 1, limit=1000) == [(0, 1000)]
+    assert make_windows(5, 5, 1) == []
+
+
+def test_windows_ordered_and_deduplicated():
+    # janelas posteriores respondem primeiro e cada página sobrepõe a seguinte
+    srv = FakeKlineServer(overlap=5, delay=lambda start: 0.2 - 0.04 * ((start - T0) // (1000 * TF_MS)))
+    bars = _download(srv, T0, T0 + 4200 * TF_MS, backoff=0.01)
+    _assert_complete(bars, 4200)
+    assert sorted(r["start"] for r in srv.requests) == [T0 + k * 1000 * TF_MS for k in range(5)]
+
+
+def test_concurrency_is_bounded():
+    srv = FakeKlineServer(delay=0.05)
+    _download(srv, T0, T0 + 10_000 * TF_MS, concurrency=3)
+    assert srv.max_in_flight <= 3
+    assert len(srv.requests) == 10
+
+
+def test_retries_429_and_timeout_with_backoff():
+    w1 = T0 + 1000 * TF_MS
+    srv = FakeKlineServer(faults={T0: ["429", "429"], w1: ["timeout"]}, hang=1.0)
+    t0 = time.monotonic()
+    bars = _download(srv, T0, T0 + 3000 * TF_MS, backoff=0.1,
+                     limiter=AsyncTokenBucket(rate=1000, capacity=100))
+    elapsed = time.monotonic() - t0
+    _assert_complete(bars, 3000)
+    assert [r["fault"] for r in srv.requests if r["start"] == T0] == ["429", "429", None]
+    assert [r["fault"] for r in srv.requests if r["start"] == w1] == ["timeout", None]
+    # backoff exponencial: pelo menos 0.1 + 0.2 s antes da 3ª tentativa da 1ª janela
+    assert elapsed >= 0.3
+
+
+def test_gives_up_after_retries():
+    srv = FakeKlineServer(faults={T0: ["429"] * 10})
+    with pytest.raises(ccxt.RateLimitExceeded):
+        _download(srv, T0, T0 + 1000 * TF_MS, retries=2, backoff=0.01)
+    assert len(srv.requests) == 3
@@ -0,0 +1,50 @@
+# tests/test_bar_file.py
+import os
+import pickle
+
+import numpy as np
+import pytest
+
+from r2d2.bar_file import MappedColumn, StaleBarFile, open_bar_file, write_bar_file
+from r2d2.bars import BarSeries
+from r2d2.data_store import OHLCVStore
+from tests.fake_bybit import T0, TF_MS, bar_values
+
+
+def _bars(first: int, n: int) -> BarSeries:
+    rows = [{"ts": T0 + i * TF_MS, **bar_values(i)} for i in range(first, first + n)]
+    return BarSeries.from_records(rows)
+
+
+def _same(a: BarSeries, b: BarSeries):
+    assert len(a) == len(b)
+    for c in ("ts", "open", "high", "low", "close", "volume"):
+        assert np.array_equal(np.asarray(a.col(c)), np.asarray(b.col(c))), c
+
+
+def test_referencia_sobrevive_a_poda_de_versoes(tmp_path):
+    # o que o st.cache_data (sem ttl) faz: guarda o pickle e o desfaz bem depois
+    store = OHLCVStore(str(tmp_path))
+    store.write("bybit", "BTC", "1m", _bars(0, 500))
+    m = store.mapped("bybit", "BTC", "1m", T0 + 100 * TF_MS, T0 + 300 * TF_MS)
+    assert isinstance(m.__getstate__()["columns"]["close"], MappedColumn)
+    blob = pickle.dumps(m)
+    first = m.meta["bar_file"]
+
+    for k in range(1, 4):  # 3 gravações = 3 versões novas; a primeira é podada
+        store.write("bybit", "BTC", "1m", _bars(500 * k, 500))
+        store.mapped("bybit", "BTC", "1m")
+    assert not os.path.exists(first)
+
+    u = pickle.loads(blob)
+    _same(u, _bars(100, 200))
+    assert u.meta["bar_file"] != first and os.path.exists(u.meta["bar_file"])
+
+
+def test_arquivo_regerado_no_lugar_nao_tem_versao_para_cair(tmp_path):
+    p = str(tmp_path / "a.bars")
+    write_bar_file(p, _bars(0, 100))
+    blob = pickle.dumps(open_bar_file(p))
+    os.replace(write_bar_file(str(tmp_path / "b.bars"), _bars(50, 100)), p)
+    with pytest.raises(StaleBarFile):
+        pickle.loads(blob)
@@ -0,0 +1,59 @@
+# tests/test_data_store.py
+import numpy as np
+
+from r2d2.bars import BarSeries
+from r2d2.data_store import OHLCVStore
+from tests.fake_bybit import T0, TF_MS
+from tests.test_vector_backtester import synth_bars
+
+DAY = 86_400_000
+COLUMNS = ("ts", "open", "high", "low", "close", "volume")
+
+
+def _same(a: BarSeries, b: BarSeries):
+    assert len(a) == len(b)
+    for c in COLUMNS:
+        assert np.array_equal(np.asarray(a.col(c)), np.asarray(b.col(c))), c
+
+
+def _ticked(n: int, first: int = 0) -> BarSeries:
+    # preços em tick de 0.1 e volume em lotes de 0.001, como a Bybit manda
+    b = synth_bars(n=n + first, seed=2)[first:]
+    return BarSeries({"ts": np.asarray(b.ts), **{c: np.round(np.asarray(b.col(c)), 1) for c in COLUMNS[1:5]},
+                      "volume": np.round(np.asarray(b.col("close")) % 7, 3)})
+
+
+def test_archive_ida_e_volta(tmp_path):
+    store = OHLCVStore(str(tmp_path))
+    n = 45 * 1440  # set -> meados de out: dois arquivos mensais
+    store.write("bybit", "BTC", "1m", _ticked(n))
+    parquet = store.read("bybit", "BTC", "1m")
+    window = (T0 + 20 * DAY, T0 + 40 * DAY)
+    parquet_window = store.read("bybit", "BTC", "1m", *window)
+
+    info = store.archive("bybit", "BTC", "1m")
+    assert info["rows"] == n and info["path"] == store.archive_path("bybit", "BTC", "1m")
+
+    cold = store.read("bybit", "BTC", "1m")
+    assert cold.meta.get("source_file", "").endswith("series.r2c")  # leitura saiu do .r2c
+    _same(cold, parquet)
+    _same(store.read("bybit", "BTC", "1m", *window), parquet_window)
+    _same(store.mapped("bybit", "BTC", "1m", *window), parquet_window)
+
+
+def test_archive_sem_tick_fixo_e_sem_perda(tmp_path):
+    store = OHLCVStore(str(tmp_path))
+    bars = synth_bars(n=5000, seed=4)  # floats quaisquer: o bloco cai para float cru
+    store.write("bybit", "ETH", "1m", bars)
+    store.archive("bybit", "ETH", "1m")
+    _same(store.read("bybit", "ETH", "1m"), bars)
+
+
+def test_gravacao_depois_do_archive_volta_para_o_parquet(tmp_path):
+    store = OHLCVStore(str(tmp_path))
+    store.write("bybit", "BTC", "1m", _ticked(3000))
+    store.archive("bybit", "BTC", "1m")
+    store.write("bybit", "BTC", "1m", _ticked(500, first=3000))
+    fresh = store.read("bybit", "BTC", "1m")
+    assert "source_file" not in fresh.meta
+    assert len(fresh) == 3500 and int(fresh.ts[-1]) == T0 + 3499 * TF_MS
@@ -0,0 +1,122 @@
+# tests/test_journal.py
+import json
+import math
+import os
+
+from postgrest.exceptions import APIError
+
+from r2d2.journal import is_permanent_error
+from r2d2.supabase_store import SupabaseStore
+
+
+class FakeClient:
+    """
+    client.table(t).upsert(rows).execute() em memória. `deny` (código HTTP)
+    recusa todo upsert; snapshot com x=NaN é rejeitado como 22P02 e, com
+    `missing_column`, a tabela inteira recusa (42703).
+    """
+
+    def __init__(self):
+        self.db = {}
+        self.calls = 0
+        self.deny = None
+        self.missing_column = False
+
+    def table(self, name):
+        return _Table(self)
+
+
+class _Table:
+    def __init__(self, c):
+        self.c = c
+
+    def upsert(self, rows, on_conflict="", ignore_duplicates=False):
+        self.rows, self.key = rows, on_conflict
+        return self
+
+    def execute(self):
+        self.c.calls += 1
+        if self.c.deny:
+            raise APIError({"message": "denied", "code": self.c.deny})
+        if self.c.missing_column:
+            raise APIError({"message": "column \"snapshot\" does not exist", "code": "42703"})
+        for r in self.rows:
+            if math.isnan(r["snapshot"]["x"]):
+                raise APIError({"message": "invalid input syntax for type json", "code": "22P02"})
+        for r in self.rows:
+            self.c.db.setdefault(r[self.key], r)
+
+
+def _store():
+    sb = SupabaseStore.__new__(SupabaseStore)
+    sb.enabled, sb.client, sb.writer = True, FakeClient(), None
+    return sb
+
+
+def _dead(root):
+    path = os.path.join(root, "dead-letter.jsonl")
+    if not os.path.exists(path):
+        return []
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f]
+
+
+def test_classificacao_de_erros():
+    code = lambda c: APIError({"message": "x", "code": c})
+    assert is_permanent_error(code("400")) and is_permanent_error(code("22P02"))
+    assert is_permanent_error(code("PGRST204")) and is_permanent_error(ValueError("nan"))
+    # credencial/JWT, limite, rede e servidor: o lote espera e volta
+    for c in ("401", "403", "408", "429", "502", "PGRST301", "08006"):
+        assert not is_permanent_error(code(c)), c
+    assert not is_permanent_error(ConnectionError("reset"))
+
+
+def test_registro_ruim_vai_para_o_dead_letter(tmp_path):
+    sb = _store()
+    w = sb.start_writer(journal=True, root=str(tmp_path), interval=0.05, fsync_interval=0.05, batch_rows=64)
+    try:
+        for i in range(200):
+            sb.log_snapshot({"x": float("nan") if i in (7, 150) else float(i)})
+        assert w.flush(10)
+    finally:
+        sb.close_writer()
+    assert len(sb.client.db) == 198
+    dead = _dead(tmp_path)
+    assert len(dead) == 2 and all(math.isnan(d["r"]["snapshot"]["x"]) for d in dead)
+    assert w.stats["dead"] == 2 and w.stats["uploaded"] == 198
+
+
+def test_chave_recusada_nao_descarta_nada(tmp_path):
+    # 401 em tudo: nada vai para o dead-letter, o diário guarda e envia quando a chave volta
+    sb = _store()
+    sb.client.deny = "401"
+    w = sb.start_writer(journal=True, root=str(tmp_path), interval=0.02, fsync_interval=0.02, batch_rows=64)
+    try:
+        for i in range(100):
+            sb.log_snapshot({"x": float(i)})
+        assert not w.flush(0.5)
+        assert sb.client.db == {} and _dead(tmp_path) == []
+        sb.client.deny = None
+        w.uploader._wake.set()
+        assert w.flush(10)
+    finally:
+        sb.close_writer()
+    assert len(sb.client.db) == 100 and w.stats["dead"] == 0
+
+
+def test_tabela_que_recusa_tudo_fica_no_diario(tmp_path):
+    # rejeição "permanente" de todas as linhas (coluna que não existe): é a tabela, não a linha
+    sb = _store()
+    sb.client.missing_column = True
+    w = sb.start_writer(journal=True, root=str(tmp_path), interval=0.02, fsync_interval=0.02, batch_rows=64)
+    try:
+        for i in range(100):
+            sb.log_snapshot({"x": float(i)})
+        assert not w.flush(0.5)
+        assert _dead(tmp_path) == [] and w.stats["dead"] == 0 and w.stats["errors"] >= 1
+        sb.client.missing_column = False
+        w.uploader._wake.set()
+        assert w.flush(10)
+    finally:
+        sb.close_writer()
+    assert len(sb.client.db) == 100
@@ -0,0 +1,98 @@
+# tests/test_kline_stream.py
+import asyncio
+import time
+
+from r2d2.kline_stream import BybitKlineStream
+from tests.fake_bybit import SYMBOL, T0, TF_MS, FakeKlineWS, FakeRest, bar_values, serve
+
+
+def _collect(ws: FakeKlineWS, n: int, rest: FakeRest = None, timeout: float = 10.0, **kwargs):
+    """Os n primeiros candles do BybitKlineStream ligado ao dublê: (índices, candles, stream)."""
+    kwargs = {"ping_interval": 0.2, "stale_after": 1.0, "reconnect_delay": 0.05, **kwargs}
+
+    async def main():
+        async with serve(ws.app()) as url:
+            stream = BybitKlineStream(SYMBOL, "1m", url=f"{url}/v5/public/linear", rest=rest or FakeRest(), **kwargs)
+            got = []
+
+            async def consume():
+                async for bar in stream.bars():
+                    got.append(bar)
+                    if len(got) >= n:
+                        return
+
+            await asyncio.wait_for(consume(), timeout)
+            return got, stream
+
+    got, stream = asyncio.run(main())
+    return [(b["ts"] - T0) // TF_MS for b in got], got, stream
+
+
+async def _idle(conn):
+    await asyncio.sleep(30)
+
+
+def test_only_confirmed_klines_are_delivered():
+    async def script(conn):
+        await conn.kline(0, confirm=False)
+        await conn.kline(0)
+        await conn.kline(1, confirm=False)
+        await conn.kline(1, confirm=False)
+        await conn.kline(1)
+        await _idle(conn)
+
+    ws = FakeKlineWS([script])
+    idx, bars, _ = _collect(ws, 2)
+    assert idx == [0, 1]
+    assert bars[1] == {"ts": T0 + TF_MS, **bar_values(1)}
+    assert ws.conns[0].topics == ["kline.1.BTCUSDT"]
+
+
+def test_dedup_after_reconnect():
+    async def first(conn):
+        for i in range(3):
+            await conn.kline(i)
+        # fecha: o cliente reconecta
+
+    async def second(conn):
+        for i in (1, 2, 2, 3, 4):  # reenvio do que já foi entregue
+            await conn.kline(i)
+        await _idle(conn)
+
+    ws = FakeKlineWS([first, second])
+    idx, _, stream = _collect(ws, 5)
+    assert idx == [0, 1, 2, 3, 4]
+    assert stream.reconnects == 1
+    assert len(ws.conns) == 2
+
+
+def test_rest_backfill_of_in_stream_gap():
+    async def script(conn):
+        for i in (0, 1, 4, 5):  # 2 e 3 nunca chegam pelo WebSocket
+            await conn.kline(i)
+        await _idle(conn)
+
+    rest = FakeRest(available=[2, 3])
+    idx, bars, stream = _collect(FakeKlineWS([script]), 6, rest=rest)
+    assert idx == [0, 1, 2, 3, 4, 5]
+    assert bars[2] == {"ts": T0 + 2 * TF_MS, **bar_values(2)}
+    assert stream.backfilled == 2
+    assert rest.calls == [("BTCUSDT", T0 + 2 * TF_MS, T0 + 4 * TF_MS - 1)]
+
+
+def test_stale_connection_reconnects():
+    async def mute(conn):
+        await conn.kline(0)
+        await _idle(conn)  # conexão aberta, mas nada mais chega (nem pong de aplicação)
+
+    async def alive(conn):
+        await conn.kline(1)
+        await _idle(conn)
+
+    ws = FakeKlineWS([mute, alive], answer_pings=False)
+    t0 = time.monotonic()
+    idx, _, stream = _collect(ws, 2, stale_after=0.6)
+    assert idx == [0, 1]
+    assert stream.reconnects == 1
+    assert ws.conns[0].pings >= 1  # o cliente mandou {"op": "ping"} enquanto esperava
+    assert time.monotonic() - t0 < 5
@@ -0,0 +1,31 @@
+# tests/test_trade_bars.py
+import os
+
+import numpy as np
+import pytest
+
+from r2d2.trade_bars import MAX_FILL, load_trade_bars, read_trades, replay_bars
+
+# 600 trades gravados pelo TradeRecorder, com um buraco de 2h (> MAX_FILL barras de 1s) e um de 40s
+TRADES = os.path.join(os.path.dirname(__file__), "data", "bybit_trades_btcusdt.csv")
+COLUMNS = ("ts", "open", "high", "low", "close", "volume", "turnover", "trades")
+
+
+@pytest.mark.parametrize("spec", ["1s", "5s", "1m", "tick:7", "vol:1.5", "dollar:50000"])
+@pytest.mark.parametrize("batch", [1, 64, 1000])
+def test_replay_ao_vivo_igual_ao_lote(spec, batch):
+    live = list(replay_bars(TRADES, spec, batch=batch))
+    bars = load_trade_bars(TRADES, spec)
+    assert len(live) == len(bars)
+    for c in COLUMNS:
+        assert np.allclose([b[c] for b in live], bars.col(c)), c
+
+
+def test_buraco_longo_respeita_max_fill():
+    ts, _, _ = read_trades(TRADES)
+    gap_s = int(np.diff(ts // 1000).max())
+    assert gap_s - 1 > MAX_FILL
+    bars = load_trade_bars(TRADES, "1s")
+    flats = np.diff(bars.ts // 1000) - 1
+    assert flats.max() == gap_s - 1 - MAX_FILL  # o que passa do teto vira um salto, não candles flat
+    assert np.all(bars.col("trades")[bars.col("volume") == 0] == 0)
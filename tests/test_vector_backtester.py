@@ -0,0 +1,68 @@
+# tests/test_vector_backtester.py
+from copy import deepcopy
+import itertools
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from r2d2.backtester import Backtester
+from r2d2.bars import BarSeries
+from r2d2.config import AppConfig
+from r2d2.exchange_api import OfflineExchange
+from r2d2.indicator_cache import IndicatorCache
+from r2d2.metrics import compute_metrics
+from r2d2.strategy_manager import StrategyManager
+from r2d2.vector_backtester import VectorBacktester
+from tests.fake_bybit import T0, TF_MS
+
+
+def synth_bars(n: int = 4000, seed: int = 1) -> BarSeries:
+    """Passeio aleatório de 1m com stops frequentes (o caso que separava os motores)."""
+    rng = np.random.default_rng(seed)
+    c = 30000 + np.cumsum(rng.normal(0, 15, n))
+    o = np.r_[c[0], c[:-1]]
+    return BarSeries({"ts": T0 + np.arange(n, dtype=np.int64) * TF_MS, "open": o,
+                      "high": np.maximum(o, c) + rng.random(n) * 10, "low": np.minimum(o, c) - rng.random(n) * 10,
+                      "close": c, "volume": np.ones(n)})
+
+
+PARAM_SETS = [
+    {"sl_atr_mult": sl, "tp_r_mult": tp, "bars_confirm_break": bcb, "min_atr_points": atr,
+     "filter_ema_slope": slope, "min_ema_slope_points": 1.0, "allowed_hours": hours, "allowed_weekdays": []}
+    for sl, tp, bcb, atr, slope, hours in itertools.islice(itertools.product(
+        [1.0, 3.0], [1.0, 2.0], [1, 2], [0.0, 8.0], [False, True], [[], [1, 2, 3, 10, 11]]), 0, None, 5)
+]
+
+
+def backtest(cfg, params, bars):
+    cfg = deepcopy(cfg)
+    sp = deepcopy(cfg.strat_params)
+    for k, v in params.items():
+        setattr(sp, k, v)
+    cfg.strat_params = sp
+    bt = Backtester(cfg, StrategyManager(cfg.strategy, params=sp.__dict__).get(), OfflineExchange(), persist=False)
+    bt.run(bars)
+    return compute_metrics(pd.DataFrame(bt.trades_log)) if bt.trades_log else {"trades": 0, "net_pnl": 0.0}
+
+
+@pytest.mark.parametrize("seed", [1, 7])
+def test_paridade_com_o_backtester_em_barras_cruas(seed):
+    # Backtester sem indicadores pré-calculados (EMA/ATR incrementais da estratégia)
+    # contra o motor vetorizado (IndicatorCache sobre a série inteira)
+    cfg = AppConfig()
+    bars = synth_bars(seed=seed)
+    df = VectorBacktester(cfg).run(bars, PARAM_SETS)
+    assert df["tp_hits"].fillna(0).sum() + df["sl_hits"].fillna(0).sum() > 0
+    for j, params in enumerate(PARAM_SETS):
+        m = backtest(cfg, params, bars)
+        assert int(df.loc[j, "trades"]) == m["trades"], params
+        assert df.loc[j, "net_pnl"] == pytest.approx(m["net_pnl"], abs=1e-3), params
+
+
+def test_indicadores_pre_calculados_iguais_aos_incrementais():
+    cfg = AppConfig()
+    bars = synth_bars(seed=3)
+    annotated = IndicatorCache.for_bars(bars).annotate(cfg.strat_params.__dict__)
+    for params in PARAM_SETS[:4]:
+        assert backtest(cfg, params, bars) == backtest(cfg, params, annotated)
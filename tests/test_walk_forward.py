@@ -0,0 +1,31 @@
+# tests/test_walk_forward.py
+import pytest
+
+from r2d2.config import AppConfig
+from r2d2.walk_forward import WalkForward, make_folds
+from tests.test_vector_backtester import backtest, synth_bars
+
+GRID = [{"sl_atr_mult": 1.0, "bars_confirm_break": 1},
+        {"sl_atr_mult": 3.0, "bars_confirm_break": 2},
+        {"ema_period": 30, "sl_atr_mult": 1.0, "bars_confirm_break": 1}]
+
+
+def test_folds_cobrem_a_serie():
+    folds = make_folds(1000, n_folds=4, is_ratio=0.75)
+    assert folds[0].is_start == 0 and folds[-1].oos_end == 1000
+    assert all(a.oos_end == b.oos_start for a, b in zip(folds, folds[1:]))
+
+
+def test_grid_in_sample_igual_ao_backtester_em_barras_cruas():
+    # folds ancorados começam na barra 0: o recorte dos indicadores pré-calculados
+    # tem que dar exatamente o backtest da estratégia incremental no mesmo trecho
+    cfg = AppConfig()
+    bars = synth_bars(n=3000, seed=5)
+    wf = WalkForward(cfg, GRID, n_folds=3, is_ratio=0.6, anchored=True, max_workers=1)
+    wf.run(bars)
+    assert sum(r["trades"] for f in wf.fold_results for r in f["is_rows"]) > 0
+    for f, res in zip(wf.folds, wf.fold_results):
+        for params, row in zip(GRID, res["is_rows"]):
+            m = backtest(cfg, params, bars[f.is_start:f.is_end])
+            assert row["trades"] == m["trades"], (f.index, params)
+            assert row["net_pnl"] == pytest.approx(m["net_pnl"], abs=1e-3), (f.index, params)
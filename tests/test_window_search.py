@@ -0,0 +1,33 @@
+# tests/test_window_search.py
+import numpy as np
+import pytest
+
+from r2d2.bars import BarSeries
+from r2d2.config import AppConfig
+from r2d2.window_search import WindowSearch
+from tests.fake_bybit import T0, TF_MS
+from tests.test_vector_backtester import backtest, synth_bars
+
+
+def test_validacao_igual_ao_backtester_em_barras_cruas():
+    cfg = AppConfig()
+    bars = synth_bars(n=6000, seed=11)
+    ws = WindowSearch(cfg, bars)
+    sugg = ws.suggest(top_k=3, top_hours=4, min_trades_hour=1, top_days=2, min_trades_day=1)
+    assert not sugg["table"].empty
+    for _, row in sugg["table"].iterrows():
+        m = backtest(ws.cfg, {"allowed_hours": row["allowed_hours"], "allowed_weekdays": row["allowed_weekdays"]},
+                     bars)
+        assert int(row["trades"]) == m["trades"]
+        assert row["net_pnl"] == pytest.approx(m["net_pnl"], abs=1e-3)
+
+
+def test_sem_trades_no_baseline_nao_sugere_nada():
+    # preço parado: nenhum rompimento, nenhuma trade -> a UI cai no aviso de fallback
+    n = 2000
+    flat = BarSeries({"ts": T0 + np.arange(n, dtype=np.int64) * TF_MS, "open": np.full(n, 100.0),
+                      "high": np.full(n, 100.0), "low": np.full(n, 100.0), "close": np.full(n, 100.0),
+                      "volume": np.ones(n)})
+    sugg = WindowSearch(AppConfig(), flat).suggest(top_k=5, min_trades_hour=1, min_trades_day=1)
+    assert sugg["table"].empty and sugg["candidates"] == 0
+    assert sugg["allowed_hours"] == [] and sugg["allowed_weekdays"] == []